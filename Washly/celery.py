@@ -23,5 +23,13 @@ app.conf.beat_schedule = {
         'task': 'notificaciones.tasks.verificar_alertas_stock',
         'schedule': crontab(hour=8, minute=0),  # Diario a las 8 AM
     },
+    'segmentar-clientes-rfm-nocturno': {
+        'task': 'tickets.tasks.segmentar_clientes_rfm',
+        'schedule': crontab(hour=3, minute=0),  # Diario a las 3 AM
+    },
+    'limpiar-claves-idempotencia': {
+        'task': 'pagos.tasks.limpiar_claves_idempotencia',
+        'schedule': crontab(hour=4, minute=0),  # Diario a las 4 AM
+    },
 }
 
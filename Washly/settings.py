@@ -94,6 +94,38 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# =============================================================================
+# CACHÉ — compartida entre workers (web, Celery)
+# Las invalidaciones (dashboard, tracking, idempotencia, suscripción) solo
+# llegan a todos los procesos si la caché es compartida:
+# Redis con REDIS_URL; sin él, la tabla de caché en la BD (la crea core/migrations/0002).
+# La memoria local (por proceso) queda solo para desarrollo con DEBUG=True.
+# =============================================================================
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'washly',
+        }
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'washly_cache',
+            'KEY_PREFIX': 'washly',
+        }
+    }
+
 # =============================================================================
 # INTERNACIONALIZACIÓN
 # =============================================================================
@@ -170,6 +202,7 @@ CORS_ALLOWED_ORIGINS = config(
 from corsheaders.defaults import default_headers
 CORS_ALLOW_HEADERS = list(default_headers) + [
     'x-current-sede-id',
+    'idempotency-key',
 ]
 
 # =============================================================================
@@ -177,7 +210,8 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 # =============================================================================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT de simplejwt que además precarga perfil, empresa y sede (core.tenant)
+        'core.authentication.TenantJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
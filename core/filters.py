@@ -0,0 +1,26 @@
+"""
+Filtros DRF compartidos
+"""
+
+import re
+
+from rest_framework import filters
+
+from core.utils import normalizar_texto_busqueda
+
+
+class BusquedaNormalizadaFilter(filters.SearchFilter):
+    """
+    SearchFilter para columnas ya normalizadas (texto_busqueda): normaliza los
+    términos igual que la columna y compara con LIKE sensible a mayúsculas, que
+    en PostgreSQL aprovecha el índice trigram (icontains envuelve la columna en UPPER()).
+    """
+
+    def get_search_terms(self, request):
+        termino = request.query_params.get(self.search_param, '')
+        return re.findall(r'\w+', normalizar_texto_busqueda(termino))
+
+    def construct_search(self, field_name, queryset=None):
+        if field_name.startswith(tuple(self.lookup_prefixes)):
+            return super().construct_search(field_name, queryset)
+        return f"{field_name}__contains"
@@ -0,0 +1,28 @@
+from django.core.management.commands.createcachetable import Command as CrearTablaCache
+from django.db import migrations
+
+# Mismo nombre que CACHES['default']['LOCATION'] del DatabaseCache en Washly/settings.py.
+# Se crea siempre, aunque hoy la caché sea Redis: al quitar REDIS_URL la tabla ya existe.
+TABLA = 'washly_cache'
+
+
+def crear_tabla(apps, schema_editor):
+    comando = CrearTablaCache()
+    comando.verbosity = 0
+    comando.create_table(schema_editor.connection.alias, TABLA, dry_run=False)
+
+
+def eliminar_tabla(apps, schema_editor):
+    if TABLA in schema_editor.connection.introspection.table_names():
+        schema_editor.execute(f'DROP TABLE {schema_editor.quote_name(TABLA)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla, eliminar_tabla),
+    ]
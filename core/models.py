@@ -82,6 +82,18 @@ class Empresa(models.Model):
             self.fecha_vencimiento = timezone.now() + timedelta(days=7)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._marca_cargada = instance.marca_publica()
+        return instance
+
+    def marca_publica(self):
+        """Nombre y logos que se muestran fuera del sistema (rastreo público)"""
+        # Desde __dict__: no dispara consultas por campos diferidos; los logos pueden ser str o FieldFile
+        valores = [self.__dict__.get(campo) for campo in ('nombre', 'logo', 'ticket_logo')]
+        return tuple(getattr(valor, 'name', valor) or '' for valor in valores)
+
     @property
     def es_valida(self):
         return self.estado == 'ACTIVO' and self.fecha_vencimiento > timezone.now()
@@ -0,0 +1,166 @@
+"""
+Paginación por keyset (cursor) para listados grandes.
+
+A diferencia de PageNumberPagination, no ejecuta COUNT(*) ni OFFSET: cada página
+filtra a partir de la posición (campo de orden, id) de la última fila vista,
+por lo que la página N cuesta lo mismo que la página 1.
+"""
+
+import base64
+import json
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor compuesto. `ordering` es una tupla de campos con el
+    desempate único al final, ej: ('-fecha_recepcion', '-id').
+
+    Query params:
+    - cursor: posición opaca devuelta en next/previous
+    - page_size: tamaño de página (máx. max_page_size)
+    - total=aprox|exacto: agrega 'total' a la respuesta (aprox usa el estimado del planner en PostgreSQL)
+
+    El orden lo fija `ordering`: un ?ordering= junto al cursor se rechaza con 400
+    en vez de ignorarse en silencio.
+    """
+    page_size = api_settings.PAGE_SIZE or 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+    invalid_cursor_message = 'Cursor inválido'
+    ordering_no_soportado_message = 'La paginación por cursor usa un orden fijo; no se admite el parámetro ordering.'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            raise ValidationError({api_settings.ORDERING_PARAM: self.ordering_no_soportado_message})
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.total = self._calcular_total(queryset, request.query_params.get(self.total_query_param))
+
+        posicion, reverso = self.decode_cursor(request)
+        ordering = self._invertir(self.ordering) if reverso else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if posicion is not None:
+            queryset = queryset.filter(self._filtro_posterior(ordering, posicion, queryset.model))
+
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if reverso:
+            filas.reverse()
+
+        self.page = filas
+        if reverso:
+            self.has_next = True
+            self.has_previous = hay_mas
+        else:
+            self.has_next = hay_mas
+            self.has_previous = posicion is not None
+        return filas
+
+    def get_page_size(self, request):
+        try:
+            valor = int(request.query_params[self.page_size_query_param])
+            if valor > 0:
+                return min(valor, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total is not None:
+            payload['total'] = self.total
+        return Response(payload)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._posicion(self.page[-1]), reverso=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self._posicion(self.page[0]), reverso=True)
+
+    # --- Cursor ---
+
+    def encode_cursor(self, posicion, reverso):
+        token = json.dumps({'p': posicion, 'r': reverso}, default=str)
+        token = base64.urlsafe_b64encode(token.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            posicion = data['p']
+            if not isinstance(posicion, list) or len(posicion) != len(self.ordering):
+                raise ValueError
+            return posicion, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _posicion(self, obj):
+        return [getattr(obj, campo.lstrip('-')) for campo in self.ordering]
+
+    # --- Filtros ---
+
+    @staticmethod
+    def _invertir(ordering):
+        return tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in ordering)
+
+    def _filtro_posterior(self, ordering, posicion, model):
+        """(a, b) posterior a (va, vb)  ≡  a ≷ va OR (a = va AND b ≷ vb)"""
+        valores = []
+        for campo, valor in zip(ordering, posicion):
+            nombre = campo.lstrip('-')
+            try:
+                valores.append(model._meta.get_field(nombre).to_python(valor))
+            except Exception:
+                raise NotFound(self.invalid_cursor_message)
+
+        filtro = Q()
+        iguales = Q()
+        for (campo, valor) in zip(ordering, valores):
+            nombre = campo.lstrip('-')
+            lookup = 'lt' if campo.startswith('-') else 'gt'
+            filtro |= iguales & Q(**{f'{nombre}__{lookup}': valor})
+            iguales &= Q(**{nombre: valor})
+        return filtro
+
+    # --- Total opcional ---
+
+    def _calcular_total(self, queryset, modo):
+        if modo not in ('aprox', 'exacto'):
+            return None
+        base = queryset.order_by()
+        if modo == 'aprox' and connections[queryset.db].vendor == 'postgresql':
+            sql, params = base.values('pk').query.sql_with_params()
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        return base.count()
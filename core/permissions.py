@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from django.utils import timezone
+from core.tenant import contexto_tenant, suscripcion_vigente
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,20 +28,17 @@ class IsActiveSubscription(permissions.BasePermission):
             return True
 
         # 4. Validación segura: Verificar que el usuario tiene perfil
-        perfil = getattr(request.user, 'perfil', None)
-        if perfil is None:
+        contexto = contexto_tenant(request)
+        if contexto.perfil is None:
             logger.warning(f"Usuario {request.user.id} sin perfil intentó acceder a {path}")
             return False
 
         # 5. Verificar Fecha de Vencimiento
-        try:
-            empresa = perfil.empresa
-            if empresa is None:
-                return False
-            if empresa.fecha_vencimiento.date() < timezone.now().date():
-                logger.info(f"Suscripción vencida para empresa {empresa.id}: {empresa.nombre}")
-                return False
-        except (AttributeError, TypeError):
+        empresa = contexto.empresa
+        if empresa is None:
+            return False
+        if not suscripcion_vigente(empresa):
+            logger.info(f"Suscripción vencida para empresa {empresa.id}: {empresa.nombre}")
             return False
             
         return True
@@ -52,7 +49,7 @@ class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        perfil = getattr(request.user, 'perfil', None)
+        perfil = contexto_tenant(request).perfil
         return perfil is not None and perfil.rol == 'ADMIN'
 
 
@@ -64,7 +61,7 @@ class IsCashierUser(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        perfil = getattr(request.user, 'perfil', None)
+        perfil = contexto_tenant(request).perfil
         return perfil is not None and perfil.rol in ['ADMIN', 'CAJERO']
 
 
@@ -76,5 +73,5 @@ class IsOperarioUser(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        perfil = getattr(request.user, 'perfil', None)
+        perfil = contexto_tenant(request).perfil
         return perfil is not None and perfil.rol in ['ADMIN', 'OPERARIO']
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Contexto de tenant por petición: usuario, perfil, empresa y sede resueltos una sola vez.
+
+TenantJWTAuthentication carga el usuario con su perfil, empresa y sede en una sola
+consulta (select_related); contexto_tenant(request) arma el contexto sobre ese usuario
+y lo deja en la petición, de modo que permisos, viewsets y la resolución de sede leen
+el mismo objeto. El estado de la suscripción se calcula sobre esa misma empresa,
+sin consultas adicionales.
+"""
+
+from django.utils import timezone
+
+RELACIONES_PERFIL = ('perfil__empresa', 'perfil__sede')
+
+_SIN_RESOLVER = object()
+
+
+def suscripcion_vigente(empresa):
+    """True si la fecha de vencimiento de la empresa (ya cargada con el usuario) no ha pasado"""
+    vencimiento = empresa.fecha_vencimiento
+    return vencimiento is not None and vencimiento.date() >= timezone.now().date()
+
+
+def _cargar_perfil(user):
+    """Perfil con empresa y sede; sin consultas si el usuario ya llegó con select_related"""
+    from usuarios.models import PerfilUsuario
+
+    if not user or not user.is_authenticated:
+        return None
+    if type(user).perfil.is_cached(user):
+        perfil = getattr(user, 'perfil', None)
+        if perfil is None or (PerfilUsuario.empresa.is_cached(perfil) and PerfilUsuario.sede.is_cached(perfil)):
+            return perfil
+    # Usuario autenticado por otra vía (sesión, tests): una consulta en vez de tres
+    perfil = PerfilUsuario.objects.select_related('empresa', 'sede').filter(user=user).first()
+    if perfil is not None:
+        user.perfil = perfil
+    return perfil
+
+
+class ContextoTenant:
+    """Datos de tenant de la petición. La sede se resuelve en el primer acceso."""
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self.perfil = _cargar_perfil(self.user)
+        self.empresa = self.perfil.empresa if self.perfil else None
+        self._sede = _SIN_RESOLVER
+
+    @property
+    def rol(self):
+        return self.perfil.rol if self.perfil else None
+
+    @property
+    def sede(self):
+        if self._sede is _SIN_RESOLVER:
+            self._sede = self._resolver_sede()
+        return self._sede
+
+    @sede.setter
+    def sede(self, sede):
+        self._sede = sede
+
+    def _resolver_sede(self):
+        """
+        Sede del header X-Current-Sede-ID si el usuario puede acceder a ella;
+        si no, la sede de su perfil. El header con la sede del perfil no consulta nada.
+        """
+        from core.models import Sede
+
+        perfil = self.perfil
+        if perfil is None:
+            return None
+
+        sede_id = self.request.headers.get('X-Current-Sede-ID')
+        if sede_id and sede_id.strip() != str(perfil.sede_id):
+            try:
+                sede = Sede.objects.get(id=sede_id, empresa_id=perfil.empresa_id, activo=True)
+                if perfil.puede_acceder_sede(sede):
+                    return sede
+            except (Sede.DoesNotExist, ValueError):
+                pass
+
+        return perfil.sede
+
+
+def contexto_tenant(request):
+    """Contexto de la petición, armado la primera vez que se pide"""
+    contexto = getattr(request, '_contexto_tenant', None)
+    if contexto is None or contexto.user is not request.user:
+        contexto = ContextoTenant(request)
+        request._contexto_tenant = contexto
+    return contexto
@@ -71,3 +71,66 @@ class CoreAPITestCase(BaseTenantAPITestCase):
         self.authenticate(self.cajero_user)
         response = self.client.post(f'/core/sedes/{self.sede_secundaria.id}/set_current/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ContextoTenantTestCase(BaseTenantAPITestCase):
+    """Usuario, perfil, empresa y sede se resuelven una sola vez por petición"""
+
+    TABLAS_TENANT = ('"auth_user"', '"usuarios_perfilusuario"', '"core_empresa"', '"core_sede"')
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        super().setUp()
+
+    def _consultas_tenant(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            q['sql'] for q in ctx.captured_queries
+            if any(f'FROM {tabla}' in q['sql'] for tabla in self.TABLAS_TENANT)
+        ]
+
+    def test_una_consulta_de_tenant_por_peticion(self):
+        self.authenticate(self.cajero_user)
+        for url in ('/api/categorias-servicio/', '/api/tickets/', '/api/clientes/'):
+            consultas = self._consultas_tenant(url)
+            self.assertEqual(len(consultas), 1, url)
+            self.assertIn('JOIN "usuarios_perfilusuario"', consultas[0])
+            self.assertIn('JOIN "core_empresa"', consultas[0])
+
+    def test_sede_del_header_cuesta_una_consulta(self):
+        self.authenticate(self.admin_user)
+        self.set_current_sede(self.sede_secundaria.id)
+        consultas = self._consultas_tenant('/api/tickets/')
+        self.assertEqual(len(consultas), 2)
+        self.assertTrue(consultas[1].startswith('SELECT') and 'FROM "core_sede"' in consultas[1])
+
+    def test_sede_no_permitida_usa_la_del_perfil(self):
+        from rest_framework.test import APIRequestFactory
+        from core.mixins import resolver_sede_desde_request
+        request = APIRequestFactory().get('/', HTTP_X_CURRENT_SEDE_ID=str(self.sede_secundaria.id))
+        request.user = self.cajero_user
+        self.assertEqual(resolver_sede_desde_request(request), self.sede_principal)
+
+    def test_renovacion_se_ve_sin_esperar_la_cache(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.authenticate(self.vencido_user)
+        self.assertEqual(self.client.get('/api/clientes/').status_code, status.HTTP_403_FORBIDDEN)
+        self.empresa_vencida.fecha_vencimiento = timezone.now() + timedelta(days=30)
+        self.empresa_vencida.save()
+        self.assertEqual(self.client.get('/api/clientes/').status_code, status.HTTP_200_OK)
+
+    def test_cache_en_bd_lista_tras_migrar(self):
+        """Sin REDIS_URL y con DEBUG=False la caché es la tabla washly_cache, creada por las migraciones"""
+        from django.core.cache import cache
+        from django.test import override_settings
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'washly_cache',
+        }}):
+            cache.set('core:prueba', 1, 60)
+            self.assertEqual(cache.get('core:prueba'), 1)
@@ -7,7 +7,9 @@ from io import BytesIO
 from django.core.files.base import ContentFile
 from django.conf import settings
 import random
+import re
 import string
+import unicodedata
 from datetime import datetime
 
 
@@ -46,3 +48,13 @@ def generar_qr_code(data, filename='qr_code'):
     return ContentFile(buffer.read(), name=f'{filename}.png')
 
 
+def normalizar_texto_busqueda(*partes):
+    """
+    Texto para columnas de búsqueda: minúsculas, sin tildes y con espacios colapsados.
+    Ej: ('José', 'Núñez', None) -> 'jose nunez'
+    """
+    texto = ' '.join(str(p) for p in partes if p not in (None, ''))
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
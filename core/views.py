@@ -6,6 +6,8 @@ from .models import Sede, Empresa, HistorialSuscripcion
 from .serializers import SedeSerializer, EmpresaSerializer, HistorialSuscripcionSerializer
 from core.permissions import IsActiveSubscription
 from core.mixins import resolver_sede_desde_request
+from core.tenant import contexto_tenant
+from core.pagination import KeysetPagination
 
 class BaseTenantViewSet(viewsets.ModelViewSet):
     """
@@ -14,15 +16,31 @@ class BaseTenantViewSet(viewsets.ModelViewSet):
     """
     permission_classes = [permissions.IsAuthenticated, IsActiveSubscription]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # Orden (campo, desempate) para ?paginacion=cursor. None = solo paginación por páginas.
+    cursor_ordering = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.cursor_ordering and self.request.query_params.get('paginacion') == 'cursor':
+                self._paginator = KeysetPagination(self.cursor_ordering)
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    @property
+    def tenant(self):
+        """Usuario, perfil, empresa y sede de la petición (core.tenant), resueltos una vez"""
+        return contexto_tenant(self.request)
 
     def get_queryset(self):
         # Filtra siempre por la empresa del usuario logueado
-        user = self.request.user
-        if not hasattr(user, 'perfil') or not user.perfil.empresa:
+        empresa = self.tenant.empresa
+        if not empresa:
             return self.queryset.model.objects.none()
 
         queryset = self.queryset.model.objects.filter(
-            empresa=user.perfil.empresa
+            empresa=empresa
         )
 
         # Si el modelo tiene campo 'activo', filtrar por defecto
@@ -39,7 +57,7 @@ class BaseTenantViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         user = self.request.user
-        empresa = user.perfil.empresa
+        empresa = self.tenant.empresa
         
         save_kwargs = {
             'empresa': empresa,
@@ -52,7 +70,7 @@ class BaseTenantViewSet(viewsets.ModelViewSet):
             
             # Si no se resolvió sede desde header o perfil, 
             # y es Admin, intentar usar la primera sede disponible como fallback
-            if not sede and user.perfil.rol == 'ADMIN':
+            if not sede and self.tenant.rol == 'ADMIN':
                 sede = Sede.objects.filter(empresa=empresa, activo=True).first()
             
             if sede:
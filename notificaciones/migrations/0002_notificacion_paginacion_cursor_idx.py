@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['empresa', 'creado_en', 'id'], name='notificacio_empresa_963a1a_idx'),
+        ),
+    ]
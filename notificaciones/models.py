@@ -37,6 +37,9 @@ class Notificacion(AuditModel):
         verbose_name = "Notificación"
         verbose_name_plural = "Notificaciones"
         ordering = ['-creado_en']
+        indexes = [
+            models.Index(fields=['empresa', 'creado_en', 'id']),  # Paginación por cursor
+        ]
     
     def __str__(self):
         return f"{self.canal} - {self.destinatario} - {self.estado}"
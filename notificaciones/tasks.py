@@ -25,6 +25,25 @@ def enviar_notificacion_ticket_async(ticket_id, tipo):
         logger.error(f"Error en enviar_notificacion_ticket_async para ticket {ticket_id}: {e}")
         return False
 
+@shared_task
+def enviar_notificaciones_lote_async(ticket_ids, tipo):
+    """
+    Versión en lote de enviar_notificacion_ticket_async para cambios de estado masivos:
+    un solo job y una sola query de tickets; un fallo no detiene al resto.
+    """
+    from tickets.models import Ticket
+    from .services import EmailService
+    enviados = 0
+    tickets = Ticket.objects.filter(id__in=ticket_ids).select_related('cliente', 'empresa')
+    for ticket in tickets:
+        try:
+            exito, _ = EmailService.send_ticket_notification(ticket, tipo=tipo)
+            enviados += int(bool(exito))
+        except Exception as e:
+            logger.error(f"Error en enviar_notificaciones_lote_async para ticket {ticket.id}: {e}")
+    return enviados
+
+
 @shared_task
 def enviar_notificacion_ticket(ticket_id, mensaje, canales=None):
     """
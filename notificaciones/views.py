@@ -7,7 +7,9 @@ from .serializers import NotificacionSerializer
 from core.views import BaseTenantViewSet
 
 class NotificacionViewSet(BaseTenantViewSet):
+    queryset = Notificacion.objects.all()
     serializer_class = NotificacionSerializer
     filter_backends = [filters.OrderingFilter]
     ordering = ['-creado_en']
+    cursor_ordering = ('-creado_en', '-id')
     http_method_names = ['get', 'head'] # Solo lectura por ahora
@@ -23,12 +23,27 @@ class PagoAdmin(admin.ModelAdmin):
     list_display = ('numero_pago', 'ticket', 'monto', 'metodo_pago_snapshot', 'estado', 'fecha_pago')
     list_filter = ('estado', 'metodo_pago_snapshot', 'empresa')
     search_fields = ('numero_pago', 'ticket__numero_ticket', 'referencia')
-    readonly_fields = ('numero_pago', 'fecha_pago')
+    # Monto, estado y ticket alimentan los acumulados del ticket y de caja: solo cambian vía servicios
+    readonly_fields = ('numero_pago', 'fecha_pago', 'ticket', 'caja', 'monto', 'estado')
     date_hierarchy = 'fecha_pago'
 
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(MovimientoCaja)
 class MovimientoCajaAdmin(admin.ModelAdmin):
     list_display = ('id', 'caja', 'tipo', 'monto', 'descripcion', 'categoria')
     list_filter = ('tipo', 'categoria', 'empresa')
     search_fields = ('descripcion',)
+    # Caja, tipo, monto y método alimentan los saldos de caja: solo cambian vía registrar_movimiento
+    readonly_fields = ('caja', 'tipo', 'monto', 'metodo_pago_config')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
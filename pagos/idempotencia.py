@@ -0,0 +1,164 @@
+"""
+Claves de idempotencia (cabecera Idempotency-Key) para las operaciones que cobran.
+
+La primera solicitud con una clave reserva la fila (empresa, alcance, clave) como
+EN_PROCESO. Luego, en una sola transacción, bloquea esa fila (SELECT ... FOR UPDATE),
+ejecuta la operación y la marca COMPLETADO con la respuesta 2xx: el cobro y su
+registro se confirman juntos o no se confirma ninguno.
+
+Los reintentos repiten lo guardado sin volver a bloquear el ticket; si llegan mientras
+la primera sigue en curso, esperan a que termine. Un error libera la clave para que
+el cliente pueda reintentar con la misma. Una reserva EN_PROCESO solo se retoma si se
+puede bloquear (SKIP LOCKED): su dueño murió y la BD ya revirtió su transacción. Sin
+importar cuánto tarde la operación, mientras su dueño viva nadie la repite.
+"""
+
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+CABECERA = 'Idempotency-Key'
+LARGO_MAXIMO = 255
+TTL = 60 * 60 * 24
+ESPERA_MAXIMA = 15  # segundos que un duplicado espera a la solicitud original
+INTERVALO = 0.05
+
+
+def _cache_key(empresa_id, alcance, clave):
+    digest = hashlib.sha256(clave.encode()).hexdigest()
+    return f"idempotencia:{empresa_id}:{alcance}:{digest}"
+
+
+def huella(request):
+    """Identifica el contenido de la solicitud: la misma clave con otro cuerpo es un error del cliente"""
+    datos = request.data
+    if hasattr(datos, 'lists'):
+        datos = dict(datos.lists())
+    contenido = json.dumps([request.method, request.path, datos], sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def _repetir(guardado, firma):
+    if guardado['huella'] != firma:
+        return Response(
+            {'error': f'La {CABECERA} ya se usó con una solicitud distinta.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(guardado['respuesta'], status=guardado['status'], headers={'Idempotent-Replayed': 'true'})
+
+
+def _ejecutar(reserva_id, operacion, firma, cache_key):
+    """
+    Bloquea la reserva y ejecuta la operación en la misma transacción que la marca
+    COMPLETADO. Devuelve None si otra solicitud la tiene bloqueada o ya la resolvió.
+    """
+    from .models import ClaveIdempotencia
+
+    try:
+        with transaction.atomic():
+            reserva = ClaveIdempotencia.objects.select_for_update(skip_locked=True).filter(
+                pk=reserva_id, estado='EN_PROCESO'
+            ).first()
+            if reserva is None:
+                return None
+
+            response = operacion()
+            if not status.is_success(response.status_code):
+                reserva.delete()
+                return response
+
+            guardado = {
+                'huella': firma,
+                'status': response.status_code,
+                'respuesta': json.loads(json.dumps(response.data, cls=JSONEncoder)),
+            }
+            ClaveIdempotencia.objects.filter(pk=reserva.pk).update(
+                estado='COMPLETADO', status_code=guardado['status'], respuesta=guardado['respuesta'],
+                expira_en=timezone.now() + timedelta(seconds=TTL)
+            )
+    except Exception:
+        # La transacción se revirtió: se libera la clave para reintentar con la misma
+        ClaveIdempotencia.objects.filter(pk=reserva_id, estado='EN_PROCESO').delete()
+        raise
+
+    cache.set(cache_key, guardado, TTL)
+    return response
+
+
+def responder(request, alcance, operacion):
+    """
+    Ejecuta `operacion()` (que devuelve un Response) a lo sumo una vez por
+    Idempotency-Key. Sin cabecera, la ejecuta tal cual.
+    """
+    from django.db import connection
+    from .models import ClaveIdempotencia
+
+    clave = request.headers.get(CABECERA)
+    if not clave:
+        return operacion()
+    if len(clave) > LARGO_MAXIMO:
+        return Response({'error': f'{CABECERA} demasiado larga.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    empresa_id = request.user.perfil.empresa_id
+    firma = huella(request)
+    cache_key = _cache_key(empresa_id, alcance, clave)
+    filtro = {'empresa_id': empresa_id, 'alcance': alcance, 'clave': clave}
+    limite = time.monotonic() + ESPERA_MAXIMA
+    # Sin bloqueo de filas (SQLite) no se distingue un dueño caído de uno lento:
+    # la reserva huérfana espera a limpiar_expiradas
+    retomable = connection.features.has_select_for_update_skip_locked
+
+    while True:
+        guardado = cache.get(cache_key)
+        if guardado:
+            return _repetir(guardado, firma)
+
+        ahora = timezone.now()
+        try:
+            with transaction.atomic():
+                reserva = ClaveIdempotencia.objects.create(
+                    **filtro, usuario=request.user, huella=firma, expira_en=ahora + timedelta(seconds=TTL)
+                )
+        except IntegrityError:
+            existente = ClaveIdempotencia.objects.filter(**filtro).first()
+        else:
+            response = _ejecutar(reserva.pk, operacion, firma, cache_key)
+            if response is not None:
+                return response
+            continue  # Un reintento la retomó entre la reserva y el bloqueo
+
+        if existente is None:
+            continue  # La original falló y liberó la clave
+        if existente.estado == 'COMPLETADO':
+            if existente.expira_en <= ahora:
+                ClaveIdempotencia.objects.filter(pk=existente.pk, expira_en__lte=ahora).delete()
+                continue
+            guardado = {'huella': existente.huella, 'status': existente.status_code, 'respuesta': existente.respuesta}
+            cache.set(cache_key, guardado, int((existente.expira_en - ahora).total_seconds()))
+            return _repetir(guardado, firma)
+        if existente.huella != firma:
+            return _repetir({'huella': existente.huella}, firma)
+        if retomable:
+            response = _ejecutar(existente.pk, operacion, firma, cache_key)
+            if response is not None:
+                return response
+        if time.monotonic() >= limite:
+            return Response(
+                {'error': 'La solicitud original con esta clave sigue en proceso. Reintente en unos segundos.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        time.sleep(INTERVALO)
+
+
+def limpiar_expiradas():
+    from .models import ClaveIdempotencia
+    eliminadas, _ = ClaveIdempotencia.objects.filter(expira_en__lte=timezone.now()).delete()
+    return eliminadas
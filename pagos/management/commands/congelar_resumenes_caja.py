@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from pagos.models import CajaSesion
+from pagos.services import CajaService
+
+
+class Command(BaseCommand):
+    help = 'Congela el resumen de cierre de las sesiones de caja cerradas que aún no lo tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa a procesar (por defecto todas)')
+        parser.add_argument('--todas', action='store_true', help='Recalcula también las sesiones que ya tienen resumen')
+        parser.add_argument('--lote', type=int, default=500, help='Sesiones por consulta')
+
+    def handle(self, *args, **options):
+        queryset = CajaSesion.objects.filter(estado='CERRADA').order_by('id')
+        if options.get('empresa'):
+            queryset = queryset.filter(empresa_id=options['empresa'])
+        if not options['todas']:
+            queryset = queryset.filter(resumen_cierre__isnull=True)
+
+        ids = list(queryset.values_list('id', flat=True))
+        for i in range(0, len(ids), options['lote']):
+            cajas = list(CajaSesion.objects.filter(id__in=ids[i:i + options['lote']]).only(
+                'id', 'monto_inicial', 'detalle_apertura'
+            ))
+            CajaService.congelar_resumenes(cajas)
+            CajaSesion.objects.bulk_update(cajas, ['resumen_cierre'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(ids)} sesiones de caja con resumen congelado."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from pagos.services import VentasDiariasService
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el acumulado de ventas diarias (VentasDiarias) desde los pagos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa a reconstruir (por defecto todas)')
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto desde el primer pago)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto hasta hoy)')
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for opcion in ('desde', 'hasta'):
+            valor = options.get(opcion)
+            fechas[opcion] = parse_date(valor) if valor else None
+            if valor and fechas[opcion] is None:
+                raise CommandError(f"--{opcion} debe tener el formato YYYY-MM-DD")
+
+        filas = VentasDiariasService.reconstruir(options.get('empresa'), fechas['desde'], fechas['hasta'])
+        self.stdout.write(self.style.SUCCESS(f"✅ Ventas diarias reconstruidas: {filas} filas."))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from pagos.models import CajaSesion
+from pagos.services import CajaService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los saldos corrientes de caja desde pagos y movimientos y reporta (u opcionalmente repara) diferencias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa a revisar (por defecto todas)')
+        parser.add_argument('--caja', type=int, nargs='+', help='IDs de sesiones de caja a revisar')
+        parser.add_argument('--abiertas', action='store_true', help='Solo sesiones abiertas')
+        parser.add_argument('--reparar', action='store_true', help='Reconstruye los saldos de las cajas con diferencias')
+        parser.add_argument('--lote', type=int, default=500, help='Sesiones por consulta')
+
+    def handle(self, *args, **options):
+        queryset = CajaSesion.objects.order_by('id')
+        if options.get('empresa'):
+            queryset = queryset.filter(empresa_id=options['empresa'])
+        if options.get('caja'):
+            queryset = queryset.filter(id__in=options['caja'])
+        if options['abiertas']:
+            queryset = queryset.filter(estado='ABIERTA')
+
+        ids = list(queryset.values_list('id', flat=True))
+        cajas_con_diferencias = set()
+        for i in range(0, len(ids), options['lote']):
+            lote = ids[i:i + options['lote']]
+            diferencias = CajaService.verificar_saldos(lote)
+            for caja_id, sede_id, codigo, campo, registrado, esperado in diferencias:
+                self.stdout.write(
+                    f"Caja {caja_id} (sede={sede_id or '-'}, {codigo}): {campo} {registrado} -> {esperado}"
+                )
+                cajas_con_diferencias.add(caja_id)
+            if options['reparar']:
+                reparar = [c for c in lote if c in cajas_con_diferencias]
+                if reparar:
+                    CajaService.reconstruir_saldos(reparar)
+
+        if not cajas_con_diferencias:
+            self.stdout.write(self.style.SUCCESS(f"✅ Saldos de {len(ids)} cajas consistentes. Sin diferencias."))
+        elif options['reparar']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(cajas_con_diferencias)} cajas reparadas."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(cajas_con_diferencias)} cajas con diferencias. Ejecute con --reparar para corregirlas."
+            ))
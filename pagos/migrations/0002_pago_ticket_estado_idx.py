@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pagos', '0001_initial'),
+        ('tickets', '0005_ticket_libro_financiero'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['ticket', 'estado'], name='pagos_pago_ticket__3103f5_idx'),
+        ),
+    ]
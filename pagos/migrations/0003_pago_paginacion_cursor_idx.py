@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pagos', '0002_pago_ticket_estado_idx'),
+        ('tickets', '0006_indices_paginacion_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['empresa', 'fecha_pago', 'id'], name='pagos_pago_empresa_337378_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_saldos(apps, schema_editor):
+    from pagos.services import CajaService
+    CajaSesion = apps.get_model('pagos', 'CajaSesion')
+    ids = list(CajaSesion.objects.values_list('id', flat=True))
+    for i in range(0, len(ids), 500):
+        CajaService.reconstruir_saldos(ids[i:i + 500], registro=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pagos', '0003_pago_paginacion_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CajaSaldoMetodo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=20)),
+                ('ventas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('egresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('caja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_metodo', to='pagos.cajasesion')),
+                ('sede', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.sede')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('sede__isnull', False)), fields=('caja', 'sede', 'codigo'), name='pagos_caja_saldo_sede_unico'), models.UniqueConstraint(condition=models.Q(('sede__isnull', True)), fields=('caja', 'codigo'), name='pagos_caja_saldo_sin_sede_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_saldos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pagos', '0004_caja_saldo_metodo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alcance', models.CharField(max_length=50)),
+                ('clave', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('estado', models.CharField(choices=[('EN_PROCESO', 'En proceso'), ('COMPLETADO', 'Completado')], default='EN_PROCESO', max_length=20)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('empresa', 'alcance', 'clave')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0005_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cajasesion',
+            name='resumen_cierre',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
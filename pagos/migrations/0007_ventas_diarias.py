@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_ventas(apps, schema_editor):
+    from pagos.services import VentasDiariasService
+    VentasDiariasService.reconstruir(registro=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pagos', '0006_caja_resumen_cierre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentasDiarias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('codigo', models.CharField(max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.empresa')),
+                ('sede', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.sede')),
+            ],
+            options={
+                'verbose_name_plural': 'Ventas diarias',
+                'indexes': [models.Index(fields=['empresa', 'fecha'], name='pagos_venta_empresa_4ad199_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('sede__isnull', False)), fields=('empresa', 'sede', 'fecha', 'codigo'), name='pagos_ventas_diarias_sede_unico'), models.UniqueConstraint(condition=models.Q(('sede__isnull', True)), fields=('empresa', 'fecha', 'codigo'), name='pagos_ventas_diarias_sin_sede_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_ventas, migrations.RunPython.noop),
+    ]
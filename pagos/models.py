@@ -48,6 +48,8 @@ class CajaSesion(AuditModel):
     detalle_cierre = models.JSONField(default=dict, verbose_name="Detalle de Cierre")
     estado = models.CharField(max_length=10, default='ABIERTA', choices=[('ABIERTA', 'Abierta'), ('CERRADA', 'Cerrada')])
     comentarios = models.TextField(blank=True, null=True)
+    # Cifras calculadas al cerrar (CajaService.congelar_resumenes); una sesión cerrada ya no cambia
+    resumen_cierre = models.JSONField(null=True, blank=True, editable=False)
 
     def __str__(self):
         sede_str = self.sede.nombre if self.sede else 'Sede (Global)'
@@ -68,6 +70,14 @@ class Pago(AuditModel):
     referencia = models.CharField(max_length=100, blank=True, null=True)
     fecha_pago = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Subqueries de saldo por ticket (solo pagos PAGADO)
+            models.Index(fields=['ticket', 'estado']),
+            # Paginación por cursor
+            models.Index(fields=['empresa', 'fecha_pago', 'id']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.numero_pago:
             self.numero_pago = generar_numero_unico('PAG')
@@ -98,4 +108,102 @@ class MovimientoCaja(AuditModel):
     metodo_pago_config = models.ForeignKey(MetodoPagoConfig, on_delete=models.SET_NULL, null=True, blank=True)
     
     descripcion = models.CharField(max_length=255)
-    categoria = models.CharField(max_length=50, default='GENERAL')
\ No newline at end of file
+    categoria = models.CharField(max_length=50, default='GENERAL')
+
+class CajaSaldoMetodo(models.Model):
+    """
+    Acumulados corrientes de una sesión de caja por código de método de pago.
+    Las ventas se separan por la sede del ticket (el resumen de caja puede filtrarse
+    por sede); los ingresos/egresos manuales van en la fila sin sede.
+    Se actualizan con F() desde propagar_pago y registrar_movimiento: leer los saldos
+    de una sesión abierta es leer unas pocas filas, no agregar todos sus pagos.
+    """
+    caja = models.ForeignKey(CajaSesion, on_delete=models.CASCADE, related_name='saldos_metodo')
+    sede = models.ForeignKey(Sede, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    codigo = models.CharField(max_length=20)
+    ventas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    egresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['caja', 'sede', 'codigo'], condition=models.Q(sede__isnull=False),
+                name='pagos_caja_saldo_sede_unico'
+            ),
+            # NULL no choca en un UNIQUE: la fila sin sede necesita su propia restricción
+            models.UniqueConstraint(
+                fields=['caja', 'codigo'], condition=models.Q(sede__isnull=True),
+                name='pagos_caja_saldo_sin_sede_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Caja {self.caja_id} - {self.codigo}"
+
+
+class VentasDiarias(models.Model):
+    """
+    Ventas cobradas por empresa, sede del ticket, día (fecha local del pago) y código
+    de método. Se actualiza con F() desde propagar_pago (alta y anulación): los
+    dashboards y reportes leen una fila por día en lugar de agregar todos los pagos.
+    Se reconstruye con el comando reconstruir_ventas_diarias.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='+')
+    sede = models.ForeignKey(Sede, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    fecha = models.DateField()
+    codigo = models.CharField(max_length=20)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cantidad = models.IntegerField(default=0)  # Pagos PAGADO del día
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Ventas diarias"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'sede', 'fecha', 'codigo'], condition=models.Q(sede__isnull=False),
+                name='pagos_ventas_diarias_sede_unico'
+            ),
+            # NULL no choca en un UNIQUE: las ventas de tickets sin sede necesitan su propia restricción
+            models.UniqueConstraint(
+                fields=['empresa', 'fecha', 'codigo'], condition=models.Q(sede__isnull=True),
+                name='pagos_ventas_diarias_sin_sede_unico'
+            ),
+        ]
+        indexes = [
+            # Rangos de fechas de toda la empresa (sin filtro de sede)
+            models.Index(fields=['empresa', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.codigo}: {self.total}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Resultado de una operación de cobro identificada por la cabecera Idempotency-Key.
+    Mientras la primera solicitud está EN_PROCESO los duplicados esperan; al completarse
+    se guarda la respuesta para repetirla en los reintentos (ver pagos.idempotencia).
+    """
+    ESTADO_CHOICES = [
+        ('EN_PROCESO', 'En proceso'),
+        ('COMPLETADO', 'Completado'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='+')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    alcance = models.CharField(max_length=50)  # Operación, ej: 'pagos.crear'
+    clave = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64)  # sha256 de método + ruta + cuerpo
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='EN_PROCESO')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ['empresa', 'alcance', 'clave']
+
+    def __str__(self):
+        return f"{self.alcance}:{self.clave} ({self.estado})"
@@ -4,11 +4,9 @@ Actualizado para SaaS: Soporte dinámico de métodos de pago y seguridad multi-t
 """
 
 from rest_framework import serializers
-from django.db.models import Sum, Q
 from django.utils import timezone
-from decimal import Decimal
 from .models import Pago, CajaSesion, MovimientoCaja, MetodoPagoConfig
-import json
+from .services import CajaService
 
 class MetodoPagoConfigSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,7 +24,10 @@ class PagoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pago
         fields = '__all__'
-        read_only_fields = ['numero_pago', 'caja', 'empresa', 'creado_por', 'metodo_pago_snapshot', 'es_anulable']
+        read_only_fields = [
+            'numero_pago', 'caja', 'empresa', 'creado_por', 'metodo_pago_snapshot', 'es_anulable',
+            'ticket', 'monto', 'estado'
+        ]
 
     def get_es_anulable(self, obj):
         # Validar anulación solo el mismo día (Hora local Perú)
@@ -42,6 +43,14 @@ class MovimientoCajaSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['caja', 'empresa', 'creado_por']
 
+class CajaSesionListSerializer(serializers.ListSerializer):
+    """Listados de cajas: precarga los resúmenes de toda la página en una sola consulta"""
+
+    def to_representation(self, data):
+        cajas = list(data.all() if hasattr(data, 'all') else data)
+        CajaService.precargar_resumenes(cajas, self.child._get_sede_from_context())
+        return super().to_representation(cajas)
+
 class CajaSesionSerializer(serializers.ModelSerializer):
     usuario_nombre = serializers.CharField(source='usuario.username', read_only=True)
     
@@ -55,8 +64,9 @@ class CajaSesionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CajaSesion
-        fields = '__all__'
+        exclude = ['resumen_cierre']  # Se expone a través de los campos calculados
         read_only_fields = ['empresa', 'creado_por', 'monto_final_sistema', 'diferencia']
+        list_serializer_class = CajaSesionListSerializer
 
     def to_representation(self, instance):
         """Limpieza automatica de comentarios tecnicos en cualquier respuesta del API."""
@@ -76,138 +86,30 @@ class CajaSesionSerializer(serializers.ModelSerializer):
         """
         return self.context.get('sede', None)
 
-    def _get_pagos_qs(self, obj):
-        """Retorna queryset de pagos filtrado por sede si aplica."""
-        qs = obj.pagos_ticket.filter(estado='PAGADO')
-        sede = self._get_sede_from_context()
-        if sede:
-            qs = qs.filter(ticket__sede=sede)
-        return qs
-
-    def _get_movimientos_qs(self, obj):
-        """Retorna queryset de movimientos."""
-        return obj.movimientos_extra.all()
-
-    def _get_apertura_dict(self, obj):
-        try:
-            if isinstance(obj.detalle_apertura, str):
-                return json.loads(obj.detalle_apertura)
-            return obj.detalle_apertura if obj.detalle_apertura else {}
-        except:
-            return {}
+    def _resumen(self, obj):
+        """
+        Todas las cifras salen de CajaService.resumen_sesion, memorizada por instancia:
+        una consulta para la sesión abierta, el resumen congelado para las cerradas.
+        """
+        return CajaService.resumen_sesion(obj, self._get_sede_from_context())
 
     def get_total_ventas(self, obj):
-        val = self._get_pagos_qs(obj).aggregate(Sum('monto'))['monto__sum']
-        return Decimal(str(val)) if val is not None else Decimal('0.00')
+        return self._resumen(obj)['total_ventas']
 
     def get_total_gastos(self, obj):
-        val = obj.movimientos_extra.filter(tipo='EGRESO').aggregate(Sum('monto'))['monto__sum']
-        return Decimal(str(val)) if val is not None else Decimal('0.00')
+        return self._resumen(obj)['total_gastos']
 
     def get_total_efectivo(self, obj):
-        """Calcula el total físico en caja (Billetes y monedas)"""
-        
-        # 1. Ventas en efectivo (filtradas por sede)
-        ventas = self._get_pagos_qs(obj).filter(
-            Q(metodo_pago_config__codigo_metodo='EFECTIVO') |
-            Q(metodo_pago_config__isnull=True, metodo_pago_snapshot__icontains='Efectivo')
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # 2. Ingresos Manuales
-        ingresos = obj.movimientos_extra.filter(
-            Q(tipo='INGRESO') &
-            (Q(metodo_pago_config__codigo_metodo='EFECTIVO') | Q(metodo_pago_config__isnull=True))
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # 3. Egresos Manuales
-        egresos = obj.movimientos_extra.filter(
-            Q(tipo='EGRESO') &
-            (Q(metodo_pago_config__codigo_metodo='EFECTIVO') | Q(metodo_pago_config__isnull=True))
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        return Decimal(obj.monto_inicial) + Decimal(ventas) + Decimal(ingresos) - Decimal(egresos)
+        """Total físico en caja (billetes y monedas)"""
+        return self._resumen(obj)['total_efectivo']
 
     def get_total_digital(self, obj):
-        """Calcula el dinero en cuentas (Yape, Plin, Tarjeta, etc.)"""
-        
-        # 1. Ventas no-efectivo (filtradas por sede)
-        ventas = self._get_pagos_qs(obj).exclude(
-            Q(metodo_pago_config__codigo_metodo='EFECTIVO') | 
-            Q(metodo_pago_config__isnull=True, metodo_pago_snapshot__icontains='Efectivo')
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # 2. Apertura Digital (Si hubo saldo inicial en cuentas)
-        apertura = self._get_apertura_dict(obj)
-        saldo_inicial_digital = Decimal(0)
-        for k, v in apertura.items():
-            if k != 'EFECTIVO':
-                saldo_inicial_digital += Decimal(str(v or 0))
-
-        # 3. Ingresos Digitales
-        ingresos = obj.movimientos_extra.filter(tipo='INGRESO').exclude(
-            Q(metodo_pago_config__codigo_metodo='EFECTIVO') | Q(metodo_pago_config__isnull=True)
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-        # 4. Egresos Digitales
-        egresos = obj.movimientos_extra.filter(tipo='EGRESO').exclude(
-            Q(metodo_pago_config__codigo_metodo='EFECTIVO') | Q(metodo_pago_config__isnull=True)
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-                
-        return Decimal(ventas) + saldo_inicial_digital + Decimal(ingresos) - Decimal(egresos)
+        """Dinero en cuentas (Yape, Plin, Tarjeta, etc.)"""
+        return self._resumen(obj)['total_digital']
 
     def get_saldo_actual(self, obj):
-        return self.get_total_efectivo(obj) + self.get_total_digital(obj)
+        return self._resumen(obj)['saldo_actual']
     
     def get_desglose_pagos(self, obj):
-        """
-        Genera el desglose DINÁMICO basado en los métodos configurados de la empresa.
-        Sustituye la lista hardcodeada anterior.
-        """
-        # Diccionario base
-        desglose = {}
-        
-        # Aseguramos que EFECTIVO siempre esté inicializado
-        desglose['EFECTIVO'] = Decimal(0)
-        
-        # Helper para sumar al diccionario
-        def add_to_desglose(codigo, monto, es_resta=False):
-            if codigo not in desglose:
-                desglose[codigo] = Decimal(0)
-            if es_resta:
-                desglose[codigo] -= Decimal(str(monto))
-            else:
-                desglose[codigo] += Decimal(str(monto))
-
-        # 1. Saldo Inicial
-        add_to_desglose('EFECTIVO', obj.monto_inicial)
-        apertura = self._get_apertura_dict(obj)
-        for k, v in apertura.items():
-            if k != 'EFECTIVO':
-                add_to_desglose(k, v)
-
-        # 2. Ventas (Pagos) — filtrados por sede si aplica
-        pagos = self._get_pagos_qs(obj).select_related('metodo_pago_config')
-        for p in pagos:
-            code = 'OTROS'
-            if p.metodo_pago_config:
-                code = p.metodo_pago_config.codigo_metodo
-            elif p.metodo_pago_snapshot:
-                snap = p.metodo_pago_snapshot.upper()
-                if 'EFECTIVO' in snap: code = 'EFECTIVO'
-                elif 'YAPE' in snap: code = 'YAPE'
-                elif 'PLIN' in snap: code = 'PLIN'
-                elif 'TARJETA' in snap: code = 'TARJETA'
-                elif 'TRANSFERENCIA' in snap: code = 'TRANSFERENCIA'
-            
-            add_to_desglose(code, p.monto)
-
-        # 3. Movimientos (Ingresos/Egresos)
-        movs = obj.movimientos_extra.all().select_related('metodo_pago_config')
-        for m in movs:
-            code = m.metodo_pago_config.codigo_metodo if m.metodo_pago_config else 'EFECTIVO'
-            if m.tipo == 'INGRESO':
-                add_to_desglose(code, m.monto)
-            else:
-                add_to_desglose(code, m.monto, es_resta=True)
-                
-        return desglose
\ No newline at end of file
+        """Desglose DINÁMICO por código de método configurado de la empresa"""
+        return self._resumen(obj)['desglose_pagos']
\ No newline at end of file
@@ -1,11 +1,53 @@
 from rest_framework import serializers
 from django.utils import timezone
+from django.apps import apps
+from django.db import IntegrityError
+from django.db.models import Case, CharField, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
 from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
 import json
-from .models import Pago, CajaSesion, MovimientoCaja, MetodoPagoConfig
+from .models import Pago, CajaSesion, CajaSaldoMetodo, MovimientoCaja, MetodoPagoConfig, VentasDiarias
+from . import diario
+from core.utils import generar_numero_unico
 
 from django.db import transaction
 
+def _caja_abierta(user, empresa):
+    """Caja abierta del usuario, bloqueada hasta el fin de la transacción en curso"""
+    caja_abierta = _bloquear_caja_abierta(usuario=user, empresa=empresa)
+
+    if not caja_abierta:
+        raise serializers.ValidationError({
+            "error": "No tienes una caja abierta. Apertura caja para recibir pagos."
+        })
+    return caja_abierta
+
+
+def _bloquear_caja_abierta(**filtros):
+    """
+    Bloquea y devuelve la caja ABIERTA que cumpla los filtros (llamar dentro de transaction.atomic).
+    Si un cierre concurrente la tiene bloqueada, espera y el filtro de estado se vuelve a evaluar:
+    no se escribe sobre una caja cuyo resumen acaba de congelarse.
+    """
+    return CajaSesion.objects.select_for_update().filter(estado='ABIERTA', **filtros).first()
+
+
+def _resolver_metodo(empresa, metodo_pago_id=None, metodo_pago_str=None):
+    """Devuelve (configuración del método o None, nombre a guardar en el pago)"""
+    metodo_config = None
+    if metodo_pago_id:
+        metodo_config = MetodoPagoConfig.objects.filter(id=metodo_pago_id, empresa=empresa).first()
+    elif metodo_pago_str:
+        metodo_config = MetodoPagoConfig.objects.filter(
+            codigo_metodo=metodo_pago_str.upper(), 
+            empresa=empresa
+        ).first()
+
+    snapshot = metodo_config.nombre_mostrar if metodo_config else (metodo_pago_str or "EFECTIVO")
+    return metodo_config, snapshot
+
+
 def registrar_pago(user, empresa, ticket, monto, metodo_pago_id=None, metodo_pago_str=None, referencia=None):
     """
     Servicio centralizado para registrar pagos, asegurando que se validen contra la caja
@@ -22,35 +64,16 @@ def registrar_pago(user, empresa, ticket, monto, metodo_pago_id=None, metodo_pag
         locked_ticket = Ticket.objects.select_for_update().get(id=ticket.id)
         
         # 2. Idempotencia: Verificar que el ticket no se "sobre-pague" por clics dobles
-        saldo_actual = locked_ticket.calcular_saldo_pendiente()
+        # (el saldo persistido del ticket bloqueado ya refleja items y pagos previos)
+        saldo_actual = locked_ticket.saldo
         if round(monto_float, 2) > round(float(saldo_actual), 2):
             raise serializers.ValidationError({
                 "error": f"IDEMPOTENCIA ALERT: Intento de pago por S/{monto_float} supera el saldo pendiente de S/{saldo_actual}. Transacción rechazada para evitar sobre-cobro."
             })
 
         # Validar Caja Abierta (Dentro del lock para consistencia total si se requiere)
-        caja_abierta = CajaSesion.objects.filter(
-            usuario=user, 
-            empresa=empresa, 
-            estado='ABIERTA'
-        ).first()
-        
-        if not caja_abierta:
-            raise serializers.ValidationError({
-                "error": "No tienes una caja abierta. Apertura caja para recibir pagos."
-            })
-        
-        # Resolver Configuración del Método de Pago
-        metodo_config = None
-        if metodo_pago_id:
-            metodo_config = MetodoPagoConfig.objects.filter(id=metodo_pago_id, empresa=empresa).first()
-        elif metodo_pago_str:
-            metodo_config = MetodoPagoConfig.objects.filter(
-                codigo_metodo=metodo_pago_str.upper(), 
-                empresa=empresa
-            ).first()
-
-        snapshot = metodo_config.nombre_mostrar if metodo_config else (metodo_pago_str or "EFECTIVO")
+        caja_abierta = _caja_abierta(user, empresa)
+        metodo_config, snapshot = _resolver_metodo(empresa, metodo_pago_id, metodo_pago_str)
         if not referencia:
             referencia = f'Pago Ticket {ticket.numero_ticket}'
 
@@ -66,9 +89,164 @@ def registrar_pago(user, empresa, ticket, monto, metodo_pago_id=None, metodo_pag
             empresa=empresa,
             creado_por=user
         )
+        propagar_pago(pago)
         
         return pago
 
+
+def liquidar_tickets(user, empresa, ticket_ids, monto=None, metodo_pago_id=None, metodo_pago_str=None, referencia=None):
+    """
+    Cobra varios tickets con un solo monto entregado (el cliente recoge y paga todo junto).
+    Tickets eliminados o cancelados se reportan como no encontrados.
+    El monto se reparte en el orden recibido hasta cubrir el saldo de cada ticket; sin
+    monto, se liquida el saldo completo de todos. Todo ocurre en una transacción:
+    los tickets se bloquean en orden de pk (dos liquidaciones que comparten tickets no
+    se bloquean mutuamente), la caja y el método se resuelven una vez y los pagos se
+    insertan con bulk_create.
+    Devuelve (pagos, [{'ticket', 'numero_ticket', 'monto_aplicado', 'saldo'}, ...]).
+    """
+    from tickets.models import Ticket
+    from tickets.services import TicketService
+
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in ticket_ids or []))
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({'error': 'Lista de tickets inválida.'})
+    if not ids:
+        raise serializers.ValidationError({'error': 'Indique al menos un ticket.'})
+    if monto is not None:
+        try:
+            monto = Decimal(str(monto)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise serializers.ValidationError({'error': 'Monto inválido.'})
+        if monto <= 0:
+            raise serializers.ValidationError({'error': 'El monto debe ser mayor a cero.'})
+
+    with transaction.atomic():
+        bloqueados = {
+            t.pk: t for t in Ticket.objects.select_for_update().filter(
+                pk__in=ids, empresa=empresa, activo=True
+            ).exclude(estado='CANCELADO').order_by('pk')
+        }
+        faltantes = [pk for pk in ids if pk not in bloqueados]
+        if faltantes:
+            raise serializers.ValidationError({'error': f'Tickets no encontrados: {faltantes}'})
+        tickets = [bloqueados[pk] for pk in ids]
+
+        pendiente = sum((t.saldo for t in tickets), Decimal('0'))
+        if monto is None:
+            monto = pendiente
+        if monto > pendiente:
+            raise serializers.ValidationError({
+                'error': f'El monto S/{monto} supera el saldo pendiente de S/{pendiente}.'
+            })
+        if monto <= 0:
+            raise serializers.ValidationError({'error': 'Los tickets no tienen saldo pendiente.'})
+
+        caja_abierta = _caja_abierta(user, empresa)
+        metodo_config, snapshot = _resolver_metodo(empresa, metodo_pago_id, metodo_pago_str)
+
+        pagos, saldos, restante = [], [], monto
+        for ticket in tickets:
+            aplicado = min(restante, ticket.saldo) if ticket.saldo > 0 else Decimal('0')
+            restante -= aplicado
+            if aplicado:
+                pagos.append(Pago(
+                    ticket=ticket,
+                    caja=caja_abierta,
+                    monto=aplicado,
+                    metodo_pago_config=metodo_config,
+                    metodo_pago_snapshot=snapshot,
+                    numero_pago=generar_numero_unico('PAG'),
+                    estado='PAGADO',
+                    referencia=referencia or f'Pago Ticket {ticket.numero_ticket}',
+                    empresa=empresa,
+                    creado_por=user
+                ))
+            saldos.append({
+                'ticket': ticket.pk,
+                'numero_ticket': ticket.numero_ticket,
+                'monto_aplicado': aplicado,
+                'saldo': ticket.saldo - aplicado,
+            })
+
+        # bulk_create no llama a Pago.save(): numero_pago y snapshot ya van asignados
+        Pago.objects.bulk_create(pagos)
+
+        por_sede = {}
+        for pago in pagos:
+            TicketService.aplicar_delta_financiero(
+                pago.ticket_id, delta_pagado=pago.monto, fecha_pago=pago.fecha_pago
+            )
+            clave = (pago.ticket.sede_id, CajaService.codigo_pago(pago))
+            por_sede[clave] = por_sede.get(clave, Decimal('0')) + pago.monto
+        for (sede_id, codigo), total in por_sede.items():
+            CajaService.acumular(caja_abierta.pk, sede_id, codigo, ventas=total)
+        VentasDiariasService.acumular_pagos(pagos)
+
+    return pagos, saldos
+
+
+def propagar_pago(pago, signo=1):
+    """
+    Propaga un pago (signo=1) o su anulación (signo=-1) a los acumulados denormalizados.
+    Debe ejecutarse dentro de la misma transacción que crea/anula el pago.
+    """
+    from tickets.services import TicketService
+    TicketService.aplicar_delta_financiero(
+        pago.ticket_id, delta_pagado=signo * pago.monto, fecha_pago=pago.fecha_pago
+    )
+    CajaService.acumular_pago(pago, signo)
+    VentasDiariasService.acumular_pagos([pago], signo)
+
+
+def registrar_movimiento(user, caja, tipo, monto, metodo_config=None, descripcion='', categoria='GENERAL'):
+    """Registra un ingreso/egreso manual y lo suma a los saldos corrientes de la caja"""
+    if tipo not in ('INGRESO', 'EGRESO'):
+        raise serializers.ValidationError({'error': 'Tipo de movimiento inválido.'})
+    try:
+        monto = Decimal(str(monto))
+    except InvalidOperation:
+        raise serializers.ValidationError({'error': 'Monto inválido.'})
+    with transaction.atomic():
+        if not _bloquear_caja_abierta(pk=caja.pk):
+            raise serializers.ValidationError({'error': 'Caja cerrada'})
+        movimiento = MovimientoCaja.objects.create(
+            caja=caja,
+            empresa=caja.empresa,
+            tipo=tipo,
+            monto=monto,
+            metodo_pago_config=metodo_config,
+            descripcion=descripcion,
+            categoria=categoria,
+            creado_por=user
+        )
+        CajaService.acumular_movimiento(movimiento)
+    return movimiento
+
+
+def anular_pago(pago):
+    """
+    Anula (extorna) un pago y devuelve el monto al saldo del ticket.
+    Bloquea la fila del pago para que dos extornos simultáneos no descuenten dos veces,
+    y la de su caja para no extornar sobre un cierre ya congelado.
+    """
+    with transaction.atomic():
+        locked_pago = Pago.objects.select_for_update().get(pk=pago.pk)
+        if locked_pago.estado == 'ANULADO':
+            raise serializers.ValidationError({'error': 'El pago ya se encuentra anulado.'})
+        if locked_pago.caja_id and CajaSesion.objects.select_for_update().filter(
+            pk=locked_pago.caja_id, estado='CERRADA'
+        ).exists():
+            raise serializers.ValidationError({'error': 'La caja del pago ya está cerrada.'})
+
+        locked_pago.estado = 'ANULADO'
+        locked_pago.save()
+        propagar_pago(locked_pago, signo=-1)
+
+    pago.estado = locked_pago.estado
+    return locked_pago
+
 class CajaService:
     @staticmethod
     def _format_pago_event(p):
@@ -146,203 +324,504 @@ class CajaService:
             return comment.split(' | Detalle Cierre:')[0].strip()
         return comment.strip()
 
+    # Pagos sin método configurado (históricos): código deducido del snapshot, en este orden
+    CODIGOS_SNAPSHOT = ('EFECTIVO', 'YAPE', 'PLIN', 'TARJETA', 'TRANSFERENCIA')
+
     @staticmethod
-    def build_timeline_events(caja):
-        events = []
-        
-        # 1. Apertura
-        apertura_detalle = CajaService._ensure_dict(caja.detalle_apertura)
-        if 'EFECTIVO' not in apertura_detalle:
-            apertura_detalle['EFECTIVO'] = float(caja.monto_inicial)
-        
+    def codigo_pago(pago):
+        if pago.metodo_pago_config_id:
+            return pago.metodo_pago_config.codigo_metodo
+        snapshot = (pago.metodo_pago_snapshot or '').upper()
+        return next((c for c in CajaService.CODIGOS_SNAPSHOT if c in snapshot), 'OTROS')
+
+    @staticmethod
+    def codigo_movimiento(movimiento):
+        return movimiento.metodo_pago_config.codigo_metodo if movimiento.metodo_pago_config_id else 'EFECTIVO'
+
+    @staticmethod
+    def _codigo_pago_sql():
+        """Equivalente en SQL de codigo_pago()"""
+        return Case(
+            When(metodo_pago_config__isnull=False, then=F('metodo_pago_config__codigo_metodo')),
+            *[When(metodo_pago_snapshot__icontains=codigo, then=Value(codigo)) for codigo in CajaService.CODIGOS_SNAPSHOT],
+            default=Value('OTROS'),
+            output_field=CharField()
+        )
+
+    # --- Saldos corrientes (CajaSaldoMetodo) ---
+
+    @staticmethod
+    def acumular(caja_id, sede_id, codigo, ventas=0, ingresos=0, egresos=0):
+        """
+        Suma deltas a la fila (caja, sede, código) con un UPDATE atómico (F()); si la fila
+        aún no existe la crea. Debe ejecutarse en la misma transacción que el pago/movimiento.
+        """
+        deltas = {
+            'ventas': Decimal(str(ventas or 0)),
+            'ingresos': Decimal(str(ingresos or 0)),
+            'egresos': Decimal(str(egresos or 0)),
+        }
+        if not any(deltas.values()):
+            return
+        filas = CajaSaldoMetodo.objects.filter(caja_id=caja_id, sede_id=sede_id, codigo=codigo)
+        cambios = {campo: F(campo) + valor for campo, valor in deltas.items()}
+        if filas.update(**cambios):
+            return
+        try:
+            with transaction.atomic():
+                CajaSaldoMetodo.objects.create(caja_id=caja_id, sede_id=sede_id, codigo=codigo, **deltas)
+        except IntegrityError:
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            filas.update(**cambios)
+
+    @staticmethod
+    def acumular_pago(pago, signo=1):
+        if not pago.caja_id:
+            return
+        CajaService.acumular(
+            pago.caja_id, CajaService.sede_pago(pago), CajaService.codigo_pago(pago), ventas=signo * pago.monto
+        )
+
+    @staticmethod
+    def sede_pago(pago):
+        """Sede del ticket del pago, sin consulta si el ticket ya está cargado"""
+        from tickets.models import Ticket
+        if Pago.ticket.is_cached(pago):
+            return pago.ticket.sede_id
+        return Ticket.objects.filter(pk=pago.ticket_id).values_list('sede_id', flat=True).first()
+
+    @staticmethod
+    def acumular_movimiento(movimiento):
+        campo = 'ingresos' if movimiento.tipo == 'INGRESO' else 'egresos'
+        CajaService.acumular(
+            movimiento.caja_id, None, CajaService.codigo_movimiento(movimiento), **{campo: movimiento.monto}
+        )
+
+    @staticmethod
+    def calcular_saldos(caja_ids, registro=None):
+        """
+        Recalcula los saldos desde las filas crudas en UNA consulta: pagos PAGADO y movimientos
+        agrupados por (caja, sede, código) con UNION ALL.
+        Devuelve {(caja_id, sede_id, codigo): {'ventas', 'ingresos', 'egresos'}}.
+        """
+        registro = registro or apps
+        Pago = registro.get_model('pagos', 'Pago')
+        MovimientoCaja = registro.get_model('pagos', 'MovimientoCaja')
+
+        pagos = Pago.objects.filter(caja_id__in=caja_ids, estado='PAGADO').order_by().annotate(
+            origen=Value('VENTA', output_field=CharField()), codigo=CajaService._codigo_pago_sql()
+        ).values_list('caja_id', 'ticket__sede_id', 'origen', 'codigo').annotate(total=Sum('monto'))
+        movimientos = MovimientoCaja.objects.filter(caja_id__in=caja_ids).order_by().annotate(
+            sin_sede=Value(None, output_field=IntegerField()),
+            codigo=Coalesce('metodo_pago_config__codigo_metodo', Value('EFECTIVO'), output_field=CharField())
+        ).values_list('caja_id', 'sin_sede', 'tipo', 'codigo').annotate(total=Sum('monto'))
+
+        campos = {'VENTA': 'ventas', 'INGRESO': 'ingresos', 'EGRESO': 'egresos'}
+        saldos = {}
+        for caja_id, sede_id, origen, codigo, total in pagos.union(movimientos, all=True):
+            fila = saldos.setdefault((caja_id, sede_id, codigo), {c: Decimal(0) for c in campos.values()})
+            fila[campos[origen]] += Decimal(str(total or 0)).quantize(Decimal('0.01'))
+        return saldos
+
+    @staticmethod
+    def reconstruir_saldos(caja_ids, registro=None):
+        """Reemplaza los saldos corrientes de las cajas por los recalculados (backfill / corrección)"""
+        registro = registro or apps
+        CajaSaldoMetodo = registro.get_model('pagos', 'CajaSaldoMetodo')
+        saldos = CajaService.calcular_saldos(caja_ids, registro=registro)
+        with transaction.atomic():
+            CajaSaldoMetodo.objects.filter(caja_id__in=caja_ids).delete()
+            CajaSaldoMetodo.objects.bulk_create([
+                CajaSaldoMetodo(caja_id=caja_id, sede_id=sede_id, codigo=codigo, **valores)
+                for (caja_id, sede_id, codigo), valores in saldos.items()
+            ])
+        return len(saldos)
+
+    @staticmethod
+    def verificar_saldos(caja_ids):
+        """
+        Compara los saldos corrientes con los recalculados.
+        Devuelve [(caja_id, sede_id, codigo, campo, registrado, esperado)] con las diferencias.
+        """
+        esperados = CajaService.calcular_saldos(caja_ids)
+        registrados = {
+            (s.caja_id, s.sede_id, s.codigo): {'ventas': s.ventas, 'ingresos': s.ingresos, 'egresos': s.egresos}
+            for s in CajaSaldoMetodo.objects.filter(caja_id__in=caja_ids)
+        }
+        cero = {'ventas': Decimal(0), 'ingresos': Decimal(0), 'egresos': Decimal(0)}
+        diferencias = []
+        for clave in sorted(set(esperados) | set(registrados), key=lambda c: (c[0], c[1] or 0, c[2])):
+            esperado = esperados.get(clave, cero)
+            registrado = registrados.get(clave, cero)
+            for campo in ('ventas', 'ingresos', 'egresos'):
+                if registrado[campo] != esperado[campo]:
+                    diferencias.append((*clave, campo, registrado[campo], esperado[campo]))
+        return diferencias
+
+    # --- Resumen de sesión ---
+
+    @staticmethod
+    def _leer_saldos(caja_ids):
+        """Filas de CajaSaldoMetodo por caja: [(sede_id, codigo, ventas, ingresos, egresos), ...]"""
+        saldos = {pk: [] for pk in caja_ids}
+        for caja_id, *fila in CajaSaldoMetodo.objects.filter(caja_id__in=caja_ids).values_list(
+            'caja_id', 'sede_id', 'codigo', 'ventas', 'ingresos', 'egresos'
+        ):
+            saldos[caja_id].append(fila)
+        return saldos
+
+    @staticmethod
+    def _filas_resumen(saldos, sede_id=None):
+        """(origen, código, total) para _armar_resumen; con sede, las ventas se limitan a esa sede"""
+        filas = []
+        for sede_fila, codigo, ventas, ingresos, egresos in saldos:
+            if ventas and (sede_id is None or sede_fila == sede_id):
+                filas.append(('VENTA', codigo, ventas))
+            if ingresos:
+                filas.append(('INGRESO', codigo, ingresos))
+            if egresos:
+                filas.append(('EGRESO', codigo, egresos))
+        return filas
+
+    @staticmethod
+    def precargar_resumenes(cajas, sede=None):
+        """
+        Arma el resumen de varias sesiones leyendo solo sus filas de CajaSaldoMetodo
+        (una consulta). Con sede, las ventas se limitan a tickets de esa sede.
+        Las sesiones cerradas con resumen congelado no consultan nada.
+        Cada resumen queda memorizado en la instancia (por sede) para resumen_sesion().
+        """
+        sede_id = sede.id if sede else None
+        pendientes = {}
+        for caja in cajas:
+            if sede_id in getattr(caja, '_resumenes_caja', {}):
+                continue
+            if not hasattr(caja, '_resumenes_caja'):
+                caja._resumenes_caja = {}
+            if caja.estado == 'CERRADA' and caja.resumen_cierre:
+                caja._resumenes_caja[sede_id] = CajaService._leer_resumen_congelado(caja.resumen_cierre, sede_id)
+            else:
+                pendientes[caja.pk] = caja
+        if not pendientes:
+            return
+
+        saldos = CajaService._leer_saldos(list(pendientes))
+        for pk, caja in pendientes.items():
+            caja._resumenes_caja[sede_id] = CajaService._armar_resumen(
+                caja, CajaService._filas_resumen(saldos[pk], sede_id)
+            )
+
+    # --- Resumen congelado al cierre ---
+
+    @staticmethod
+    def _resumen_a_json(resumen):
+        datos = {campo: str(valor) for campo, valor in resumen.items() if campo != 'desglose_pagos'}
+        datos['desglose_pagos'] = {codigo: str(valor) for codigo, valor in resumen['desglose_pagos'].items()}
+        return datos
+
+    @staticmethod
+    def _leer_resumen_congelado(congelado, sede_id=None):
+        """
+        Resumen de una sesión cerrada. Las sedes sin ventas en la sesión usan la
+        variante 'sin_ventas' (apertura y movimientos, ventas en cero).
+        """
+        if sede_id is None:
+            datos = congelado['todas']
+        else:
+            datos = congelado['sedes'].get(str(sede_id), congelado['sin_ventas'])
+        resumen = {campo: Decimal(valor) for campo, valor in datos.items() if campo != 'desglose_pagos'}
+        resumen['desglose_pagos'] = {codigo: Decimal(valor) for codigo, valor in datos['desglose_pagos'].items()}
+        return resumen
+
+    @staticmethod
+    def congelar_resumenes(cajas):
+        """
+        Calcula y asigna (sin guardar) `resumen_cierre` de cada sesión: el total y la
+        variante por cada sede con ventas. Una sola consulta para todas las sesiones.
+        """
+        saldos = CajaService._leer_saldos([c.pk for c in cajas])
+        for caja in cajas:
+            filas = saldos[caja.pk]
+            sedes = {sede_id for sede_id, _, ventas, _, _ in filas if ventas and sede_id is not None}
+            caja.resumen_cierre = {
+                'todas': CajaService._resumen_a_json(
+                    CajaService._armar_resumen(caja, CajaService._filas_resumen(filas))
+                ),
+                'sedes': {
+                    str(sede_id): CajaService._resumen_a_json(
+                        CajaService._armar_resumen(caja, CajaService._filas_resumen(filas, sede_id))
+                    )
+                    for sede_id in sedes
+                },
+                # Una sede que no coincide con ninguna fila de ventas (-1) deja solo apertura y movimientos
+                'sin_ventas': CajaService._resumen_a_json(
+                    CajaService._armar_resumen(caja, CajaService._filas_resumen(filas, -1))
+                ),
+            }
+            caja._resumenes_caja = {}
+
+    @staticmethod
+    def _armar_resumen(caja, filas):
+        """Efectivo: código EFECTIVO (movimientos sin método cuentan como efectivo); el resto es digital"""
+        monto_inicial = Decimal(str(caja.monto_inicial or 0))
+        desglose = {'EFECTIVO': monto_inicial}
+        total_efectivo = monto_inicial
+        total_digital = Decimal(0)
+        for codigo, valor in CajaService._ensure_dict(caja.detalle_apertura).items():
+            if codigo != 'EFECTIVO':
+                valor = Decimal(str(valor or 0))
+                desglose[codigo] = desglose.get(codigo, Decimal(0)) + valor
+                total_digital += valor
+
+        total_ventas = Decimal(0)
+        total_gastos = Decimal(0)
+        for origen, codigo, total in filas:
+            if origen == 'VENTA':
+                total_ventas += total
+            elif origen == 'EGRESO':
+                total_gastos += total
+                total = -total
+            desglose[codigo] = desglose.get(codigo, Decimal(0)) + total
+            if codigo == 'EFECTIVO':
+                total_efectivo += total
+            else:
+                total_digital += total
+
+        return {
+            'total_ventas': total_ventas,
+            'total_gastos': total_gastos,
+            'total_efectivo': total_efectivo,
+            'total_digital': total_digital,
+            'saldo_actual': total_efectivo + total_digital,
+            'desglose_pagos': desglose,
+        }
+
+    @staticmethod
+    def resumen_sesion(caja, sede=None):
+        """Totales de la sesión de caja (memorizados en la instancia por sede)"""
+        CajaService.precargar_resumenes([caja], sede)
+        return caja._resumenes_caja[sede.id if sede else None]
+
+    @staticmethod
+    def _format_apertura_event(c, descripcion='Apertura de Caja'):
+        detalle = CajaService._ensure_dict(c.detalle_apertura)
+        if 'EFECTIVO' not in detalle:
+            detalle['EFECTIVO'] = float(c.monto_inicial)
+
         # Solo mostrar COMENTARIOS en apertura si existen dentro del detalle específico de apertura
         # (Actualmente el frontend no los envía, por lo que aparecerá limpio/vacío como debe ser)
-        if 'comentarios' in apertura_detalle:
-            apertura_detalle['COMENTARIOS'] = apertura_detalle['comentarios']
-            
-        events.append({
-            'id': f'apertura-{caja.id}',
-            'hora_raw': caja.fecha_apertura,
+        if 'comentarios' in detalle:
+            detalle['COMENTARIOS'] = detalle['comentarios']
+
+        return {
+            'id': f'apertura-{c.id}',
+            'hora_raw': c.fecha_apertura,
             'tipo_evento': 'APERTURA',
-            'fecha': caja.fecha_apertura,
-            'monto': caja.monto_inicial,
-            'descripcion': f'Apertura de Caja (ID: {caja.id})',
-            'usuario': caja.usuario.username,
+            'fecha': c.fecha_apertura,
+            'monto': c.monto_inicial,
+            'descripcion': descripcion,
+            'usuario': c.usuario.username,
             'es_entrada': True,
             'estado': 'OK',
-            'detalles': apertura_detalle
-        })
-        
-        # 2. Pagos
-        pagos = Pago.objects.filter(caja=caja).select_related('ticket', 'ticket__cliente', 'metodo_pago_config')
-        for p in pagos:
-            events.append(CajaService._format_pago_event(p))
-            
-        # 3. Movimientos
-        movimientos = caja.movimientos_extra.all().select_related('metodo_pago_config')
-        for m in movimientos:
-            events.append(CajaService._format_movimiento_event(m))
-            
-        # 4. Cierre
-        if caja.fecha_cierre and caja.estado == 'CERRADA':
-            cierre_detalle = CajaService._ensure_dict(caja.detalle_cierre)
-            cierre_detalle_filtrado = {k: v for k, v in cierre_detalle.items() if k not in ['TRANSFERENCIA', 'comentarios']}
-            
-            # Para el cierre, priorizar el campo comentarios de la sesión (donde se guarda el cierre)
-            if caja.comentarios:
-                cierre_detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(caja.comentarios)
-            elif 'comentarios' in cierre_detalle:
-                 cierre_detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(cierre_detalle['comentarios'])
-            
-            events.append({
-                'id': f'cierre-{caja.id}',
-                'hora_raw': caja.fecha_cierre,
-                'tipo_evento': 'CIERRE',
-                'fecha': caja.fecha_cierre,
-                'monto': caja.monto_final_real or 0,
-                'descripcion': f'Cierre de Caja (Dif: {caja.diferencia})',
-                'usuario': caja.usuario.username,
-                'es_entrada': None, 
-                'estado': 'OK',
-                'detalles': cierre_detalle_filtrado
-            })
-        return events
+            'detalles': detalle
+        }
 
     @staticmethod
-    def get_diario_events(empresa, sede, start_aware, end_aware):
-        events = []
-        
-        # 1. Pagos
+    def _format_cierre_event(c, descripcion='Cierre de Caja'):
+        detalle = CajaService._ensure_dict(c.detalle_cierre)
+        detalle_filtrado = {k: v for k, v in detalle.items() if k not in ['TRANSFERENCIA', 'comentarios']}
+
+        # Para el cierre, priorizar el campo comentarios de la sesión (donde se guarda el cierre)
+        if c.comentarios:
+            detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(c.comentarios)
+        elif 'comentarios' in detalle:
+            detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(detalle['comentarios'])
+
+        return {
+            'id': f'cierre-{c.id}',
+            'hora_raw': c.fecha_cierre,
+            'tipo_evento': 'CIERRE',
+            'fecha': c.fecha_cierre,
+            'monto': c.monto_final_real or 0,
+            'descripcion': descripcion,
+            'usuario': c.usuario.username,
+            'es_entrada': None,
+            'estado': 'OK',
+            'detalles': detalle_filtrado
+        }
+
+    @staticmethod
+    def fuentes_timeline(caja):
+        """Fuentes de diario.recorrer para la línea de tiempo de una sesión"""
+        sesion = CajaSesion.objects.filter(pk=caja.pk).select_related('usuario')
+        return [
+            (Pago.objects.filter(caja=caja).select_related(
+                'ticket', 'ticket__cliente', 'metodo_pago_config', 'creado_por'
+            ), 'fecha_pago', CajaService._format_pago_event),
+            (caja.movimientos_extra.select_related('metodo_pago_config', 'creado_por'),
+             'creado_en', CajaService._format_movimiento_event),
+            (sesion, 'fecha_apertura',
+             lambda c: CajaService._format_apertura_event(c, f'Apertura de Caja (ID: {c.id})')),
+            (sesion.filter(estado='CERRADA', fecha_cierre__isnull=False), 'fecha_cierre',
+             lambda c: CajaService._format_cierre_event(c, f'Cierre de Caja (Dif: {c.diferencia})')),
+        ]
+
+    @staticmethod
+    def fuentes_diario(empresa, sede, start_aware, end_aware):
+        """Fuentes de diario.recorrer para el diario de la empresa/sede en un rango"""
         pagos = Pago.objects.filter(
-            empresa=empresa,
-            fecha_pago__gte=start_aware,
-            fecha_pago__lte=end_aware
+            empresa=empresa, fecha_pago__gte=start_aware, fecha_pago__lte=end_aware
         ).select_related('ticket', 'creado_por', 'ticket__cliente', 'metodo_pago_config')
-        
-        if sede:
-            pagos = pagos.filter(ticket__sede=sede)
-        
-        for p in pagos:
-            desc = f"Pago Ticket #{p.ticket.numero_ticket}"
-            if p.estado == 'ANULADO': desc += " (ANULADO)"
-            
-            cliente_nombre = p.ticket.cliente.nombre_completo if p.ticket.cliente else "N/A"
-            metodo_nombre = p.metodo_pago_snapshot or (p.metodo_pago_config.nombre_mostrar if p.metodo_pago_config else "N/A")
-            
-            events.append({
-                'id': f'pago-{p.id}',
-                'hora_raw': p.fecha_pago,
-                'tipo_evento': 'VENTA',
-                'fecha': p.fecha_pago,
-                'monto': p.monto,
-                'descripcion': desc,
-                'usuario': p.creado_por.username if p.creado_por else 'Sistema',
-                'es_entrada': True,
-                'estado': p.estado,
-                'detalles': {
-                    'MÉTODO': metodo_nombre,
-                    'TICKET': p.ticket.numero_ticket,
-                    'CLIENTE': cliente_nombre
-                }
-            })
-
-        # 2. Movimientos
         movimientos = MovimientoCaja.objects.filter(
-            empresa=empresa,
-            creado_en__gte=start_aware,
-            creado_en__lte=end_aware
+            empresa=empresa, creado_en__gte=start_aware, creado_en__lte=end_aware
         ).select_related('creado_por', 'metodo_pago_config')
-        
-        if sede:
-            movimientos = movimientos.filter(caja__sede=sede)
-        
-        for m in movimientos:
-            tipo_texto = "Gasto" if m.tipo == 'EGRESO' else "Ingreso"
-            desc = f"{tipo_texto} - {m.categoria}: {m.descripcion}"
-            metodo_nombre = m.metodo_pago_config.nombre_mostrar if m.metodo_pago_config else "EFECTIVO"
-            
-            events.append({
-                'id': f'mov-{m.id}',
-                'hora_raw': m.creado_en,
-                'tipo_evento': m.tipo,
-                'fecha': m.creado_en,
-                'monto': m.monto,
-                'descripcion': desc,
-                'usuario': m.creado_por.username if m.creado_por else 'Sistema',
-                'es_entrada': m.tipo == 'INGRESO',
-                'estado': 'OK',
-                'detalles': {
-                    'TIPO': tipo_texto.upper(),
-                    'CATEGORÍA': m.categoria,
-                    'MÉTODO': metodo_nombre,
-                    'NOTA': m.descripcion
-                }
-            })
-
-        # 3. Aperturas
         aperturas = CajaSesion.objects.filter(
-            empresa=empresa,
-            fecha_apertura__gte=start_aware,
-            fecha_apertura__lte=end_aware
+            empresa=empresa, fecha_apertura__gte=start_aware, fecha_apertura__lte=end_aware
         ).select_related('usuario')
-        
+        cierres = CajaSesion.objects.filter(
+            empresa=empresa, fecha_cierre__gte=start_aware, fecha_cierre__lte=end_aware, estado='CERRADA'
+        ).select_related('usuario')
+
         if sede:
+            pagos = pagos.filter(ticket__sede=sede)
+            movimientos = movimientos.filter(caja__sede=sede)
             aperturas = aperturas.filter(sede=sede)
+            cierres = cierres.filter(sede=sede)
 
-        for c in aperturas:
-            detalle = CajaService._ensure_dict(c.detalle_apertura)
-            if 'EFECTIVO' not in detalle:
-                detalle['EFECTIVO'] = float(c.monto_inicial)
-            
-            # Solo mostrar comentarios en apertura si están en su detalle
-            if 'comentarios' in detalle:
-                detalle['COMENTARIOS'] = detalle['comentarios']
-                
-            events.append({
-                'id': f'apertura-{c.id}',
-                'hora_raw': c.fecha_apertura,
-                'tipo_evento': 'APERTURA',
-                'fecha': c.fecha_apertura,
-                'monto': c.monto_inicial,
-                'descripcion': f'Apertura de Caja',
-                'usuario': c.usuario.username,
-                'es_entrada': True,
-                'estado': 'OK',
-                'detalles': detalle
-            })
+        return [
+            (pagos, 'fecha_pago', CajaService._format_pago_event),
+            (movimientos, 'creado_en', CajaService._format_movimiento_event),
+            (aperturas, 'fecha_apertura', CajaService._format_apertura_event),
+            (cierres, 'fecha_cierre', CajaService._format_cierre_event),
+        ]
 
-        # 4. Cierres
-        cierres = CajaSesion.objects.filter(
-            empresa=empresa,
-            fecha_cierre__gte=start_aware,
-            fecha_cierre__lte=end_aware,
-            estado='CERRADA'
-        ).select_related('usuario')
-        
+    @staticmethod
+    def build_timeline_events(caja):
+        """Eventos de la sesión ya ordenados por hora"""
+        return diario.eventos(CajaService.fuentes_timeline(caja))
+
+    @staticmethod
+    def get_diario_events(empresa, sede, start_aware, end_aware):
+        """Eventos del rango ya ordenados por hora"""
+        return diario.eventos(CajaService.fuentes_diario(empresa, sede, start_aware, end_aware))
+
+
+class VentasDiariasService:
+    """Acumulado de ventas por día (VentasDiarias): mantenimiento incremental, reconstrucción y lecturas"""
+
+    @staticmethod
+    def acumular(empresa_id, sede_id, fecha, codigo, total, cantidad):
+        """UPDATE atómico (F()) de la fila del día; si aún no existe la crea"""
+        filas = VentasDiarias.objects.filter(empresa_id=empresa_id, sede_id=sede_id, fecha=fecha, codigo=codigo)
+        cambios = {'total': F('total') + total, 'cantidad': F('cantidad') + cantidad}
+        if filas.update(**cambios):
+            return
+        try:
+            with transaction.atomic():
+                VentasDiarias.objects.create(
+                    empresa_id=empresa_id, sede_id=sede_id, fecha=fecha, codigo=codigo, total=total, cantidad=cantidad
+                )
+        except IntegrityError:
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            filas.update(**cambios)
+
+    @staticmethod
+    def acumular_pagos(pagos, signo=1):
+        """Suma (signo=1) o descuenta (signo=-1) pagos; una escritura por (sede, día, método)"""
+        deltas = {}
+        for pago in pagos:
+            clave = (
+                pago.empresa_id, CajaService.sede_pago(pago),
+                timezone.localdate(pago.fecha_pago), CajaService.codigo_pago(pago)
+            )
+            total, cantidad = deltas.get(clave, (Decimal(0), 0))
+            deltas[clave] = (total + signo * Decimal(str(pago.monto)), cantidad + signo)
+        for (empresa_id, sede_id, fecha, codigo), (total, cantidad) in deltas.items():
+            VentasDiariasService.acumular(empresa_id, sede_id, fecha, codigo, total, cantidad)
+
+    @staticmethod
+    def _rango_aware(desde=None, hasta=None):
+        inicio = timezone.make_aware(datetime.combine(desde, time.min)) if desde else None
+        fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)) if hasta else None
+        return inicio, fin
+
+    @staticmethod
+    def calcular(empresa_id=None, desde=None, hasta=None, registro=None):
+        """
+        Recalcula desde los pagos PAGADO en una consulta agrupada por (empresa, sede, día, código).
+        Devuelve {(empresa_id, sede_id, fecha, codigo): (total, cantidad)}.
+        """
+        registro = registro or apps
+        Pago = registro.get_model('pagos', 'Pago')
+        pagos = Pago.objects.filter(estado='PAGADO')
+        if empresa_id:
+            pagos = pagos.filter(empresa_id=empresa_id)
+        inicio, fin = VentasDiariasService._rango_aware(desde, hasta)
+        if inicio:
+            pagos = pagos.filter(fecha_pago__gte=inicio)
+        if fin:
+            pagos = pagos.filter(fecha_pago__lt=fin)
+
+        filas = pagos.order_by().annotate(
+            dia=TruncDate('fecha_pago'), codigo=CajaService._codigo_pago_sql()
+        ).values_list('empresa_id', 'ticket__sede_id', 'dia', 'codigo').annotate(
+            total=Sum('monto'), cantidad=Count('id')
+        )
+        return {
+            (empresa, sede, dia, codigo): (Decimal(str(total or 0)).quantize(Decimal('0.01')), cantidad)
+            for empresa, sede, dia, codigo, total, cantidad in filas
+        }
+
+    @staticmethod
+    def reconstruir(empresa_id=None, desde=None, hasta=None, registro=None):
+        """Reemplaza las filas del rango por las recalculadas (backfill / corrección). Devuelve cuántas quedan"""
+        registro = registro or apps
+        VentasDiarias = registro.get_model('pagos', 'VentasDiarias')
+        ventas = VentasDiariasService.calcular(empresa_id, desde, hasta, registro=registro)
+        existentes = VentasDiarias.objects.all()
+        if empresa_id:
+            existentes = existentes.filter(empresa_id=empresa_id)
+        if desde:
+            existentes = existentes.filter(fecha__gte=desde)
+        if hasta:
+            existentes = existentes.filter(fecha__lte=hasta)
+        with transaction.atomic():
+            existentes.delete()
+            VentasDiarias.objects.bulk_create([
+                VentasDiarias(empresa_id=empresa, sede_id=sede, fecha=dia, codigo=codigo, total=total, cantidad=cantidad)
+                for (empresa, sede, dia, codigo), (total, cantidad) in ventas.items()
+            ], batch_size=1000)
+        return len(ventas)
+
+    @staticmethod
+    def filas(empresa, sede=None, desde=None, hasta=None):
+        qs = VentasDiarias.objects.filter(empresa=empresa)
         if sede:
-            cierres = cierres.filter(sede=sede)
+            qs = qs.filter(sede=sede)
+        if desde:
+            qs = qs.filter(fecha__gte=desde)
+        if hasta:
+            qs = qs.filter(fecha__lte=hasta)
+        return qs
 
-        for c in cierres:
-            detalle = CajaService._ensure_dict(c.detalle_cierre)
-            detalle_filtrado = {k: v for k, v in detalle.items() if k not in ['TRANSFERENCIA', 'comentarios']}
-            
-            # Priorizar el campo comentarios de la sesión para el cierre
-            if c.comentarios:
-                detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(c.comentarios)
-            elif 'comentarios' in detalle:
-                detalle_filtrado['COMENTARIOS'] = CajaService._clean_comment(detalle['comentarios'])
-            
-            events.append({
-                'id': f'cierre-{c.id}',
-                'hora_raw': c.fecha_cierre,
-                'tipo_evento': 'CIERRE',
-                'fecha': c.fecha_cierre,
-                'monto': c.monto_final_real or 0,
-                'descripcion': f'Cierre de Caja',
-                'usuario': c.usuario.username,
-                'es_entrada': None,
-                'estado': 'OK',
-                'detalles': detalle_filtrado
-            })
+    @staticmethod
+    def total(empresa, sede=None, desde=None, hasta=None):
+        return VentasDiariasService.filas(empresa, sede, desde, hasta).aggregate(t=Sum('total'))['t'] or Decimal(0)
 
-        return events
+    @staticmethod
+    def por_dia(empresa, sede=None, desde=None, hasta=None):
+        """[{'fecha', 'total'}] de los días con al menos un pago vigente, en orden"""
+        return list(
+            VentasDiariasService.filas(empresa, sede, desde, hasta).order_by().values('fecha').annotate(
+                total=Sum('total'), pagos=Sum('cantidad')
+            ).filter(pagos__gt=0).order_by('fecha').values('fecha', 'total')
+        )
+
+    @staticmethod
+    def por_metodo(empresa, sede=None, desde=None, hasta=None):
+        """[{'codigo', 'total'}] del rango, de mayor a menor"""
+        return list(
+            VentasDiariasService.filas(empresa, sede, desde, hasta).order_by().values('codigo').annotate(
+                total=Sum('total'), pagos=Sum('cantidad')
+            ).filter(pagos__gt=0).order_by('-total').values('codigo', 'total')
+        )
@@ -0,0 +1,11 @@
+"""
+Tareas asíncronas para la app pagos
+"""
+from celery import shared_task
+
+
+@shared_task
+def limpiar_claves_idempotencia():
+    """Elimina las claves de idempotencia vencidas. Programada en el beat diario."""
+    from .idempotencia import limpiar_expiradas
+    return limpiar_expiradas()
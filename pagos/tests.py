@@ -1,8 +1,11 @@
-from rest_framework import status
+import time
+from rest_framework import serializers, status
+from django.test import TransactionTestCase, skipUnlessDBFeature
 from django.utils import timezone
 from core.test_utils import BaseTenantAPITestCase
 from pagos.models import MetodoPagoConfig, CajaSesion, Pago
 from tickets.models import Cliente, Ticket
+from pagos.services import CajaService, anular_pago, registrar_movimiento, registrar_pago
 
 class PagosAPITestCase(BaseTenantAPITestCase):
     def setUp(self):
@@ -84,3 +87,833 @@ class PagosAPITestCase(BaseTenantAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         results = response.data['results'] if 'results' in response.data else response.data
         self.assertEqual(len(results), 0)
+
+
+class PagoEscrituraTestCase(BaseTenantAPITestCase):
+    """Los pagos solo cambian vía servicios: PUT/PATCH/DELETE no pueden desalinear los acumulados"""
+
+    def setUp(self):
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+        super().setUp()
+        efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="44444444", nombres="Leo")
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=cliente, fecha_prometida=timezone.now()
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=servicio, cantidad=1, precio_unitario=100)
+        self.caja = CajaSesion.objects.create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=0
+        )
+        self.pago = registrar_pago(self.cajero_user, self.empresa, self.ticket, 40, metodo_pago_id=efectivo.id)
+        self.authenticate(self.cajero_user)
+
+    def _intentar_modificar(self):
+        url = f'/api/pagos/{self.pago.id}/'
+        respuestas = [
+            self.client.patch(url, {'estado': 'ANULADO'}, format='json'),
+            self.client.patch(url, {'monto': 1}, format='json'),
+            self.client.put(url, {'ticket': self.ticket.id, 'monto': 1, 'estado': 'ANULADO'}, format='json'),
+            self.client.delete(url),
+        ]
+        self.assertEqual({r.status_code for r in respuestas}, {status.HTTP_405_METHOD_NOT_ALLOWED})
+        self.pago.refresh_from_db()
+        self.assertEqual((self.pago.estado, self.pago.monto), ('PAGADO', 40))
+
+    def test_ticket_conserva_su_libro(self):
+        self._intentar_modificar()
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.total_pagado, self.ticket.saldo), (40, 60))
+
+    def test_saldos_de_caja_no_se_desalinean(self):
+        self._intentar_modificar()
+        self.assertEqual(CajaService.verificar_saldos([self.caja.id]), [])
+        self.assertEqual(CajaService.resumen_sesion(CajaSesion.objects.get(pk=self.caja.pk))['total_ventas'], 40)
+
+    def test_admin_no_altera_movimientos(self):
+        from django.contrib.admin.sites import site
+        from django.contrib.auth.models import User
+        from django.test import RequestFactory
+        from .models import MovimientoCaja
+        registrar_movimiento(self.cajero_user, self.caja, tipo='EGRESO', monto=15, descripcion='Detergente')
+        movimiento = MovimientoCaja.objects.get(caja=self.caja)
+        request = RequestFactory().get('/admin/')
+        request.user = User.objects.create_superuser(username="admin_caja", password="x", email="a@test.com")
+
+        for modelo, objeto, campos in (
+            (MovimientoCaja, movimiento, {'caja', 'tipo', 'monto', 'metodo_pago_config'}),
+            (Pago, self.pago, {'ticket', 'caja', 'monto', 'estado'}),
+        ):
+            model_admin = site._registry[modelo]
+            self.assertFalse(model_admin.has_add_permission(request))
+            self.assertFalse(model_admin.has_delete_permission(request, objeto))
+            self.assertTrue(campos <= set(model_admin.get_readonly_fields(request, objeto)))
+
+    def test_ventas_diarias_no_se_desalinean(self):
+        from .models import VentasDiarias
+        from .services import VentasDiariasService
+        self._intentar_modificar()
+        filas = {
+            (v.empresa_id, v.sede_id, v.fecha, v.codigo): (v.total, v.cantidad)
+            for v in VentasDiarias.objects.filter(empresa=self.empresa)
+        }
+        self.assertEqual(list(filas.values()), [(40, 1)])
+        self.assertEqual(filas, VentasDiariasService.calcular(self.empresa.id))
+
+    def test_anulacion_sigue_pasando_por_el_servicio(self):
+        from .models import VentasDiarias
+        self.assertEqual(self.client.post(f'/api/pagos/{self.pago.id}/anular/').status_code, status.HTTP_200_OK)
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.total_pagado, self.ticket.saldo), (0, 100))
+        self.assertEqual(CajaService.verificar_saldos([self.caja.id]), [])
+        self.assertFalse(VentasDiarias.objects.filter(empresa=self.empresa, cantidad__gt=0).exists())
+
+    def test_no_anula_pagos_de_caja_cerrada(self):
+        respuesta = self.client.post(f'/api/pagos/caja/{self.caja.id}/cerrar/', {'monto_real': 40}, format='json')
+        self.assertEqual(respuesta.status_code, status.HTTP_200_OK)
+        congelado = CajaSesion.objects.get(pk=self.caja.pk).resumen_cierre
+
+        respuesta = self.client.post(f'/api/pagos/{self.pago.id}/anular/')
+        self.assertEqual(respuesta.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(respuesta.data['error'], 'La caja del pago ya está cerrada.')
+
+        self.pago.refresh_from_db()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.pago.estado, 'PAGADO')
+        self.assertEqual((self.ticket.total_pagado, self.ticket.saldo), (40, 60))
+        self.assertEqual(CajaSesion.objects.get(pk=self.caja.pk).resumen_cierre, congelado)
+
+
+    def _cerrar_antes_del_bloqueo(self):
+        """Simula un cierre que se confirma entre la búsqueda de la caja y su bloqueo"""
+        from unittest import mock
+        from . import services
+        bloquear = services._bloquear_caja_abierta
+
+        def cerrar_y_bloquear(**filtros):
+            CajaSesion.objects.filter(**filtros).update(estado='CERRADA')
+            return bloquear(**filtros)
+        return mock.patch.object(services, '_bloquear_caja_abierta', side_effect=cerrar_y_bloquear)
+
+    def test_no_cobra_sobre_caja_cerrada_en_paralelo(self):
+        from .services import liquidar_tickets
+        with self._cerrar_antes_del_bloqueo():
+            with self.assertRaises(serializers.ValidationError):
+                registrar_pago(self.cajero_user, self.empresa, self.ticket, 10)
+        CajaSesion.objects.filter(pk=self.caja.pk).update(estado='ABIERTA')
+        with self._cerrar_antes_del_bloqueo():
+            with self.assertRaises(serializers.ValidationError):
+                liquidar_tickets(self.cajero_user, self.empresa, [self.ticket.id], monto=10)
+
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.total_pagado, self.ticket.saldo), (40, 60))
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+        self.assertEqual(CajaService.verificar_saldos([self.caja.id]), [])
+
+    def test_no_registra_movimiento_en_caja_cerrada_en_paralelo(self):
+        from .models import MovimientoCaja
+        # La vista ya leyó la caja como ABIERTA; el cierre se confirma antes de escribir
+        CajaSesion.objects.filter(pk=self.caja.pk).update(estado='CERRADA')
+        with self.assertRaises(serializers.ValidationError):
+            registrar_movimiento(self.cajero_user, self.caja, tipo='EGRESO', monto=15, descripcion='Detergente')
+        self.assertFalse(MovimientoCaja.objects.filter(caja=self.caja).exists())
+
+
+class CajaResumenTestCase(BaseTenantAPITestCase):
+    """Cifras de la sesión de caja en una sola consulta agrupada"""
+
+    def setUp(self):
+        super().setUp()
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        self.yape = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="YAPE", nombre_mostrar="Yape Tienda")
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="77777777", nombres="Bob")
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=cliente, fecha_prometida=timezone.now()
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        self.servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=self.servicio, cantidad=1, precio_unitario=1000)
+
+        self.caja = self._abrir_caja()
+        self._pagar(30, metodo_pago_id=self.efectivo.id)
+        self._pagar(20, metodo_pago_id=self.yape.id)
+        self._pagar(10, metodo_pago_str='Plin Antiguo')  # Histórico sin configuración
+        anular_pago(self._pagar(5, metodo_pago_id=self.efectivo.id))
+        for tipo, monto, metodo in (('INGRESO', 15, None), ('EGRESO', 8, self.efectivo), ('EGRESO', 4, self.yape)):
+            registrar_movimiento(self.cajero_user, self.caja, tipo, monto, metodo_config=metodo)
+        self.authenticate(self.cajero_user)
+
+    def _abrir_caja(self, usuario=None, **kwargs):
+        return CajaSesion.objects.create(
+            empresa=self.empresa, usuario=usuario or self.cajero_user, sede=self.sede_principal, estado='ABIERTA',
+            monto_inicial=100, detalle_apertura={'EFECTIVO': 100, 'YAPE': 50}, **kwargs
+        )
+
+    def _pagar(self, monto, usuario=None, **kwargs):
+        return registrar_pago(usuario or self.cajero_user, self.empresa, self.ticket, monto, **kwargs)
+
+    def _consultas(self, metodo, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, metodo)(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_cifras(self):
+        response, _ = self._consultas('get', '/api/pagos/caja/mi_caja/')
+        data = response.data
+        self.assertEqual(data['total_ventas'], 60)
+        self.assertEqual(data['total_gastos'], 12)
+        self.assertEqual(data['total_efectivo'], 137)  # 100 + 30 + 15 - 8
+        self.assertEqual(data['total_digital'], 76)  # 50 + 20 + 10 - 4
+        self.assertEqual(data['saldo_actual'], 213)
+        self.assertEqual(data['desglose_pagos'], {'EFECTIVO': 137, 'YAPE': 66, 'PLIN': 10})
+
+    def test_mi_caja_consultas_constantes(self):
+        _, antes = self._consultas('get', '/api/pagos/caja/mi_caja/')
+        for _ in range(5):
+            self._pagar(1, metodo_pago_id=self.yape.id)
+        _, despues = self._consultas('get', '/api/pagos/caja/mi_caja/')
+        self.assertEqual(antes, despues)
+
+    def test_listado_consultas_constantes(self):
+        response, antes = self._consultas('get', '/api/pagos/caja/')
+        cajero2, _ = self.create_user("cajero2", "CAJERO", self.empresa, self.sede_principal)
+        for usuario in (self.admin_user, self.operario_user, cajero2):
+            self._abrir_caja(usuario=usuario)
+            self._pagar(7, usuario=usuario, metodo_pago_id=self.efectivo.id)
+        response, despues = self._consultas('get', '/api/pagos/caja/')
+        self.assertEqual(antes, despues)
+        results = response.data['results'] if 'results' in response.data else response.data
+        self.assertEqual(len(results), 4)
+        self.assertEqual({r['total_ventas'] for r in results}, {60, 7})
+
+    def test_cerrar_calcula_una_vez(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f'/api/pagos/caja/{self.caja.id}/cerrar/', {'monto_real': 200}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lecturas = [q for q in ctx.captured_queries if 'pagos_cajasaldometodo' in q['sql']]
+        self.assertEqual(len(lecturas), 1)
+        self.caja.refresh_from_db()
+        self.assertEqual(self.caja.monto_final_sistema, 213)
+        self.assertEqual(self.caja.diferencia, -13)
+        self.assertEqual(response.data['estado'], 'CERRADA')
+
+    def test_saldos_se_leen_sin_agregar_pagos(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resumen = CajaService.resumen_sesion(CajaSesion.objects.get(pk=self.caja.pk))
+        self.assertEqual(resumen['saldo_actual'], 213)
+        self.assertFalse([q for q in ctx.captured_queries if 'pagos_pago' in q['sql']])
+
+    def test_filtro_por_sede_en_ventas(self):
+        from tickets.models import TicketItem
+        otra = self.sede_secundaria
+        ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=otra, cliente=self.ticket.cliente, fecha_prometida=timezone.now()
+        )
+        TicketItem.objects.create(empresa=self.empresa, ticket=ticket, servicio=self.servicio, cantidad=1, precio_unitario=50)
+        registrar_pago(self.cajero_user, self.empresa, ticket, 50, metodo_pago_id=self.efectivo.id)
+
+        caja = CajaSesion.objects.get(pk=self.caja.pk)
+        self.assertEqual(CajaService.resumen_sesion(caja)['total_ventas'], 110)
+        self.assertEqual(CajaService.resumen_sesion(caja, self.sede_principal)['total_ventas'], 60)
+        self.assertEqual(CajaService.resumen_sesion(caja, otra)['total_gastos'], 12)
+
+    def test_comando_verifica_y_repara(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import CajaSaldoMetodo
+
+        salida = StringIO()
+        call_command('verificar_saldos_caja', stdout=salida)
+        self.assertIn('Sin diferencias', salida.getvalue())
+
+        CajaSaldoMetodo.objects.filter(caja=self.caja, codigo='YAPE', sede=self.sede_principal).update(ventas=999)
+        salida = StringIO()
+        call_command('verificar_saldos_caja', '--caja', str(self.caja.id), stdout=salida)
+        self.assertIn('ventas 999.00 -> 20.00', salida.getvalue())
+
+        call_command('verificar_saldos_caja', '--reparar', stdout=StringIO())
+        self.assertEqual(CajaService.verificar_saldos([self.caja.id]), [])
+
+    def _cerrar(self):
+        response = self.client.post(f'/api/pagos/caja/{self.caja.id}/cerrar/', {'monto_real': 213}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_cierre_congela_las_cifras(self):
+        from .models import CajaSaldoMetodo
+        cerrada = self._cerrar().data
+        self.assertNotIn('resumen_cierre', cerrada)
+
+        # Alterar los saldos corrientes ya no cambia lo que muestra la sesión cerrada
+        CajaSaldoMetodo.objects.filter(caja=self.caja).update(ventas=0)
+        response, _ = self._consultas('get', f'/api/pagos/caja/{self.caja.id}/')
+        for campo in ('total_ventas', 'total_gastos', 'total_efectivo', 'total_digital', 'saldo_actual', 'desglose_pagos'):
+            self.assertEqual(response.data[campo], cerrada[campo])
+        self.assertEqual(response.data['desglose_pagos'], {'EFECTIVO': 137, 'YAPE': 66, 'PLIN': 10})
+
+    def test_cerradas_no_consultan_saldos(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._cerrar()
+        for usuario in (self.admin_user, self.operario_user):
+            caja = self._abrir_caja(usuario=usuario)
+            self.caja = caja
+            self._cerrar()
+        self._abrir_caja()  # Única sesión abierta: la única que se calcula en vivo
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/pagos/caja/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lecturas = [q for q in ctx.captured_queries if 'pagos_cajasaldometodo' in q['sql']]
+        self.assertEqual(len(lecturas), 1)
+        self.assertIn('IN (%s)' % CajaSesion.objects.get(estado='ABIERTA').id, lecturas[0]['sql'])
+
+    def test_congelado_respeta_la_sede(self):
+        from tickets.models import TicketItem
+        otra = self.sede_secundaria
+        ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=otra, cliente=self.ticket.cliente, fecha_prometida=timezone.now()
+        )
+        TicketItem.objects.create(empresa=self.empresa, ticket=ticket, servicio=self.servicio, cantidad=1, precio_unitario=50)
+        registrar_pago(self.cajero_user, self.empresa, ticket, 50, metodo_pago_id=self.efectivo.id)
+        self._cerrar()
+
+        from types import SimpleNamespace
+        sin_ventas = SimpleNamespace(id=otra.id + 1000)  # Sede sin ventas en esta sesión
+        caja = CajaSesion.objects.get(pk=self.caja.pk)
+        saldos = CajaService._leer_saldos([caja.pk])[caja.pk]
+        for sede in (None, self.sede_principal, otra, sin_ventas):
+            esperado = CajaService._armar_resumen(caja, CajaService._filas_resumen(saldos, sede.id if sede else None))
+            self.assertEqual(CajaService.resumen_sesion(caja, sede), esperado)
+        self.assertEqual(CajaService.resumen_sesion(caja, otra)['total_ventas'], 50)
+
+    def test_comando_congela_cerradas_historicas(self):
+        from io import StringIO
+        from django.core.management import call_command
+        CajaSesion.objects.filter(pk=self.caja.pk).update(estado='CERRADA')
+        call_command('congelar_resumenes_caja', stdout=StringIO())
+
+        caja = CajaSesion.objects.get(pk=self.caja.pk)
+        self.assertEqual(caja.resumen_cierre['todas']['saldo_actual'], '213.00')
+        self.assertEqual(CajaService.resumen_sesion(caja)['saldo_actual'], 213)
+
+        salida = StringIO()
+        call_command('congelar_resumenes_caja', stdout=salida)
+        self.assertIn('0 sesiones', salida.getvalue())
+
+
+class CajaDiarioTestCase(BaseTenantAPITestCase):
+    """Diario y línea de tiempo intercalados desde la BD, paginados por cursor"""
+
+    def setUp(self):
+        super().setUp()
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="77777777", nombres="Bob")
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=cliente, fecha_prometida=timezone.now()
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=servicio, cantidad=1, precio_unitario=1000)
+
+        self.caja = CajaSesion.objects.create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=100
+        )
+        for monto in (10, 20, 30):
+            registrar_pago(self.cajero_user, self.empresa, self.ticket, monto, metodo_pago_id=self.efectivo.id)
+        registrar_movimiento(self.cajero_user, self.caja, 'EGRESO', 5, descripcion='Detergente')
+        CajaSesion.objects.filter(pk=self.caja.pk).update(estado='CERRADA', fecha_cierre=timezone.now(), monto_final_real=155)
+        self.authenticate(self.cajero_user)
+
+    def _recorrer(self, url, page_size):
+        ids = []
+        url = f'{url}?paginacion=cursor&page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids += [e['id'] for e in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_diario_ordenado_por_hora(self):
+        response = self.client.get('/api/pagos/caja/diario/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tipos = [e['tipo_evento'] for e in response.data]
+        self.assertEqual(tipos, ['APERTURA', 'VENTA', 'VENTA', 'VENTA', 'EGRESO', 'CIERRE'])
+        horas = [e['hora_raw'] for e in response.data]
+        self.assertEqual(horas, sorted(horas))
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        completo = [e['id'] for e in self.client.get('/api/pagos/caja/diario/').data]
+        for page_size in (1, 2, 4):
+            self.assertEqual(self._recorrer('/api/pagos/caja/diario/', page_size), completo)
+        self.assertEqual(
+            self._recorrer(f'/api/pagos/caja/{self.caja.id}/timeline/', 2),
+            [e['id'] for e in self.client.get(f'/api/pagos/caja/{self.caja.id}/timeline/').data]
+        )
+
+    def test_lista_sin_paginar_acotada(self):
+        from unittest import mock
+        from . import diario
+        completo = [e['id'] for e in self.client.get('/api/pagos/caja/diario/').data]
+        with mock.patch.object(diario, 'MAX_SIN_PAGINAR', 4):
+            response = self.client.get('/api/pagos/caja/diario/')
+        self.assertEqual([e['id'] for e in response.data], completo[:4])
+        siguiente = response['Link'].split(';')[0].strip('<>')
+        self.assertIn('paginacion=cursor', siguiente)
+        self.assertEqual([e['id'] for e in self.client.get(siguiente).data['results']], completo[4:])
+
+        self.assertFalse(self.client.get('/api/pagos/caja/diario/').has_header('Link'))
+
+    def test_cursor_con_eventos_simultaneos(self):
+        from .models import MovimientoCaja
+        instante = timezone.now()
+        Pago.objects.filter(caja=self.caja).update(fecha_pago=instante)
+        MovimientoCaja.objects.filter(caja=self.caja).update(creado_en=instante)
+        CajaSesion.objects.filter(pk=self.caja.pk).update(fecha_apertura=instante, fecha_cierre=instante)
+
+        ids = self._recorrer('/api/pagos/caja/diario/', 2)
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(len(set(ids)), 6)
+        self.assertEqual(ids[:3], [f'pago-{p}' for p in Pago.objects.filter(caja=self.caja).order_by('pk').values_list('pk', flat=True)])
+
+    def test_consultas_por_pagina_constantes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/pagos/caja/diario/?paginacion=cursor&page_size=3')
+            return len(ctx.captured_queries)
+
+        antes = consultas()
+        CajaSesion.objects.filter(pk=self.caja.pk).update(estado='ABIERTA')
+        for _ in range(10):
+            registrar_pago(self.cajero_user, self.empresa, self.ticket, 1, metodo_pago_id=self.efectivo.id)
+        self.assertEqual(antes, consultas())
+
+    def test_cursor_invalido(self):
+        response = self.client.get('/api/pagos/caja/diario/?paginacion=cursor&cursor=xyz')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IdempotenciaPagoTestCase(BaseTenantAPITestCase):
+    """Idempotency-Key en el registro de pagos y en el pago inicial de tickets"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+        cache.clear()
+        super().setUp()
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        self.cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="77777777", nombres="Bob")
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente, fecha_prometida=timezone.now()
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        self.servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=self.servicio, cantidad=1, precio_unitario=100)
+        self.authenticate(self.cajero_user)
+
+    def _abrir_caja(self):
+        CajaSesion.objects.create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=0
+        )
+
+    def _pagar(self, clave, monto=40):
+        return self.client.post('/api/pagos/', {
+            'ticket': self.ticket.id, 'metodo_pago_config': self.efectivo.id, 'monto': monto
+        }, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_repite_la_respuesta_sin_bloquear_el_ticket(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._abrir_caja()
+
+        primera = self._pagar('clave-1')
+        self.assertEqual(primera.status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self._pagar('clave-1')
+        self.assertEqual(segunda.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.data['id'], primera.data['id'])
+        self.assertFalse([q for q in ctx.captured_queries if 'tickets_ticket' in q['sql']])
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+
+        # Un pago parcial legítimo con otra clave no choca con el anterior
+        self.assertEqual(self._pagar('clave-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 2)
+
+    def test_repeticion_desde_la_tabla_sin_cache(self):
+        from django.core.cache import cache
+        self._abrir_caja()
+        primera = self._pagar('clave-1')
+        cache.clear()
+        segunda = self._pagar('clave-1')
+        self.assertEqual(segunda.data['id'], primera.data['id'])
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+
+    def test_misma_clave_con_otro_cuerpo(self):
+        self._abrir_caja()
+        self._pagar('clave-1')
+        response = self._pagar('clave-1', monto=10)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_error_libera_la_clave(self):
+        self.assertEqual(self._pagar('clave-1').status_code, status.HTTP_400_BAD_REQUEST)  # Sin caja abierta
+        self._abrir_caja()
+        self.assertEqual(self._pagar('clave-1').status_code, status.HTTP_201_CREATED)
+
+    def test_cobro_y_registro_se_confirman_juntos(self):
+        from unittest import mock
+        from django.db.models.query import QuerySet
+        from .models import ClaveIdempotencia
+        self._abrir_caja()
+        update = QuerySet.update
+
+        def caida_al_completar(qs, **campos):
+            if qs.model is ClaveIdempotencia and campos.get('estado') == 'COMPLETADO':
+                raise RuntimeError('El worker cae tras cobrar')
+            return update(qs, **campos)
+
+        with mock.patch.object(QuerySet, 'update', caida_al_completar):
+            with self.assertRaises(RuntimeError):
+                self._pagar('clave-1')
+        # El cobro se revirtió junto con la reserva: el reintento cobra una sola vez
+        self.assertFalse(Pago.objects.filter(ticket=self.ticket).exists())
+        self.assertFalse(ClaveIdempotencia.objects.filter(clave='clave-1').exists())
+        self.assertEqual(self._pagar('clave-1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_reserva_de_worker_caido_se_retoma(self):
+        from unittest import mock
+        from .models import ClaveIdempotencia
+        from .views import PagoViewSet
+        self._abrir_caja()
+
+        # El worker muere a mitad de la operación: la reserva queda EN_PROCESO, sin bloqueo
+        with mock.patch.object(PagoViewSet, '_crear_pago', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self._pagar('clave-1')
+        self.assertEqual(ClaveIdempotencia.objects.get(clave='clave-1').estado, 'EN_PROCESO')
+
+        self.assertEqual(self._pagar('clave-1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(ClaveIdempotencia.objects.get(clave='clave-1').estado, 'COMPLETADO')
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+
+    def test_ticket_con_pago_inicial(self):
+        self._abrir_caja()
+        payload = {
+            'cliente': self.cliente.id, 'fecha_prometida': (timezone.now() + timezone.timedelta(days=1)).isoformat(),
+            'items': [{'servicio': self.servicio.id, 'cantidad': 1, 'precio_unitario': 30}],
+            'pago_monto': 30, 'metodo_pago_id': self.efectivo.id,
+        }
+        respuestas = [
+            self.client.post('/api/tickets/', payload, format='json', HTTP_IDEMPOTENCY_KEY='ticket-1') for _ in range(2)
+        ]
+        self.assertEqual([r.status_code for r in respuestas], [201, 201])
+        self.assertEqual(respuestas[0].data['id'], respuestas[1].data['id'])
+        self.assertEqual(Ticket.objects.filter(cliente=self.cliente).count(), 2)  # El de setUp + uno nuevo
+        self.assertEqual(Pago.objects.filter(ticket_id=respuestas[0].data['id']).count(), 1)
+
+
+class LiquidacionTicketsTestCase(BaseTenantAPITestCase):
+    """Cobro de varios tickets con un solo monto"""
+
+    def setUp(self):
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+        super().setUp()
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        self.cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="55555555", nombres="Eva")
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        self.tickets = []
+        for precio in (30, 50, 20):
+            ticket = Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente, fecha_prometida=timezone.now()
+            )
+            TicketItem.objects.create(empresa=self.empresa, ticket=ticket, servicio=servicio, cantidad=1, precio_unitario=precio)
+            self.tickets.append(ticket)
+        self.caja = CajaSesion.objects.create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=0
+        )
+        self.authenticate(self.cajero_user)
+
+    def _liquidar(self, **datos):
+        datos.setdefault('tickets', [t.id for t in self.tickets])
+        datos.setdefault('metodo_pago_config', self.efectivo.id)
+        return self.client.post('/api/pagos/liquidar/', datos, format='json')
+
+    def test_reparte_el_monto_en_orden(self):
+        response = self._liquidar(monto=60)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        aplicado = [(t['monto_aplicado'], t['saldo']) for t in response.data['tickets']]
+        self.assertEqual(aplicado, [(30, 0), (30, 20), (0, 20)])
+        self.assertEqual(len(response.data['pagos']), 2)
+        self.assertEqual(response.data['total_aplicado'], 60)
+
+        for ticket, saldo in zip(self.tickets, (0, 20, 20)):
+            ticket.refresh_from_db()
+            self.assertEqual(ticket.saldo, saldo)
+        self.assertEqual(CajaService.resumen_sesion(self.caja)['total_ventas'], 60)
+        self.assertEqual(CajaService.verificar_saldos([self.caja.id]), [])
+        self.assertEqual(len({p.numero_pago for p in Pago.objects.filter(caja=self.caja)}), 2)
+
+    def test_sin_monto_liquida_todo(self):
+        response = self._liquidar()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_aplicado'], 100)
+        self.assertTrue(all(t['saldo'] == 0 for t in response.data['tickets']))
+
+    def test_consultas_no_crecen_por_ticket(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self._liquidar()
+        caja_y_metodo = [
+            q for q in ctx.captured_queries
+            if 'FROM "pagos_cajasesion"' in q['sql'] or 'FROM "pagos_metodopagoconfig"' in q['sql']
+        ]
+        self.assertEqual(len(caja_y_metodo), 2)
+        inserciones = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "pagos_pago"')]
+        self.assertEqual(len(inserciones), 1)
+
+    def test_rechaza_sobrepago_sin_cambios(self):
+        response = self._liquidar(monto=101)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Pago.objects.exists())
+
+    def test_ticket_de_otra_empresa(self):
+        from core.models import Empresa
+        otra = Empresa.objects.create(nombre="Otra", ruc="33333333333", estado="ACTIVO")
+        ajeno = Ticket.objects.create(
+            empresa=otra, cliente=Cliente.objects.create(empresa=otra, numero_documento="1", nombres="X"),
+            fecha_prometida=timezone.now()
+        )
+        response = self._liquidar(tickets=[self.tickets[0].id, ajeno.id])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Pago.objects.exists())
+
+    def test_tickets_eliminados_o_cancelados(self):
+        eliminado, cancelado = self.tickets[1], self.tickets[2]
+        Ticket.objects.filter(pk=eliminado.pk).update(activo=False)
+        Ticket.objects.filter(pk=cancelado.pk).update(estado='CANCELADO')  # Con saldo aún positivo
+
+        response = self._liquidar()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], f'Tickets no encontrados: {[eliminado.id, cancelado.id]}')
+        self.assertFalse(Pago.objects.exists())
+
+
+class VentasDiariasTestCase(BaseTenantAPITestCase):
+    """Acumulado de ventas por día, sede y método"""
+
+    def setUp(self):
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+        super().setUp()
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        self.yape = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="YAPE", nombre_mostrar="Yape")
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="66666666", nombres="Ivo")
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        self.tickets = {}
+        for sede in (self.sede_principal, self.sede_secundaria):
+            ticket = Ticket.objects.create(empresa=self.empresa, sede=sede, cliente=cliente, fecha_prometida=timezone.now())
+            TicketItem.objects.create(empresa=self.empresa, ticket=ticket, servicio=servicio, cantidad=1, precio_unitario=500)
+            self.tickets[sede.id] = ticket
+        CajaSesion.objects.create(empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=0)
+
+    def _pagar(self, sede, monto, metodo):
+        return registrar_pago(self.cajero_user, self.empresa, self.tickets[sede.id], monto, metodo_pago_id=metodo.id)
+
+    def _filas(self):
+        from .models import VentasDiarias
+        return {
+            (v.sede_id, v.fecha, v.codigo): (v.total, v.cantidad)
+            for v in VentasDiarias.objects.filter(empresa=self.empresa)
+        }
+
+    def test_incremental_coincide_con_reconstruccion(self):
+        from .services import VentasDiariasService, liquidar_tickets
+        self._pagar(self.sede_principal, 30, self.efectivo)
+        self._pagar(self.sede_principal, 20, self.yape)
+        self._pagar(self.sede_secundaria, 15, self.efectivo)
+        anular_pago(self._pagar(self.sede_principal, 5, self.efectivo))
+        liquidar_tickets(
+            self.cajero_user, self.empresa, [t.id for t in self.tickets.values()], monto=40, metodo_pago_id=self.yape.id
+        )
+
+        hoy = timezone.localdate()
+        incremental = self._filas()
+        self.assertEqual(incremental[(self.sede_principal.id, hoy, 'EFECTIVO')], (30, 1))
+        self.assertEqual(incremental[(self.sede_principal.id, hoy, 'YAPE')], (60, 2))
+        self.assertEqual(incremental[(self.sede_secundaria.id, hoy, 'EFECTIVO')], (15, 1))
+
+        VentasDiariasService.reconstruir(self.empresa.id)
+        self.assertEqual(self._filas(), incremental)
+
+    def test_lecturas(self):
+        from .services import VentasDiariasService
+        self._pagar(self.sede_principal, 30, self.efectivo)
+        self._pagar(self.sede_secundaria, 15, self.yape)
+        anular_pago(self._pagar(self.sede_secundaria, 7, self.efectivo))
+
+        hoy = timezone.localdate()
+        self.assertEqual(VentasDiariasService.total(self.empresa, desde=hoy, hasta=hoy), 45)
+        self.assertEqual(VentasDiariasService.total(self.empresa, self.sede_secundaria, hoy, hoy), 15)
+        self.assertEqual(VentasDiariasService.por_dia(self.empresa), [{'fecha': hoy, 'total': 45}])
+        self.assertEqual(
+            VentasDiariasService.por_metodo(self.empresa),
+            [{'codigo': 'EFECTIVO', 'total': 30}, {'codigo': 'YAPE', 'total': 15}]
+        )
+
+    def test_comando_reconstruye(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .models import VentasDiarias
+        self._pagar(self.sede_principal, 30, self.efectivo)
+        VentasDiarias.objects.update(total=999)
+
+        hoy = timezone.localdate().isoformat()
+        call_command('reconstruir_ventas_diarias', '--empresa', str(self.empresa.id), '--desde', hoy, stdout=StringIO())
+        self.assertEqual(list(VentasDiarias.objects.values_list('total', 'cantidad')), [(30, 1)])
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_ventas_diarias', '--desde', 'ayer', stdout=StringIO())
+
+
+class IdempotenciaConcurrenciaTestCase(TransactionTestCase):
+    """Varios hilos envían el mismo pago con la misma clave a la vez: se cobra una sola vez"""
+
+    def setUp(self):
+        from core.models import Empresa, Sede
+        from usuarios.models import PerfilUsuario
+        from django.contrib.auth.models import User
+        from servicios.models import CategoriaServicio, Servicio
+        from tickets.models import TicketItem
+
+        self.empresa = Empresa.objects.create(
+            nombre="Lavandería Hilos", ruc="22222222222", estado="ACTIVO",
+            fecha_vencimiento=timezone.now() + timezone.timedelta(days=30)
+        )
+        sede = Sede.objects.create(
+            empresa=self.empresa, nombre="Central", codigo="S01", direccion="Calle 1", telefono="1",
+            email="s@test.com", horario_apertura="08:00", horario_cierre="20:00"
+        )
+        self.usuario = User.objects.create_user(username="cajero_hilos", password="x")
+        PerfilUsuario.objects.create(user=self.usuario, empresa=self.empresa, sede=sede, rol='CAJERO')
+        self.efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="123", nombres="Ana")
+        self.ticket = Ticket.objects.create(empresa=self.empresa, sede=sede, cliente=cliente, fecha_prometida=timezone.now())
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=servicio, cantidad=1, precio_unitario=100)
+        CajaSesion.objects.create(empresa=self.empresa, usuario=self.usuario, sede=sede, estado='ABIERTA', monto_inicial=0)
+
+    def test_duplicados_concurrentes_esperan_a_la_primera(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import OperationalError, connection
+        from rest_framework.test import APIClient
+        from unittest import mock
+        from pagos import services
+
+        original = services.registrar_pago
+        llamadas = []
+
+        def registrar_lento(*args, **kwargs):
+            llamadas.append(1)
+            time.sleep(0.3)  # Los duplicados llegan mientras la primera sigue en curso
+            return original(*args, **kwargs)
+
+        def enviar(_):
+            client = APIClient()
+            client.force_authenticate(self.usuario)
+            try:
+                while True:
+                    try:
+                        response = client.post('/api/pagos/', {
+                            'ticket': self.ticket.id, 'metodo_pago_config': self.efectivo.id, 'monto': 40
+                        }, format='json', HTTP_IDEMPOTENCY_KEY='doble-clic')
+                        return response.status_code, response.data.get('id')
+                    except OperationalError:
+                        # SQLite bloquea la tabla entera ante escritores concurrentes: el
+                        # cliente reintenta con la misma clave, que es justo el caso a cubrir.
+                        if connection.vendor != 'sqlite':
+                            raise
+                        time.sleep(0.05)  # Sin agotar el límite de solicitudes por usuario
+            finally:
+                connection.close()
+
+        with mock.patch('pagos.services.registrar_pago', side_effect=registrar_lento):
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                resultados = list(pool.map(enviar, range(6)))
+
+        self.assertEqual({codigo for codigo, _ in resultados}, {201})
+        self.assertEqual(len({pago_id for _, pago_id in resultados}), 1)
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_operacion_larga_no_se_repite(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from unittest import mock
+        from pagos import idempotencia, services
+
+        original = services.registrar_pago
+        llamadas = []
+        reintentos = []
+
+        def enviar():
+            client = APIClient()
+            client.force_authenticate(self.usuario)
+            try:
+                return client.post('/api/pagos/', {
+                    'ticket': self.ticket.id, 'metodo_pago_config': self.efectivo.id, 'monto': 40
+                }, format='json', HTTP_IDEMPOTENCY_KEY='cobro-lento')
+            finally:
+                connection.close()
+
+        def reintentar_mucho_despues():
+            # Un día después, con la reserva aún bloqueada por su dueño vivo
+            despues = timezone.now() + timezone.timedelta(seconds=idempotencia.TTL + 60)
+            with mock.patch('pagos.idempotencia.timezone.now', return_value=despues), \
+                    mock.patch.object(idempotencia, 'ESPERA_MAXIMA', 0.3):
+                return enviar()
+
+        def registrar_lento(*args, **kwargs):
+            llamadas.append(1)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                reintentos.append(pool.submit(reintentar_mucho_despues).result())
+            return original(*args, **kwargs)
+
+        with mock.patch('pagos.services.registrar_pago', side_effect=registrar_lento):
+            primera = enviar()
+
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual([r.status_code for r in reintentos], [409])
+        self.assertEqual(len(llamadas), 1)
+        ultima = enviar()
+        self.assertEqual((ultima.status_code, ultima.data['id']), (201, primera.data['id']))
+        self.assertEqual(Pago.objects.filter(ticket=self.ticket).count(), 1)
@@ -6,6 +6,8 @@ Actualizado para SaaS: Filtros por Empresa y Soporte de Métodos Dinámicos
 from rest_framework import viewsets, filters, serializers, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime, time, timedelta
 from decimal import Decimal
@@ -20,7 +22,8 @@ from .serializers import (
     MetodoPagoConfigSerializer
 )
 from core.views import BaseTenantViewSet
-from .services import CajaService
+from .services import CajaService, anular_pago, liquidar_tickets, registrar_movimiento
+from . import diario, idempotencia
 
 
 class MetodoPagoConfigViewSet(BaseTenantViewSet):
@@ -43,7 +46,7 @@ class MetodoPagoConfigViewSet(BaseTenantViewSet):
 
     def perform_create(self, serializer):
         serializer.save(
-            empresa=self.request.user.perfil.empresa
+            empresa=self.tenant.empresa
         )
 
 
@@ -53,15 +56,23 @@ class PagoViewSet(BaseTenantViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['numero_pago', 'ticket__numero_ticket', 'ticket__cliente__nombres', 'ticket__cliente__apellidos']
     ordering = ['-fecha_pago']
+    cursor_ordering = ('-fecha_pago', '-id')
+    # Sin PUT/PATCH/DELETE: todo cambio pasa por registrar_pago/anular_pago/liquidar_tickets,
+    # que propagan el monto al ticket, a los saldos de caja y a las ventas diarias
+    http_method_names = ['get', 'post', 'head', 'options']
 
     def create(self, request, *args, **kwargs):
+        # Idempotency-Key: un reintento (doble clic, red inestable) repite la respuesta del primer cobro
+        return idempotencia.responder(request, 'pagos.crear', lambda: self._crear_pago(request))
+
+    def _crear_pago(self, request):
         from rest_framework.response import Response
         from rest_framework import serializers
         from pagos.services import registrar_pago
         from tickets.models import Ticket
 
         user = request.user
-        empresa = user.perfil.empresa
+        empresa = self.tenant.empresa
         
         monto = request.data.get('monto')
         ticket_id = request.data.get('ticket')
@@ -88,6 +99,37 @@ class PagoViewSet(BaseTenantViewSet):
         except serializers.ValidationError as e:
             return Response(e.detail, status=400)
 
+    @action(detail=False, methods=['post'])
+    def liquidar(self, request):
+        """
+        Cobra varios tickets con un solo monto: {tickets: [ids], monto?, metodo_pago_config?,
+        metodo_pago?, referencia?}. Devuelve los pagos creados y el saldo restante de cada ticket.
+        """
+        return idempotencia.responder(request, 'pagos.liquidar', lambda: self._liquidar(request))
+
+    def _liquidar(self, request):
+        from django.db.models import prefetch_related_objects
+
+        try:
+            pagos, saldos = liquidar_tickets(
+                user=request.user,
+                empresa=self.tenant.empresa,
+                ticket_ids=request.data.get('tickets'),
+                monto=request.data.get('monto'),
+                metodo_pago_id=request.data.get('metodo_pago_config'),
+                metodo_pago_str=request.data.get('metodo_pago'),
+                referencia=request.data.get('referencia')
+            )
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=400)
+
+        prefetch_related_objects([p.ticket for p in pagos], 'cliente')
+        return Response({
+            'pagos': self.get_serializer(pagos, many=True).data,
+            'tickets': saldos,
+            'total_aplicado': sum((p.monto for p in pagos), Decimal('0')),
+        }, status=201)
+
     @action(detail=True, methods=['post'])
     def anular(self, request, pk=None):
         pago = self.get_object()
@@ -104,8 +146,10 @@ class PagoViewSet(BaseTenantViewSet):
         if pago.estado == 'ANULADO':
              return Response({'error': 'El pago ya se encuentra anulado.'}, status=400)
 
-        pago.estado = 'ANULADO'
-        pago.save()
+        try:
+            anular_pago(pago)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=400)
         
         return Response({'status': 'Pago extornado. El saldo ha retornado al ticket.'})
 
@@ -121,7 +165,7 @@ class CajaViewSet(BaseTenantViewSet):
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('usuario')
         
         fecha_desde = self.request.query_params.get('fecha_desde')
         fecha_hasta = self.request.query_params.get('fecha_hasta')
@@ -144,12 +188,12 @@ class CajaViewSet(BaseTenantViewSet):
         sede = resolver_sede_desde_request(request)
         filters = {
             'usuario': request.user,
-            'empresa': request.user.perfil.empresa,
+            'empresa': self.tenant.empresa,
             'estado': 'ABIERTA'
         }
         if sede:
             filters['sede'] = sede
-        caja = CajaSesion.objects.filter(**filters).first()
+        caja = CajaSesion.objects.filter(**filters).select_related('usuario').first()
         if caja:
             return Response(self.get_serializer(caja, context={'request': request, 'sede': sede}).data)
         return Response(None)
@@ -158,7 +202,7 @@ class CajaViewSet(BaseTenantViewSet):
     def ultimo_cierre(self, request):
         sede = resolver_sede_desde_request(request)
         filters = {
-            'empresa': request.user.perfil.empresa,
+            'empresa': self.tenant.empresa,
             'estado': 'CERRADA'
         }
         if sede:
@@ -172,7 +216,7 @@ class CajaViewSet(BaseTenantViewSet):
 
     @action(detail=False, methods=['post'])
     def abrir(self, request):
-        empresa = request.user.perfil.empresa
+        empresa = self.tenant.empresa
         sede = resolver_sede_desde_request(request)
         
         # Verificar si ya tiene caja abierta en ESTA sede
@@ -200,18 +244,22 @@ class CajaViewSet(BaseTenantViewSet):
 
     @action(detail=True, methods=['post'])
     def cerrar(self, request, pk=None):
-        caja = self.get_object() 
-        
-        caja.monto_final_real = Decimal(str(request.data.get('monto_real', 0)))
-        caja.comentarios = request.data.get('comentarios', '')
-        caja.detalle_cierre = request.data.get('detalle_cierre', {})
-        
-        serializer = self.get_serializer(caja)
-        caja.monto_final_sistema = Decimal(str(serializer.data['saldo_actual']))
-        caja.diferencia = caja.monto_final_real - caja.monto_final_sistema
-        caja.estado = 'CERRADA'
-        caja.fecha_cierre = timezone.now()
-        caja.save()
+        with transaction.atomic():
+            # Bloquea la caja: un extorno concurrente espera y luego la ve CERRADA
+            caja = CajaSesion.objects.select_for_update().get(pk=self.get_object().pk)
+
+            caja.monto_final_real = Decimal(str(request.data.get('monto_real', 0)))
+            caja.comentarios = request.data.get('comentarios', '')
+            caja.detalle_cierre = request.data.get('detalle_cierre', {})
+
+            # Las cifras se congelan al cerrar: listados y reportes ya no las recalculan
+            CajaService.congelar_resumenes([caja])
+            caja.estado = 'CERRADA'
+            resumen = CajaService.resumen_sesion(caja, self.get_serializer_context()['sede'])
+            caja.monto_final_sistema = resumen['saldo_actual']
+            caja.diferencia = caja.monto_final_real - caja.monto_final_sistema
+            caja.fecha_cierre = timezone.now()
+            caja.save()
         return Response(self.get_serializer(caja).data)
 
     @action(detail=True, methods=['post'])
@@ -228,30 +276,51 @@ class CajaViewSet(BaseTenantViewSet):
                 empresa=caja.empresa
             ).first()
 
-        MovimientoCaja.objects.create(
-            caja=caja,
-            empresa=caja.empresa, 
-            tipo=request.data.get('tipo'),
-            monto=request.data.get('monto'),
-            metodo_pago_config=metodo_config,
-            descripcion=request.data.get('descripcion', ''), 
-            categoria=request.data.get('categoria', 'GENERAL'),
-            creado_por=request.user
-        )
+        try:
+            # El servicio vuelve a validar el estado con la caja bloqueada (cierre concurrente)
+            registrar_movimiento(
+                request.user, caja,
+                tipo=request.data.get('tipo'),
+                monto=request.data.get('monto'),
+                metodo_config=metodo_config,
+                descripcion=request.data.get('descripcion', ''), 
+                categoria=request.data.get('categoria', 'GENERAL')
+            )
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=400)
         return Response({'status': 'Movimiento registrado'})
 
     @action(detail=True, methods=['get'])
     def timeline(self, request, pk=None):
         caja = self.get_object()
-        events = CajaService.build_timeline_events(caja)
-        events.sort(key=lambda x: x['hora_raw'] if x['hora_raw'] else timezone.now())
-        return Response(events)
+        return self._responder_diario(request, CajaService.fuentes_timeline(caja))
+
+    def _responder_diario(self, request, fuentes):
+        """
+        Eventos en orden de hora, intercalados desde la BD (sin ordenar en memoria).
+        Con ?paginacion=cursor responde por páginas: {next, results} (page_size, cursor).
+        Sin él responde la lista plana de siempre, acotada a diario.MAX_SIN_PAGINAR eventos;
+        si hay más, el header Link (rel="next") apunta a la página por cursor que sigue.
+        """
+        url = request.build_absolute_uri()
+        if request.query_params.get('paginacion') != 'cursor':
+            eventos, siguiente = diario.pagina(fuentes, limite=diario.MAX_SIN_PAGINAR)
+            response = Response(eventos)
+            if siguiente:
+                next_url = replace_query_param(replace_query_param(url, 'paginacion', 'cursor'), 'cursor', siguiente)
+                response['Link'] = f'<{next_url}>; rel="next"'
+            return response
+        eventos, siguiente = diario.pagina(
+            fuentes, request.query_params.get('cursor'), diario.tamano_pagina(request.query_params.get('page_size'))
+        )
+        next_url = replace_query_param(url, 'cursor', siguiente) if siguiente else None
+        return Response({'next': next_url, 'results': eventos})
 
     @action(detail=False, methods=['get'])
     def diario(self, request):
         fecha_desde_str = request.query_params.get('fecha_desde')
         fecha_hasta_str = request.query_params.get('fecha_hasta')
-        empresa_actual = request.user.perfil.empresa
+        empresa_actual = self.tenant.empresa
         sede = resolver_sede_desde_request(request)
         
         now_local = timezone.localtime(timezone.now())
@@ -261,6 +330,6 @@ class CajaViewSet(BaseTenantViewSet):
         start_aware = timezone.make_aware(datetime.combine(dt_start, time.min))
         end_aware = timezone.make_aware(datetime.combine(dt_end, time.max))
 
-        events = CajaService.get_diario_events(empresa_actual, sede, start_aware, end_aware)
-        events.sort(key=lambda x: x['hora_raw'] if x['hora_raw'] else timezone.now())
-        return Response(events)
\ No newline at end of file
+        return self._responder_diario(
+            request, CajaService.fuentes_diario(empresa_actual, sede, start_aware, end_aware)
+        )
\ No newline at end of file
@@ -1,9 +1,11 @@
 from django.db.models import Sum, Count, F, Q
-from django.db.models.functions import TruncDate, ExtractWeekDay, ExtractHour
+from django.db.models.functions import ExtractWeekDay, ExtractHour
 from django.utils import timezone
 from datetime import timedelta
 from tickets.models import Ticket, TicketItem, Cliente
+from tickets.services import ClienteService
 from pagos.models import Pago, CajaSesion
+from pagos.services import VentasDiariasService
 from inventario.models import Producto
 
 class DashboardService:
@@ -18,38 +20,26 @@ class DashboardService:
         
         saldo_caja = {'total': 0, 'efectivo': 0, 'digital': 0, 'tiene_caja': False}
         if caja_sesion:
-            from pagos.serializers import CajaSesionSerializer
-            serializer = CajaSesionSerializer(caja_sesion, context={'sede': sede})
+            from pagos.services import CajaService
+            resumen = CajaService.resumen_sesion(caja_sesion, sede)
             saldo_caja = {
                 'tiene_caja': True,
-                'total': float(serializer.data['saldo_actual']),
-                'efectivo': float(serializer.data['total_efectivo']),
-                'digital': float(serializer.data['total_digital'])
+                'total': float(resumen['saldo_actual']),
+                'efectivo': float(resumen['total_efectivo']),
+                'digital': float(resumen['total_digital'])
             }
 
-        # 2. Ventas Hoy
-        filters_pago = {'ticket__empresa': empresa, 'estado': 'PAGADO', 'fecha_pago__date': hoy}
-        if sede: filters_pago['ticket__sede'] = sede
-        ventas_hoy = Pago.objects.filter(**filters_pago).aggregate(t=Sum('monto'))['t'] or 0
+        # 2. Ventas Hoy (acumulado diario, sin recorrer los pagos)
+        ventas_hoy = VentasDiariasService.total(empresa, sede, hoy, hoy)
 
-        # 3. Por Cobrar
-        val_servicios_qs = TicketItem.objects.filter(
-            ticket__activo=True,
-            ticket__estado__in=['RECIBIDO', 'EN_PROCESO', 'LISTO', 'ENTREGADO'],
-            ticket__empresa=empresa
+        # 3. Por Cobrar (libro financiero persistido del ticket)
+        por_cobrar_qs = Ticket.objects.filter(
+            activo=True,
+            estado__in=['RECIBIDO', 'EN_PROCESO', 'LISTO', 'ENTREGADO'],
+            empresa=empresa
         )
-        if sede: val_servicios_qs = val_servicios_qs.filter(ticket__sede=sede)
-        val_servicios = val_servicios_qs.aggregate(t=Sum(F('cantidad') * F('precio_unitario')))['t'] or 0
-        
-        pagado_tickets_qs = Pago.objects.filter(
-            ticket__activo=True,
-            ticket__estado__in=['RECIBIDO', 'EN_PROCESO', 'LISTO', 'ENTREGADO'],
-            ticket__empresa=empresa,
-            estado='PAGADO'
-        )
-        if sede: pagado_tickets_qs = pagado_tickets_qs.filter(ticket__sede=sede)
-        pagado_tickets = pagado_tickets_qs.aggregate(t=Sum('monto'))['t'] or 0
-        deuda = max(0, val_servicios - pagado_tickets)
+        if sede: por_cobrar_qs = por_cobrar_qs.filter(sede=sede)
+        deuda = max(0, por_cobrar_qs.aggregate(t=Sum('saldo'))['t'] or 0)
 
         # 4. Carga Operativa & Alertas
         filters_tkt = {'empresa': empresa, 'activo': True}
@@ -79,16 +69,13 @@ class DashboardService:
         }
 
     @staticmethod
-    def get_analitica(empresa, sede=None):
+    def get_analitica(empresa, sede=None, dias=30):
         fecha_fin = timezone.localdate()
-        fecha_inicio = fecha_fin - timedelta(days=30)
-        
-        filters_pago = {'ticket__empresa': empresa, 'estado': 'PAGADO', 'fecha_pago__date__gte': fecha_inicio}
-        if sede: filters_pago['ticket__sede'] = sede
+        fecha_inicio = fecha_fin - timedelta(days=dias)
         
-        # Tendencia
-        ventas = Pago.objects.filter(**filters_pago).annotate(dia=TruncDate('fecha_pago')).values('dia').annotate(total=Sum('monto')).order_by('dia')
-        datos_ventas = [{'fecha': v['dia'].strftime('%Y-%m-%d'), 'total': float(v['total'])} for v in ventas]
+        # Tendencia: una fila por día del acumulado (un año = 365 filas, no todos sus pagos)
+        ventas = VentasDiariasService.por_dia(empresa, sede, desde=fecha_inicio)
+        datos_ventas = [{'fecha': v['fecha'].strftime('%Y-%m-%d'), 'total': float(v['total'])} for v in ventas]
         promedio = sum(d['total'] for d in datos_ventas) / len(datos_ventas) if datos_ventas else 0
 
         # Top Servicios
@@ -134,6 +121,13 @@ class DashboardService:
         return {'pipeline': conteo}
 
 class ReporteService:
+    @staticmethod
+    def _fechas(inicio_dt, fin_dt):
+        """Rango de fechas locales para leer VentasDiarias (None, None = histórico completo)"""
+        if inicio_dt and fin_dt:
+            return timezone.localdate(inicio_dt), timezone.localdate(fin_dt)
+        return None, None
+
     @staticmethod
     def get_tickets_data(empresa, sede, inicio_dt, fin_dt, estado):
         qs = Ticket.objects.filter(empresa=empresa, activo=True)
@@ -145,7 +139,7 @@ class ReporteService:
         registros = []
         total_generado = 0
         for t in qs:
-            tot = t.calcular_total()
+            tot = t.total
             total_generado += tot
             registros.append({
                 'id': t.numero_ticket,
@@ -168,8 +162,10 @@ class ReporteService:
         
         registros = []
         total_ingresos = 0
+        ingresos_confirmados = 0
         for p in qs:
             total_ingresos += p.monto
+            if p.estado == 'PAGADO': ingresos_confirmados += p.monto
             registros.append({
                 'id': p.id,
                 'fecha': p.fecha_pago,
@@ -178,7 +174,8 @@ class ReporteService:
                 'monto': p.monto,
                 'estado': p.estado
             })
-        return {'registros': registros, 'ingresos': total_ingresos}
+        # El listado ya recorre los pagos del rango: lo confirmado sale de esas mismas filas, sin consultar el acumulado
+        return {'registros': registros, 'ingresos': total_ingresos, 'total_ingresos': ingresos_confirmados}
 
     @staticmethod
     def get_diario_electronico_data(empresa, sede, inicio_dt, fin_dt):
@@ -244,7 +241,14 @@ class ReporteService:
         ).order_by('-subtotal')
         
         total_ventas = sum(item['subtotal'] for item in qs if item['subtotal'])
-        return {'registros': qs, 'total_ventas': total_ventas}
+        data = {'registros': qs, 'total_ventas': total_ventas}
+        # Los cobros (VentasDiarias) no se desglosan por categoría: con una categoría
+        # elegida la tarjeta de cobrado contradiría al total filtrado, así que no se muestra
+        if not categoria_servicio or categoria_servicio == 'TODOS':
+            cobros = VentasDiariasService.por_metodo(empresa, sede, *ReporteService._fechas(inicio_dt, fin_dt))
+            data['cobros_por_metodo'] = cobros
+            data['total_cobrado'] = sum(c['total'] for c in cobros)
+        return data
 
     @staticmethod
     def get_inventario_data(empresa, sede, categoria_producto, alerta_stock):
@@ -260,6 +264,11 @@ class ReporteService:
 
     @staticmethod
     def get_clientes_data(empresa, sede, inicio_date, fin_date, nivel_fidelizacion, estado_deuda):
+        """
+        Filas livianas (dicts) en vez de instancias de Cliente. Con DEUDORES la deuda por cliente
+        es la suma del saldo persistido de sus tickets activos no cancelados, agrupada con HAVING.
+        """
+        campos = ('nombres', 'apellidos', 'telefono', 'numero_documento')
         qs = Cliente.objects.filter(empresa=empresa)
         if inicio_date and fin_date: qs = qs.filter(fecha_registro__range=[inicio_date, fin_date])
         if sede: qs = qs.filter(sede=sede)
@@ -267,21 +276,17 @@ class ReporteService:
         if nivel_fidelizacion == 'NUEVO':
             thirty_days_ago = timezone.now() - timedelta(days=30)
             qs = qs.filter(creado_en__gte=thirty_days_ago)
-        elif nivel_fidelizacion == 'VIP':
-            qs = qs.annotate(total_gastado_qs=Sum('tickets__pagos__monto', filter=Q(tickets__pagos__estado='PAGADO'))).filter(total_gastado_qs__gte=200)
-            
-        clientes_finales = []
-        for c in qs:
-            if estado_deuda == 'DEUDORES':
-                saldos = Ticket.objects.filter(cliente=c, empresa=empresa, estado__in=['RECIBIDO', 'EN_PROCESO', 'LISTO']).exclude(estado='ANULADO').exclude(activo=False)
-                debt = sum(t.calcular_saldo_pendiente() for t in saldos)
-                if debt > 0:
-                    c.saldo_pendiente_total = debt
-                    clientes_finales.append(c)
-            else:
-                c.saldo_pendiente_total = 0
-                clientes_finales.append(c)
-        
-        return {'registros': clientes_finales}
+        elif nivel_fidelizacion and nivel_fidelizacion != 'TODOS':
+            # Segmento RFM precalculado (tickets.segmentacion); 'VIP' = campeones y leales
+            qs = qs.filter(segmento__in=ClienteService.expandir_segmentos([nivel_fidelizacion]))
+
+        registros = qs.order_by('-id').values(*campos, cliente_id=F('id'))
+        if estado_deuda == 'DEUDORES':
+            registros = registros.annotate(saldo_pendiente_total=Sum(
+                'tickets__saldo',
+                filter=Q(tickets__activo=True) & ~Q(tickets__estado='CANCELADO')
+            )).filter(saldo_pendiente_total__gt=0)
+
+        return {'registros': registros, 'mostrar_deuda': estado_deuda == 'DEUDORES'}
 
 
@@ -70,3 +70,145 @@ class ReportesAPITestCase(BaseTenantAPITestCase):
         pipeline = response.data.get('pipeline', {})
         self.assertEqual(pipeline.get('recibidos'), 0)
         self.assertEqual(pipeline.get('en_proceso'), 0)
+
+
+class DashboardVentasDiariasTestCase(BaseTenantAPITestCase):
+    """Ventas del dashboard leídas del acumulado diario, no de los pagos"""
+
+    def setUp(self):
+        super().setUp()
+        from pagos.services import registrar_pago
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="88888888", nombres="Ada")
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=cliente, fecha_prometida=timezone.now()
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre="Lavado", categoria=categoria, precio_base=10)
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=servicio, cantidad=1, precio_unitario=50)
+        efectivo = MetodoPagoConfig.objects.create(empresa=self.empresa, codigo_metodo="EFECTIVO", nombre_mostrar="Efectivo")
+        CajaSesion.objects.create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA', monto_inicial=0
+        )
+        registrar_pago(self.cajero_user, self.empresa, self.ticket, 20, metodo_pago_id=efectivo.id)
+        self.authenticate(self.cajero_user)
+
+    def _get(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "pagos_pago"' in q['sql']])
+        return response.data
+
+    def test_kpis_ventas_hoy(self):
+        self.assertEqual(self._get('/api/reportes/dashboard/kpis/')['kpis']['ventas_hoy'], 20.0)
+
+    def test_tendencia_anual(self):
+        from pagos.models import VentasDiarias
+        VentasDiarias.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, fecha=timezone.localdate() - timedelta(days=200),
+            codigo='YAPE', total=50, cantidad=2
+        )
+        self.assertEqual(len(self._get('/api/reportes/dashboard/analitica/')['ventas_tendencia']), 1)
+        tendencia = self._get('/api/reportes/dashboard/analitica/?dias=365')['ventas_tendencia']
+        self.assertEqual([d['total'] for d in tendencia], [50.0, 20.0])
+
+    def test_caja_suma_lo_confirmado_de_su_listado(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from reportes.services import ReporteService
+        with CaptureQueriesContext(connection) as ctx:
+            data = ReporteService.get_caja_pagos_data(self.empresa, None, None, None, 'TODOS', 'TODOS')
+        self.assertEqual(data['total_ingresos'], 20)
+        self.assertFalse([q for q in ctx.captured_queries if 'pagos_ventasdiarias' in q['sql']])
+
+    def test_ventas_por_categoria_sin_cobrado_global(self):
+        from reportes.services import ReporteService
+        data = ReporteService.get_ventas_data(self.empresa, None, None, None, 'TODOS')
+        self.assertEqual((data['total_ventas'], data['total_cobrado']), (50, 20))
+
+        otra = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Planchado")
+        data = ReporteService.get_ventas_data(self.empresa, None, None, None, str(otra.id))
+        self.assertEqual(data['total_ventas'], 0)
+        self.assertNotIn('total_cobrado', data)
+        self.assertNotIn('cobros_por_metodo', data)
+
+    def test_reportes_ventas_y_caja_cuadran_con_el_acumulado(self):
+        hoy = timezone.localdate().isoformat()
+        for modulo, texto in (('VENTAS', 'Cobrado en el Periodo'), ('CAJA_PAGOS', 'Ingresos Confirmados')):
+            response = self.client.get('/api/reportes/exportar/pdf/', {'modulo': modulo, 'inicio': hoy, 'fin': hoy})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            if response['Content-Type'].startswith('text/html'):
+                contenido = response.content.decode()
+                self.assertIn(texto, contenido)
+                self.assertRegex(contenido, r'S/ 20[.,]00')
+
+
+class ReporteClientesDeudoresTestCase(BaseTenantAPITestCase):
+    """Deuda por cliente en una sola consulta agrupada"""
+
+    def setUp(self):
+        from pagos.services import propagar_pago
+        super().setUp()
+        self.cliente = Cliente.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, numero_documento="77777777", nombres="Bob Bar"
+        )
+        self.ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        categoria = CategoriaServicio.objects.create(empresa=self.empresa, nombre="Lavado")
+        self.servicio = Servicio.objects.create(
+            empresa=self.empresa, nombre="Lavado Test", categoria=categoria, precio_base=12.00
+        )
+        TicketItem.objects.create(empresa=self.empresa, ticket=self.ticket, servicio=self.servicio, cantidad=2, precio_unitario=12)
+
+        # Cliente al día: pagó todo su ticket
+        self.cliente_al_dia = Cliente.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, numero_documento="88888888", nombres="Zoila Quispe"
+        )
+        ticket = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente_al_dia,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        TicketItem.objects.create(empresa=self.empresa, ticket=ticket, servicio=self.servicio, cantidad=1, precio_unitario=30)
+        propagar_pago(Pago.objects.create(empresa=self.empresa, ticket=ticket, monto=30, metodo_pago_snapshot='EFECTIVO'))
+
+        # Un pago parcial y un ticket cancelado que no cuenta como deuda
+        propagar_pago(Pago.objects.create(empresa=self.empresa, ticket=self.ticket, monto=4, metodo_pago_snapshot='EFECTIVO'))
+        cancelado = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente, estado='CANCELADO',
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        TicketItem.objects.create(empresa=self.empresa, ticket=cancelado, servicio=self.servicio, cantidad=1, precio_unitario=50)
+
+    def test_deudores_consulta_unica(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services import ReporteService
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = ReporteService.get_clientes_data(self.empresa, None, None, None, 'TODOS', 'DEUDORES')
+            filas = list(data['registros'])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([f['cliente_id'] for f in filas], [self.cliente.id])
+        self.assertEqual(filas[0]['saldo_pendiente_total'], 20)  # 24 en items - 4 pagados
+        self.assertTrue(data['mostrar_deuda'])
+
+    def test_reporte_clientes_todos(self):
+        from .services import ReporteService
+        data = ReporteService.get_clientes_data(self.empresa, None, None, None, 'TODOS', 'TODOS')
+        ids = {f['cliente_id'] for f in data['registros']}
+        self.assertEqual(ids, {self.cliente.id, self.cliente_al_dia.id})
+
+    def test_pdf_deudores_renderiza(self):
+        self.authenticate(self.admin_user)
+        response = self.client.get('/api/reportes/exportar/pdf/', {
+            'modulo': 'CLIENTES', 'estado_deuda': 'DEUDORES', 'sede_id': 'todas'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        if response['Content-Type'].startswith('text/html'):
+            contenido = response.content.decode()
+            self.assertIn('Bob Bar', contenido)
+            self.assertNotIn('Zoila Quispe', contenido)
@@ -66,8 +66,14 @@ class DashboardAnaliticaView(APIView):
         empresa = request.user.perfil.empresa
         sede = resolver_sede_desde_request(request)
         
+        # Ventana de la tendencia en días (por defecto 30, hasta un año)
+        try:
+            dias = min(max(int(request.query_params.get('dias', 30)), 1), 366)
+        except ValueError:
+            dias = 30
+
         # Delegamos a DashboardService
-        data = DashboardService.get_analitica(empresa, sede)
+        data = DashboardService.get_analitica(empresa, sede, dias)
         return Response(data)
 
 
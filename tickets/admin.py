@@ -51,13 +51,14 @@ class EstadoHistorialInline(admin.TabularInline):
 class TicketAdmin(admin.ModelAdmin):
     list_display = [
         'numero_ticket', 'cliente', 'estado', 'prioridad',
-        'fecha_recepcion', 'fecha_prometida', 'activo'
+        'fecha_recepcion', 'fecha_prometida', 'total', 'saldo', 'activo'
     ]
     list_filter = ['estado', 'prioridad', 'activo', 'fecha_recepcion', 'sede']
     search_fields = ['numero_ticket', 'cliente__nombres', 'cliente__apellidos', 'cliente__numero_documento']
     readonly_fields = [
         'numero_ticket', 'fecha_recepcion', 'creado_en',
-        'actualizado_en', 'creado_por', 'actualizado_por'
+        'actualizado_en', 'creado_por', 'actualizado_por',
+        'total', 'total_pagado', 'saldo'
     ]
     inlines = [TicketItemInline, EstadoHistorialInline]
     
@@ -77,6 +78,9 @@ class TicketAdmin(admin.ModelAdmin):
         ('Dealles', {
             'fields': ('observaciones',)
         }),
+        ('Finanzas', {
+            'fields': ('total', 'total_pagado', 'saldo')
+        }),
         ('Control', {
             'fields': ('activo', 'eliminado_en')
         }),
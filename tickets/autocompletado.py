@@ -0,0 +1,204 @@
+"""
+Autocompletado de clientes para el POS por prefijo de teléfono o documento.
+
+Cada proceso mantiene, por empresa, un índice en memoria: claves (dígitos del
+teléfono, documento en mayúsculas) ordenadas junto al id del cliente, de modo que
+un prefijo se resuelve con bisect sin leer clientes. El índice vale mientras no
+cambie la versión de la empresa (fila de AutocompletadoVersion, leída por clave
+primaria); las escrituras de clientes la incrementan vía invalidar() al confirmarse
+su transacción. La fila de versión no queda bloqueada mientras dura la escritura, y
+todo índice armado antes del incremento (con o sin los datos nuevos) se descarta.
+
+Sin índice vigente (primer uso o tras una escritura) la consulta no espera a
+reconstruirlo: se resuelve en la BD con LIKE 'prefijo%' sobre los índices
+*_pattern_ops de (empresa, telefono) y (empresa, numero_documento), limitada a
+`limite` filas, mientras un único hilo por empresa arma el índice nuevo. Esa
+consulta compara contra el valor guardado, sin quitar separadores ni prefijo de país.
+"""
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+LARGO_MINIMO = 3
+LIMITE = 10
+MAX_EMPRESAS = 50
+
+_indices = OrderedDict()
+_en_construccion = set()
+_lock = threading.Lock()
+
+
+def _digitos(valor):
+    return ''.join(c for c in valor or '' if c.isdigit())
+
+
+def normalizar_termino(termino):
+    """Teléfonos se comparan solo por dígitos; documentos alfanuméricos (CE, pasaporte) en mayúsculas"""
+    termino = (termino or '').strip()
+    digitos = _digitos(termino)
+    if digitos and len(digitos) >= len(termino.replace(' ', '').replace('-', '').replace('+', '')):
+        return digitos
+    return termino.replace(' ', '').upper()
+
+
+def _proyeccion(pk, nombres, apellidos, telefono, documento):
+    return {
+        'id': pk,
+        'nombre_completo': f"{nombres} {apellidos}".strip(),
+        'telefono': telefono,
+        'numero_documento': documento,
+    }
+
+
+class IndicePrefijos:
+    def __init__(self, version, filas):
+        self.version = version
+        self.clientes = {}
+        pares = []
+        for pk, nombres, apellidos, telefono, documento in filas:
+            self.clientes[pk] = _proyeccion(pk, nombres, apellidos, telefono, documento)
+            telefono = _digitos(telefono)
+            if telefono:
+                pares.append((telefono, pk))
+                if len(telefono) > 9:
+                    pares.append((telefono[-9:], pk))  # Sin prefijo de país
+            if documento:
+                pares.append((documento.upper(), pk))
+        pares.sort()
+        self.claves = [clave for clave, _ in pares]
+        self.ids = [pk for _, pk in pares]
+
+    def buscar(self, prefijo, limite=LIMITE):
+        encontrados = []
+        i = bisect_left(self.claves, prefijo)
+        while i < len(self.claves) and self.claves[i].startswith(prefijo) and len(encontrados) < limite:
+            pk = self.ids[i]
+            if pk not in encontrados:
+                encontrados.append(pk)
+            i += 1
+        return [self.clientes[pk] for pk in encontrados]
+
+
+def _version(empresa_id):
+    from .models import AutocompletadoVersion
+    version = AutocompletadoVersion.objects.filter(empresa_id=empresa_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def _construir(empresa_id, version):
+    from .models import Cliente
+    filas = Cliente.objects.filter(empresa_id=empresa_id, activo=True).order_by().values_list(
+        'id', 'nombres', 'apellidos', 'telefono', 'numero_documento'
+    )
+    return IndicePrefijos(version, filas.iterator(chunk_size=5000))
+
+
+def _vigente(empresa_id, version):
+    with _lock:
+        indice = _indices.get(empresa_id)
+        if indice is not None and indice.version == version:
+            _indices.move_to_end(empresa_id)
+            return indice
+    return None
+
+
+def obtener_indice(empresa_id):
+    """Índice vigente de la empresa, armándolo si hace falta (comandos, reconstrucción en segundo plano)"""
+    version = _version(empresa_id)
+    indice = _vigente(empresa_id, version)
+    if indice is not None:
+        return indice
+
+    indice = _construir(empresa_id, version)
+    with _lock:
+        _indices[empresa_id] = indice
+        _indices.move_to_end(empresa_id)
+        while len(_indices) > MAX_EMPRESAS:
+            _indices.popitem(last=False)
+    return indice
+
+
+def _reconstruir(empresa_id):
+    try:
+        obtener_indice(empresa_id)
+    finally:
+        with _lock:
+            _en_construccion.discard(empresa_id)
+
+
+def _en_segundo_plano(funcion, *args):
+    def ejecutar():
+        try:
+            funcion(*args)
+        finally:
+            connection.close()  # El hilo abrió su propia conexión: no dejarla viva (CONN_MAX_AGE)
+    threading.Thread(target=ejecutar, daemon=True).start()
+
+
+def _programar_reconstruccion(empresa_id):
+    """Lanza la reconstrucción del índice de la empresa, salvo que ya haya una en curso en este proceso"""
+    with _lock:
+        if empresa_id in _en_construccion:
+            return
+        _en_construccion.add(empresa_id)
+    try:
+        _en_segundo_plano(_reconstruir, empresa_id)
+    except Exception:
+        with _lock:
+            _en_construccion.discard(empresa_id)
+        raise
+
+
+def _buscar_en_bd(empresa_id, prefijo, limite):
+    from django.db.models import Q
+    from .models import Cliente
+    filas = Cliente.objects.filter(empresa_id=empresa_id, activo=True).filter(
+        Q(telefono__startswith=prefijo) | Q(numero_documento__startswith=prefijo)
+    ).order_by().values_list('id', 'nombres', 'apellidos', 'telefono', 'numero_documento')[:limite]
+    return [_proyeccion(*fila) for fila in filas]
+
+
+def autocompletar(empresa_id, termino, limite=LIMITE):
+    prefijo = normalizar_termino(termino)
+    if len(prefijo) < LARGO_MINIMO:
+        return []
+    version = _version(empresa_id)
+    indice = _vigente(empresa_id, version)
+    if indice is None:
+        _programar_reconstruccion(empresa_id)
+        indice = _vigente(empresa_id, version)  # Otra reconstrucción pudo terminar entretanto
+    if indice is None:
+        return _buscar_en_bd(empresa_id, prefijo, limite)
+    return indice.buscar(prefijo, limite)
+
+
+def invalidar(empresa_id):
+    """
+    Incrementa la versión de la empresa cuando se confirme la transacción en curso
+    (de inmediato fuera de una). Hacerlo después del commit evita serializar todas
+    las escrituras de clientes de la empresa sobre el lock de su fila de versión.
+    """
+    transaction.on_commit(lambda: _incrementar_version(empresa_id))
+
+
+def _incrementar_version(empresa_id):
+    from .models import AutocompletadoVersion
+    filas = AutocompletadoVersion.objects.filter(empresa_id=empresa_id)
+    if filas.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            AutocompletadoVersion.objects.create(empresa_id=empresa_id, version=1)
+    except IntegrityError:
+        filas.update(version=F('version') + 1)  # Otra transacción creó la fila primero
+
+
+def limpiar():
+    """Descarta los índices locales de este proceso (tests, comandos)"""
+    with _lock:
+        _indices.clear()
+        _en_construccion.clear()
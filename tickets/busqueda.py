@@ -0,0 +1,157 @@
+"""
+Búsqueda indexada de clientes y tickets sobre la columna `texto_busqueda`
+(normalizada con core.utils.normalizar_texto_busqueda).
+
+- PostgreSQL: índice GIN pg_trgm; filtra con LIKE por token y ordena por similitud.
+- SQLite (desarrollo local): tabla FTS5 external-content sincronizada por triggers; ordena por bm25.
+- Otros motores: LIKE sin índice.
+
+Si una migración de SQLite reconstruye la tabla base, los triggers se pierden:
+`python manage.py reconstruir_indice_busqueda` los vuelve a crear.
+"""
+
+import logging
+import re
+
+from django.db import connection, OperationalError
+
+from core.utils import normalizar_texto_busqueda
+
+logger = logging.getLogger(__name__)
+
+TABLAS = ('tickets_cliente', 'tickets_ticket')
+LARGO_MINIMO = 2
+
+
+def _tabla_fts(tabla):
+    return f'{tabla}_fts'
+
+
+def crear_indices(conexion):
+    """Crea (idempotente) los índices de búsqueda según el motor"""
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for tabla in TABLAS:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {tabla}_busqueda_trgm '
+                    f'ON {tabla} USING gin (texto_busqueda gin_trgm_ops)'
+                )
+        elif conexion.vendor == 'sqlite':
+            for tabla in TABLAS:
+                fts = _tabla_fts(tabla)
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"texto_busqueda, content='{tabla}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+                    f"INSERT INTO {fts}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF texto_busqueda ON {tabla} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); "
+                    f"INSERT INTO {fts}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END"
+                )
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def eliminar_indices(conexion):
+    with conexion.cursor() as cursor:
+        for tabla in TABLAS:
+            if conexion.vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS {tabla}_busqueda_trgm')
+            elif conexion.vendor == 'sqlite':
+                fts = _tabla_fts(tabla)
+                for sufijo in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{sufijo}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def recalcular_textos(Cliente, Ticket, lote=2000):
+    """
+    Recalcula texto_busqueda de todos los clientes y tickets en lotes.
+    Recibe los modelos para poder usarse también desde migraciones.
+    """
+    textos = {}
+    pendientes = []
+    campos = ('nombres', 'apellidos', 'numero_documento', 'telefono', 'email')
+    for c in Cliente.objects.only(*campos).iterator(chunk_size=lote):
+        c.texto_busqueda = normalizar_texto_busqueda(*(getattr(c, f) for f in campos))
+        textos[c.pk] = c.texto_busqueda
+        pendientes.append(c)
+        if len(pendientes) >= lote:
+            Cliente.objects.bulk_update(pendientes, ['texto_busqueda'])
+            pendientes = []
+    Cliente.objects.bulk_update(pendientes, ['texto_busqueda'])
+
+    pendientes = []
+    for t in Ticket.objects.only('numero_ticket', 'secuencial', 'cliente_id').iterator(chunk_size=lote):
+        t.texto_busqueda = normalizar_texto_busqueda(t.numero_ticket, t.secuencial, textos.get(t.cliente_id))
+        pendientes.append(t)
+        if len(pendientes) >= lote:
+            Ticket.objects.bulk_update(pendientes, ['texto_busqueda'])
+            pendientes = []
+    Ticket.objects.bulk_update(pendientes, ['texto_busqueda'])
+    return len(textos)
+
+
+def tokens(termino):
+    return re.findall(r'\w+', normalizar_texto_busqueda(termino))
+
+
+def buscar_ids(model, empresa_id, termino, limite=20, sede_id=None):
+    """
+    Ids de `model` (Cliente o Ticket) activos de la empresa que contienen todos
+    los tokens del término, ordenados por relevancia.
+    """
+    partes = tokens(termino)
+    if not partes or len(''.join(partes)) < LARGO_MINIMO:
+        return []
+
+    if connection.vendor == 'sqlite':
+        try:
+            return _buscar_fts5(model, empresa_id, partes, limite, sede_id)
+        except OperationalError as e:
+            logger.warning(f"Índice FTS5 no disponible para {model._meta.db_table}, usando LIKE: {e}")
+
+    queryset = model.objects.filter(empresa_id=empresa_id, activo=True)
+    if sede_id:
+        queryset = queryset.filter(sede_id=sede_id)
+    for parte in partes:
+        queryset = queryset.filter(texto_busqueda__contains=parte)
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        queryset = queryset.annotate(
+            relevancia=TrigramSimilarity('texto_busqueda', ' '.join(partes))
+        ).order_by('-relevancia', '-id')
+    else:
+        queryset = queryset.order_by('-id')
+    return list(queryset.values_list('id', flat=True)[:limite])
+
+
+def _buscar_fts5(model, empresa_id, partes, limite, sede_id):
+    tabla = model._meta.db_table
+    fts = _tabla_fts(tabla)
+    # Cada token como prefijo ("tok"*); \w+ garantiza que no haya comillas que escapar
+    consulta = ' AND '.join(f'"{p}"*' for p in partes)
+    sql = (
+        f'SELECT t.id FROM {fts} JOIN {tabla} t ON t.id = {fts}.rowid '
+        f'WHERE {fts} MATCH %s AND t.empresa_id = %s AND t.activo = %s'
+    )
+    params = [consulta, empresa_id, True]
+    if sede_id:
+        sql += ' AND t.sede_id = %s'
+        params.append(sede_id)
+    sql += f' ORDER BY bm25({fts}), t.id DESC LIMIT %s'
+    params.append(limite)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [fila[0] for fila in cursor.fetchall()]
@@ -0,0 +1,176 @@
+"""
+Detección de clientes duplicados dentro de una empresa.
+
+Comparar todos contra todos es O(n²); en su lugar cada cliente se ubica en bloques
+por claves baratas (teléfono normalizado, dígitos del documento, clave fonética del
+nombre) y solo se puntúan los pares que comparten algún bloque. Los bloques muy
+grandes (ej. teléfonos de relleno como 999999999) se descartan.
+
+La fusión vive en ClienteService.fusionar_clientes.
+"""
+
+import logging
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from core.utils import normalizar_texto_busqueda
+
+logger = logging.getLogger(__name__)
+
+UMBRAL = 0.6
+MAX_BLOQUE = 50
+LOTE = 5000
+
+# Reemplazos fonéticos para español, en orden
+_FONETICA = (
+    (r'h', ''),
+    (r'qu', 'k'),
+    (r'c([ei])', r's\1'),
+    (r'c', 'k'),
+    (r'g([ei])', r'j\1'),
+    (r'z', 's'),
+    (r'v', 'b'),
+    (r'w', 'u'),
+    (r'll', 'y'),
+    (r'i', 'y'),
+    (r'x', 'ks'),
+    (r'(.)\1+', r'\1'),
+)
+
+
+def solo_digitos(valor):
+    return re.sub(r'\D', '', valor or '')
+
+
+def clave_telefono(telefono):
+    digitos = solo_digitos(telefono)
+    if len(digitos) < 7 or len(set(digitos)) == 1:
+        return None
+    return digitos[-9:]  # Sin prefijo de país
+
+
+def clave_documento(documento):
+    digitos = solo_digitos(documento).lstrip('0')
+    return digitos if len(digitos) >= 6 else None
+
+
+def fonetica(palabra):
+    for patron, reemplazo in _FONETICA:
+        palabra = re.sub(patron, reemplazo, palabra)
+    return palabra
+
+
+def clave_nombre(nombres, apellidos):
+    """Primer nombre + primer apellido en clave fonética (sin tildes ni mayúsculas)"""
+    partes = normalizar_texto_busqueda(nombres, apellidos).split()
+    if len(partes) < 2:
+        return None
+    primer_apellido = normalizar_texto_busqueda(apellidos).split()[:1] or partes[1:2]
+    return f'{fonetica(partes[0])}|{fonetica(primer_apellido[0])}'
+
+
+def claves(fila):
+    _, nombres, apellidos, telefono, documento, _ = fila
+    candidatas = (
+        ('tel', clave_telefono(telefono)),
+        ('doc', clave_documento(documento)),
+        ('nom', clave_nombre(nombres, apellidos)),
+    )
+    return [f'{tipo}:{valor}' for tipo, valor in candidatas if valor]
+
+
+def puntuar(a, b):
+    """Puntaje 0..1 y motivos para un par de filas (id, nombres, apellidos, telefono, documento, email)"""
+    puntaje = 0.0
+    motivos = []
+    if clave_documento(a[4]) and clave_documento(a[4]) == clave_documento(b[4]):
+        puntaje += 0.5
+        motivos.append('documento')
+    if clave_telefono(a[3]) and clave_telefono(a[3]) == clave_telefono(b[3]):
+        puntaje += 0.3
+        motivos.append('telefono')
+    if a[5] and b[5] and a[5].strip().lower() == b[5].strip().lower():
+        puntaje += 0.2
+        motivos.append('email')
+    similitud = SequenceMatcher(
+        None, normalizar_texto_busqueda(a[1], a[2]), normalizar_texto_busqueda(b[1], b[2])
+    ).ratio()
+    if similitud >= 0.8:
+        motivos.append('nombre')
+    puntaje += 0.4 * similitud
+    return min(round(puntaje, 3), 1.0), motivos
+
+
+def detectar(empresa_id, umbral=UMBRAL, max_bloque=MAX_BLOQUE):
+    """
+    Pares candidatos de clientes activos de la empresa con puntaje >= umbral,
+    ordenados de mayor a menor: [{'a': id, 'b': id, 'puntaje': float, 'motivos': [...]}]
+    """
+    from .models import Cliente
+
+    filas = {}
+    bloques = defaultdict(list)
+    consulta = Cliente.objects.filter(empresa_id=empresa_id, activo=True).order_by().values_list(
+        'id', 'nombres', 'apellidos', 'telefono', 'numero_documento', 'email'
+    )
+    for fila in consulta.iterator(chunk_size=LOTE):
+        filas[fila[0]] = fila
+        for clave in claves(fila):
+            bloques[clave].append(fila[0])
+
+    pares = set()
+    for clave, ids in bloques.items():
+        if len(ids) > max_bloque:
+            logger.info(f"Bloque '{clave}' con {len(ids)} clientes descartado en empresa {empresa_id}")
+            continue
+        ids.sort()
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                pares.add((a, b))
+
+    resultados = []
+    for a, b in pares:
+        puntaje, motivos = puntuar(filas[a], filas[b])
+        if puntaje >= umbral:
+            resultados.append({'a': a, 'b': b, 'puntaje': puntaje, 'motivos': motivos})
+    resultados.sort(key=lambda r: (-r['puntaje'], r['a'], r['b']))
+    return resultados
+
+
+# --- Resultado del job en segundo plano ---
+
+# Pasado este tiempo el resultado se considera vencido y la API vuelve a encolar el job
+VIGENCIA = 60 * 60 * 24
+
+
+def ejecutar(empresa_id, umbral=UMBRAL):
+    """Detecta y guarda el resultado en la fila DeteccionDuplicados de la empresa"""
+    from django.utils import timezone
+    from .models import DeteccionDuplicados
+
+    pares = detectar(empresa_id, umbral=umbral)
+    DeteccionDuplicados.objects.update_or_create(
+        empresa_id=empresa_id,
+        defaults={'umbral': umbral, 'pares': pares, 'generado_en': timezone.now()},
+    )
+    return len(pares)
+
+
+def resultado(empresa_id):
+    """{'generado_en', 'umbral', 'pares'} del último job vigente, o None"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import DeteccionDuplicados
+
+    deteccion = DeteccionDuplicados.objects.filter(
+        empresa_id=empresa_id, generado_en__gt=timezone.now() - timedelta(seconds=VIGENCIA)
+    ).first()
+    if deteccion is None:
+        return None
+    return {'generado_en': deteccion.generado_en.isoformat(), 'umbral': deteccion.umbral, 'pares': deteccion.pares}
+
+
+def descartar_resultado(empresa_id):
+    from .models import DeteccionDuplicados
+    DeteccionDuplicados.objects.filter(empresa_id=empresa_id).delete()
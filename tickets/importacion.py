@@ -0,0 +1,263 @@
+"""
+Importación masiva de clientes desde CSV o XLSX.
+
+El archivo se lee por streaming (csv.reader / openpyxl read_only) y se procesa en
+lotes: validación con ClienteImportacionSerializer, upsert con
+bulk_create(update_conflicts=True) sobre (empresa, tipo_documento, numero_documento)
+y avance persistido en ImportacionClientes. Las filas rechazadas se escriben a un
+CSV temporal en disco que al final se guarda como reporte de errores, de modo que
+la memoria no depende del tamaño del archivo.
+"""
+
+import csv
+import io
+import logging
+import tempfile
+from itertools import islice
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from core.utils import normalizar_texto_busqueda
+
+from . import autocompletado
+
+logger = logging.getLogger(__name__)
+
+LOTE = 1000
+
+# Encabezado normalizado -> campo de Cliente
+ALIAS_COLUMNAS = {
+    'tipo_documento': 'tipo_documento', 'tipo': 'tipo_documento', 'tipo_doc': 'tipo_documento',
+    'numero_documento': 'numero_documento', 'documento': 'numero_documento', 'nro_documento': 'numero_documento',
+    'num_documento': 'numero_documento', 'dni': 'numero_documento', 'ruc': 'numero_documento',
+    'nombres': 'nombres', 'nombre': 'nombres',
+    'apellidos': 'apellidos', 'apellido': 'apellidos',
+    'telefono': 'telefono', 'celular': 'telefono', 'movil': 'telefono', 'whatsapp': 'telefono',
+    'email': 'email', 'correo': 'email', 'correo_electronico': 'email',
+    'direccion': 'direccion',
+    'notas': 'notas',
+}
+CAMPOS = ('tipo_documento', 'numero_documento', 'nombres', 'apellidos', 'telefono', 'email', 'direccion', 'notas')
+OBLIGATORIOS = ('numero_documento', 'nombres')
+# Campos que un upsert puede sobrescribir (la clave única queda fuera)
+ACTUALIZABLES = ('nombres', 'apellidos', 'telefono', 'email', 'direccion', 'notas')
+
+
+class ErrorImportacion(Exception):
+    pass
+
+
+# --- Lectura por streaming ---
+
+def _celda(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # Documentos y teléfonos que Excel guardó como número
+    return str(valor).strip()
+
+
+def _mapear_encabezados(encabezados):
+    campos = [ALIAS_COLUMNAS.get(normalizar_texto_busqueda(_celda(h)).replace(' ', '_')) for h in encabezados]
+    faltantes = [c for c in OBLIGATORIOS if c not in campos]
+    if faltantes:
+        raise ErrorImportacion(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+    return campos
+
+
+def _filas(campos, filas):
+    """(número de fila en el archivo, {campo: valor}) omitiendo filas vacías"""
+    for numero, fila in enumerate(filas, start=2):
+        datos = {campo: _celda(valor) for campo, valor in zip(campos, fila) if campo}
+        if any(datos.values()):
+            yield numero, datos
+
+
+def leer_filas(archivo, nombre):
+    """Devuelve (campos presentes, iterador de filas). `archivo` es un binario abierto."""
+    if nombre.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        hoja = load_workbook(archivo, read_only=True, data_only=True).active
+        filas = hoja.iter_rows(values_only=True)
+    else:
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+        primera = texto.readline()
+        try:
+            dialecto = csv.Sniffer().sniff(primera, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        filas = csv.reader(texto, dialecto)
+        filas = _anteponer(next(csv.reader([primera], dialecto), []), filas)
+
+    campos = _mapear_encabezados(next(filas, []))
+    return {c for c in campos if c}, _filas(campos, filas)
+
+
+def _anteponer(primera, resto):
+    yield primera
+    yield from resto
+
+
+def contar_filas(archivo, nombre):
+    """Estimado de filas de datos para el progreso, sin cargar el archivo"""
+    if nombre.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        hoja = load_workbook(archivo, read_only=True).active
+        return max((hoja.max_row or 1) - 1, 0)
+    lineas = 0
+    for bloque in iter(lambda: archivo.read(1024 * 1024), b''):
+        lineas += bloque.count(b'\n')
+    return max(lineas - 1, 0)
+
+
+# --- Validación y escritura por lote ---
+
+def validar_lote(filas):
+    """Separa filas válidas (numero, datos limpios) de errores (numero, datos, mensaje)"""
+    from .serializers import ClienteImportacionSerializer
+
+    validas, errores = [], []
+    for numero, datos in filas:
+        serializer = ClienteImportacionSerializer(data=datos)
+        if serializer.is_valid():
+            validas.append((numero, serializer.validated_data))
+        else:
+            mensaje = '; '.join(f"{campo}: {' '.join(str(e) for e in errs)}" for campo, errs in serializer.errors.items())
+            errores.append((numero, datos, mensaje))
+    return validas, errores
+
+
+def guardar_lote(empresa_id, usuario_id, validas, campos_archivo):
+    """
+    Upsert del lote. Los campos ausentes en el archivo conservan el valor existente.
+    Devuelve (creados, actualizados).
+    """
+    from .models import Cliente, ClienteStats, Ticket
+
+    # Una misma clave repetida en el lote: gana la última fila (ON CONFLICT no admite repetidos)
+    por_clave = {}
+    for _, datos in validas:
+        por_clave[(datos['tipo_documento'], datos['numero_documento'])] = datos
+
+    existentes = {
+        (fila['tipo_documento'], fila['numero_documento']): fila
+        for fila in Cliente.objects.filter(
+            empresa_id=empresa_id, numero_documento__in={doc for _, doc in por_clave}
+        ).values('id', 'tipo_documento', 'numero_documento', 'texto_busqueda', *ACTUALIZABLES)
+    }
+    existentes = {clave: fila for clave, fila in existentes.items() if clave in por_clave}
+
+    clientes = []
+    texto_cambiado = []
+    for clave, datos in por_clave.items():
+        anterior = existentes.get(clave)
+        cliente = Cliente(
+            empresa_id=empresa_id, creado_por_id=usuario_id, actualizado_por_id=usuario_id,
+            tipo_documento=clave[0], numero_documento=clave[1], activo=True,
+        )
+        for campo in ACTUALIZABLES:
+            if campo in campos_archivo:
+                setattr(cliente, campo, datos.get(campo))
+            elif anterior:
+                setattr(cliente, campo, anterior[campo])
+        if cliente.email == '':
+            cliente.email = None
+        cliente.texto_busqueda = cliente.calcular_texto_busqueda()
+        if anterior and anterior['texto_busqueda'] != cliente.texto_busqueda:
+            texto_cambiado.append(anterior['id'])
+        clientes.append(cliente)
+
+    with transaction.atomic():
+        Cliente.objects.bulk_create(
+            clientes, update_conflicts=True,
+            unique_fields=['empresa', 'tipo_documento', 'numero_documento'],
+            update_fields=[*ACTUALIZABLES, 'texto_busqueda', 'activo', 'actualizado_por', 'actualizado_en'],
+        )
+
+        nuevas = set(por_clave) - set(existentes)
+        if nuevas:
+            nuevos_ids = [
+                pk for pk, tipo, doc in Cliente.objects.filter(
+                    empresa_id=empresa_id, numero_documento__in={doc for _, doc in nuevas}
+                ).values_list('id', 'tipo_documento', 'numero_documento')
+                if (tipo, doc) in nuevas
+            ]
+            ClienteStats.objects.bulk_create(
+                [ClienteStats(cliente_id=pk) for pk in nuevos_ids], ignore_conflicts=True
+            )
+
+        # Los tickets llevan copia del texto del cliente
+        if texto_cambiado:
+            Ticket.objects.filter(cliente_id__in=texto_cambiado).update(
+                texto_busqueda=Ticket.expresion_texto_busqueda(
+                    Subquery(Cliente.objects.filter(pk=OuterRef('cliente_id')).values('texto_busqueda')[:1])
+                )
+            )
+
+        autocompletado.invalidar(empresa_id)
+
+    return len(clientes) - len(existentes), len(existentes)
+
+
+# --- Ejecución completa ---
+
+def ejecutar(importacion_id, lote=LOTE):
+    from .models import ImportacionClientes
+
+    importacion = ImportacionClientes.objects.get(pk=importacion_id)
+    if importacion.estado != 'PENDIENTE':
+        return importacion.estado
+    progreso = ImportacionClientes.objects.filter(pk=importacion_id)
+
+    nombre = importacion.archivo.name
+    with importacion.archivo.open('rb') as archivo:
+        total = contar_filas(archivo, nombre)
+    progreso.update(estado='PROCESANDO', iniciado_en=timezone.now(), total_filas=total)
+
+    contadores = {'procesadas': 0, 'creados': 0, 'actualizados': 0, 'errores': 0}
+    reporte = tempfile.TemporaryFile()
+    texto_reporte = io.TextIOWrapper(reporte, encoding='utf-8', newline='')
+    escritor = csv.writer(texto_reporte)
+    escritor.writerow(['fila', 'error', *CAMPOS])
+    estado, mensaje = 'COMPLETADO', ''
+    try:
+        with importacion.archivo.open('rb') as archivo:
+            campos_archivo, filas = leer_filas(archivo, nombre)
+            while True:
+                bloque = list(islice(filas, lote))
+                if not bloque:
+                    break
+                validas, errores = validar_lote(bloque)
+                for numero, datos, error in errores:
+                    escritor.writerow([numero, error, *(datos.get(c, '') for c in CAMPOS)])
+                creados, actualizados = guardar_lote(
+                    importacion.empresa_id, importacion.creado_por_id, validas, campos_archivo
+                )
+                contadores['procesadas'] += len(bloque)
+                contadores['creados'] += creados
+                contadores['actualizados'] += actualizados
+                contadores['errores'] += len(errores)
+                progreso.update(**contadores)
+    except ErrorImportacion as e:
+        estado, mensaje = 'ERROR', str(e)
+    except Exception as e:
+        logger.exception(f"Error en importación de clientes {importacion_id}")
+        estado, mensaje = 'ERROR', f"Error inesperado: {e}"
+
+    importacion.refresh_from_db()
+    if contadores['errores']:
+        texto_reporte.flush()
+        reporte.seek(0)
+        importacion.reporte_errores.save(f'errores_{importacion_id}.csv', File(reporte), save=False)
+    texto_reporte.close()
+
+    for campo, valor in contadores.items():
+        setattr(importacion, campo, valor)
+    importacion.estado = estado
+    importacion.mensaje = mensaje
+    importacion.finalizado_en = timezone.now()
+    importacion.save()
+    return estado
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Empresa
+from tickets import duplicados
+from tickets.models import Cliente
+from tickets.services import ClienteService
+
+
+class Command(BaseCommand):
+    help = 'Lista pares de clientes posiblemente duplicados de una empresa (o fusiona un grupo con --fusionar).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, required=True, help='ID de la empresa')
+        parser.add_argument('--umbral', type=float, default=duplicados.UMBRAL, help='Puntaje mínimo (0-1)')
+        parser.add_argument('--limite', type=int, default=50, help='Pares a mostrar')
+        parser.add_argument(
+            '--fusionar', type=int, nargs='+', metavar='ID',
+            help='Fusiona: el primer ID es el principal, el resto los duplicados'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            empresa = Empresa.objects.get(pk=options['empresa'])
+        except Empresa.DoesNotExist:
+            raise CommandError(f"Empresa {options['empresa']} no existe")
+
+        if options['fusionar']:
+            principal, *resto = options['fusionar']
+            try:
+                resultado = ClienteService.fusionar_clientes(empresa, principal, resto)
+            except ValueError as e:
+                raise CommandError(str(e))
+            duplicados.descartar_resultado(empresa.id)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Clientes {resultado['duplicados']} fusionados en {resultado['principal']} "
+                f"({resultado['tickets_movidos']} tickets, {resultado['notificaciones_movidas']} notificaciones)."
+            ))
+            return
+
+        pares = duplicados.detectar(empresa.id, umbral=options['umbral'])
+        mostrados = pares[:options['limite']]
+        nombres = Cliente.objects.in_bulk({p['a'] for p in mostrados} | {p['b'] for p in mostrados})
+        for p in mostrados:
+            a, b = nombres[p['a']], nombres[p['b']]
+            self.stdout.write(
+                f"{p['puntaje']:.2f}  {a.pk} {a.nombre_completo} ({a.numero_documento})  <->  "
+                f"{b.pk} {b.nombre_completo} ({b.numero_documento})  [{', '.join(p['motivos'])}]"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(pares)} pares candidatos (umbral {options['umbral']})."))
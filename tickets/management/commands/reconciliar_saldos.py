@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from tickets.models import Ticket
+from tickets.services import TicketService
+
+
+class Command(BaseCommand):
+    help = 'Detecta (y opcionalmente repara) diferencias entre total/total_pagado/saldo persistidos y los items/pagos reales.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa a revisar (por defecto todas)')
+        parser.add_argument('--reparar', action='store_true', help='Corrige los tickets con diferencias')
+
+    def handle(self, *args, **options):
+        queryset = Ticket.objects.all()
+        if options.get('empresa'):
+            queryset = queryset.filter(empresa_id=options['empresa'])
+
+        discrepancias = TicketService.reconciliar_libro(queryset, reparar=options['reparar'])
+
+        for d in discrepancias:
+            total, pagado, saldo = d['persistido']
+            total_real, pagado_real, saldo_real = d['real']
+            self.stdout.write(
+                f"Ticket {d['numero_ticket']} (id={d['id']}): "
+                f"total {total} -> {total_real}, pagado {pagado} -> {pagado_real}, saldo {saldo} -> {saldo_real}"
+            )
+
+        if not discrepancias:
+            self.stdout.write(self.style.SUCCESS("✅ Libro financiero consistente. Sin diferencias."))
+        elif options['reparar']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(discrepancias)} tickets reparados."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(discrepancias)} tickets con diferencias. Ejecute con --reparar para corregirlos."
+            ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from tickets.services import ClienteStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas CRM (ClienteStats) a partir de tickets y pagos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de empresa a reconstruir (por defecto, todas)')
+        parser.add_argument('--lote', type=int, default=1000, help='Clientes por upsert')
+
+    def handle(self, *args, **options):
+        total = ClienteStatsService.recalcular(empresa=options['empresa'], batch_size=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"✅ Estadísticas recalculadas para {total} clientes."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from tickets import busqueda
+from tickets.models import Cliente, Ticket
+
+
+class Command(BaseCommand):
+    help = 'Recrea los índices de búsqueda de clientes y tickets (trigram en PostgreSQL, FTS5 + triggers en SQLite).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recalcular', action='store_true', help='Recalcula también texto_busqueda de todas las filas')
+
+    def handle(self, *args, **options):
+        if options['recalcular']:
+            total = busqueda.recalcular_textos(Cliente, Ticket)
+            self.stdout.write(f"texto_busqueda recalculado ({total} clientes y sus tickets).")
+
+        busqueda.crear_indices(connection)
+        self.stdout.write(self.style.SUCCESS(f"✅ Índices de búsqueda listos ({connection.vendor})."))
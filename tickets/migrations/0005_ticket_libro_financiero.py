@@ -0,0 +1,51 @@
+# Generated by Django 5.2.9 on 2026-10-17 01:58
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def poblar_libro_financiero(apps, schema_editor):
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketItem = apps.get_model('tickets', 'TicketItem')
+    Pago = apps.get_model('pagos', 'Pago')
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+
+    items = TicketItem.objects.filter(ticket=OuterRef('pk')).order_by().values('ticket').annotate(
+        s=Sum(F('cantidad') * F('precio_unitario'))
+    ).values('s')
+    pagos = Pago.objects.filter(ticket=OuterRef('pk'), estado='PAGADO').order_by().values('ticket').annotate(
+        s=Sum('monto')
+    ).values('s')
+    total = Coalesce(Subquery(items, output_field=decimal), Value(0), output_field=decimal)
+    pagado = Coalesce(Subquery(pagos, output_field=decimal), Value(0), output_field=decimal)
+
+    Ticket.objects.update(total=total, total_pagado=pagado)
+    Ticket.objects.update(saldo=F('total') - F('total_pagado'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_alter_ticket_tracking_uuid'),
+        ('pagos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='saldo',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Saldo Pendiente'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='total_pagado',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Pagado'),
+        ),
+        migrations.RunPython(poblar_libro_financiero, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0005_ticket_libro_financiero'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['empresa', 'creado_en', 'id'], name='tickets_cli_empresa_9350a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['empresa', 'fecha_recepcion', 'id'], name='tickets_tic_empresa_9ef07f_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def poblar_secuencias(apps, schema_editor):
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketSecuencia = apps.get_model('tickets', 'TicketSecuencia')
+    maximos = Ticket.objects.order_by().values('empresa_id').annotate(m=Max('secuencial'))
+    TicketSecuencia.objects.bulk_create([
+        TicketSecuencia(empresa_id=fila['empresa_id'], ultimo_valor=fila['m'] or 0)
+        for fila in maximos
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0006_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSecuencia',
+            fields=[
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='secuencia_tickets', serialize=False, to='core.empresa')),
+                ('ultimo_valor', models.PositiveBigIntegerField(default=0, verbose_name='Último secuencial asignado')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Tickets',
+                'verbose_name_plural': 'Secuencias de Tickets',
+            },
+        ),
+        migrations.RunPython(poblar_secuencias, migrations.RunPython.noop),
+    ]
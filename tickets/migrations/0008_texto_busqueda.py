@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    from tickets.busqueda import recalcular_textos
+    recalcular_textos(apps.get_model('tickets', 'Cliente'), apps.get_model('tickets', 'Ticket'))
+
+
+def crear_indices(apps, schema_editor):
+    from tickets.busqueda import crear_indices
+    crear_indices(schema_editor.connection)
+
+
+def eliminar_indices(apps, schema_editor):
+    from tickets.busqueda import eliminar_indices
+    eliminar_indices(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_ticket_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_stats(apps, schema_editor):
+    from tickets.services import ClienteStatsService
+    ClienteStatsService.recalcular(registro=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0008_texto_busqueda'),
+        ('pagos', '0003_pago_paginacion_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClienteStats',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='tickets.cliente')),
+                ('total_tickets', models.PositiveIntegerField(default=0)),
+                ('total_gastado', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('saldo_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('gasto_mes_actual', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('mes_referencia', models.DateField(blank=True, null=True)),
+                ('ultima_visita', models.DateTimeField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Cliente',
+                'verbose_name_plural': 'Estadísticas de Clientes',
+            },
+        ),
+        migrations.RunPython(poblar_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def recrear_indices_busqueda(apps, schema_editor):
+    # En SQLite AddField reconstruye tickets_cliente y se pierden los triggers FTS5
+    from tickets.busqueda import crear_indices
+    crear_indices(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0009_cliente_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='rfm_frecuencia',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='rfm_monetario',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='rfm_recencia',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='segmento',
+            field=models.CharField(blank=True, choices=[('CAMPEON', 'Campeón'), ('LEAL', 'Leal'), ('POTENCIAL', 'Potencial'), ('NUEVO', 'Nuevo'), ('EN_RIESGO', 'En riesgo'), ('PERDIDO', 'Perdido'), ('SIN_COMPRAS', 'Sin compras')], default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='segmento_actualizado_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['empresa', 'segmento'], name='tickets_cli_empresa_d054d2_idx'),
+        ),
+        migrations.RunPython(recrear_indices_busqueda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-17 02:54
+
+import django.db.models.deletion
+import tickets.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0010_cliente_segmento_rfm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionClientes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('actualizado_en', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+                ('archivo', models.FileField(upload_to=tickets.models._ruta_importacion)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20)),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('procesadas', models.PositiveIntegerField(default=0)),
+                ('creados', models.PositiveIntegerField(default=0)),
+                ('actualizados', models.PositiveIntegerField(default=0)),
+                ('errores', models.PositiveIntegerField(default=0)),
+                ('reporte_errores', models.FileField(blank=True, null=True, upload_to=tickets.models._ruta_importacion)),
+                ('mensaje', models.TextField(blank=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+                ('actualizado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_actualizados', to=settings.AUTH_USER_MODEL, verbose_name='Actualizado por')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_creados', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_items', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Importación de Clientes',
+                'verbose_name_plural': 'Importaciones de Clientes',
+                'ordering': ['-creado_en'],
+            },
+        ),
+    ]
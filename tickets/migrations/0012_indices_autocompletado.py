@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0011_importacion_clientes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['empresa', 'telefono'], name='tickets_cli_tel_prefijo_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['empresa', 'numero_documento'], name='tickets_cli_doc_prefijo_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+    ]
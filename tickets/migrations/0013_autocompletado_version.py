@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-17 04:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0012_indices_autocompletado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutocompletadoVersion',
+            fields=[
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='version_autocompletado', serialize=False, to='core.empresa')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Versión de Autocompletado',
+                'verbose_name_plural': 'Versiones de Autocompletado',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-17 04:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('tickets', '0013_autocompletado_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeteccionDuplicados',
+            fields=[
+                ('empresa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='deteccion_duplicados', serialize=False, to='core.empresa')),
+                ('umbral', models.FloatField()),
+                ('pares', models.JSONField(default=list)),
+                ('generado_en', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Detección de Duplicados',
+                'verbose_name_plural': 'Detecciones de Duplicados',
+            },
+        ),
+    ]
@@ -4,10 +4,10 @@ Actualizado para SaaS (Multi-tenant) con lógica de negocio completa
 """
 
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from core.models import AuditModel, SoftDeleteModel, Sede, Empresa, TimeStampedModel
-from core.utils import generar_numero_unico, generar_qr_code
+from core.utils import generar_numero_unico, generar_qr_code, normalizar_texto_busqueda
 from django.utils import timezone
 from .constants import TicketEstados, TicketPrioridades  # ✅ Importar constantes
 
@@ -24,6 +24,18 @@ class Cliente(AuditModel, SoftDeleteModel):
         ('CE', 'Carnet de Extranjería'),
         ('PASAPORTE', 'Pasaporte'),
     ]
+
+    # Segmentos RFM (ver tickets.segmentacion)
+    SEGMENTO_CHOICES = [
+        ('CAMPEON', 'Campeón'),
+        ('LEAL', 'Leal'),
+        ('POTENCIAL', 'Potencial'),
+        ('NUEVO', 'Nuevo'),
+        ('EN_RIESGO', 'En riesgo'),
+        ('PERDIDO', 'Perdido'),
+        ('SIN_COMPRAS', 'Sin compras'),
+    ]
+    SEGMENTOS_VIP = ('CAMPEON', 'LEAL')
     
     tipo_documento = models.CharField(max_length=20, choices=TIPO_DOCUMENTO_CHOICES, default='DNI')
     numero_documento = models.CharField(max_length=20, verbose_name="Número de documento")
@@ -47,6 +59,16 @@ class Cliente(AuditModel, SoftDeleteModel):
         null=True,
         blank=True
     )
+
+    # Texto normalizado (sin tildes, minúsculas) indexado para búsqueda: trigram en PostgreSQL, FTS5 en SQLite
+    texto_busqueda = models.TextField(blank=True, default='', editable=False)
+
+    # Segmentación RFM precalculada por la tarea nocturna (puntajes 1-5)
+    segmento = models.CharField(max_length=20, choices=SEGMENTO_CHOICES, blank=True, default='', editable=False)
+    rfm_recencia = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    rfm_frecuencia = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    rfm_monetario = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    segmento_actualizado_en = models.DateTimeField(null=True, blank=True, editable=False)
     
     class Meta:
         verbose_name = "Cliente"
@@ -58,6 +80,17 @@ class Cliente(AuditModel, SoftDeleteModel):
             models.Index(fields=['numero_documento']),
             models.Index(fields=['telefono']),
             models.Index(fields=['email']),  # ✅ Índice para búsquedas
+            models.Index(fields=['empresa', 'creado_en', 'id']),  # Paginación por cursor
+            models.Index(fields=['empresa', 'segmento']),
+            # Autocompletado POS por prefijo (LIKE 'abc%'); opclasses solo aplica en PostgreSQL
+            models.Index(
+                fields=['empresa', 'telefono'], opclasses=['int8_ops', 'varchar_pattern_ops'],
+                name='tickets_cli_tel_prefijo_idx'
+            ),
+            models.Index(
+                fields=['empresa', 'numero_documento'], opclasses=['int8_ops', 'varchar_pattern_ops'],
+                name='tickets_cli_doc_prefijo_idx'
+            ),
         ]
     
     def __str__(self):
@@ -67,6 +100,31 @@ class Cliente(AuditModel, SoftDeleteModel):
     def nombre_completo(self):
         return f"{self.nombres} {self.apellidos}".strip()
 
+    def calcular_texto_busqueda(self):
+        return normalizar_texto_busqueda(
+            self.nombres, self.apellidos, self.numero_documento, self.telefono, self.email
+        )
+
+    def save(self, *args, **kwargs):
+        self.texto_busqueda = self.calcular_texto_busqueda()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'texto_busqueda' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['texto_busqueda']
+
+        anterior = None
+        if not self._state.adding:
+            anterior = Cliente.objects.filter(pk=self.pk).values_list('texto_busqueda', flat=True).first()
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            ClienteStats.objects.get_or_create(cliente=self)
+
+        # Los tickets llevan copia del texto del cliente
+        if anterior is not None and anterior != self.texto_busqueda:
+            Ticket.objects.filter(cliente=self).update(
+                texto_busqueda=Ticket.expresion_texto_busqueda(self.texto_busqueda)
+            )
+
 
 class Ticket(AuditModel, SoftDeleteModel):
     """Modelo principal de Ticket/Orden de Servicio (SaaS)"""
@@ -90,6 +148,9 @@ class Ticket(AuditModel, SoftDeleteModel):
     # Nuevo campo SaaS: Secuencial humano reseteable por empresa
     secuencial = models.PositiveIntegerField(default=0, verbose_name="Secuencial Humano")
     
+    # numero_ticket + secuencial + texto del cliente, normalizado (ver Cliente.texto_busqueda)
+    texto_busqueda = models.TextField(blank=True, default='', editable=False)
+
     # Campo para rastreo público seguro (no adivinable)
     tracking_uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, db_index=True)
 
@@ -133,6 +194,14 @@ class Ticket(AuditModel, SoftDeleteModel):
     
     observaciones = models.TextField(blank=True, verbose_name="Observaciones")
     
+    # Libro financiero denormalizado: se mantiene con updates atómicos (F())
+    # desde TicketService.aplicar_delta_financiero. Nunca se escribe desde save().
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Total")
+    total_pagado = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Total Pagado")
+    saldo = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Saldo Pendiente")
+    
+    CAMPOS_FINANCIEROS = ('total', 'total_pagado', 'saldo')
+    
     class Meta:
         verbose_name = "Ticket"
         verbose_name_plural = "Tickets"
@@ -143,6 +212,7 @@ class Ticket(AuditModel, SoftDeleteModel):
             models.Index(fields=['numero_ticket']),
             models.Index(fields=['estado', 'fecha_recepcion']),
             models.Index(fields=['cliente', 'fecha_recepcion']),
+            models.Index(fields=['empresa', 'fecha_recepcion', 'id']),  # Paginación por cursor
         ]
     
     def __str__(self):
@@ -151,8 +221,80 @@ class Ticket(AuditModel, SoftDeleteModel):
     def save(self, *args, **kwargs):
         from .services import TicketService
         # Delegamos la generación de número y QR al servicio (SRP)
-        TicketService.prepare_new_ticket(self)
-        super().save(*args, **kwargs)
+        # Los campos financieros solo cambian vía F(); un save() con la instancia
+        # en memoria desactualizada no debe pisar los acumulados de la BD.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_FINANCIEROS
+            ]
+        # Reserva del secuencial e INSERT en la misma transacción: si el INSERT
+        # falla, el contador vuelve atrás y no quedan huecos en la numeración.
+        with transaction.atomic():
+            adding = self._state.adding
+            TicketService.prepare_new_ticket(self)
+            update_fields = kwargs.get('update_fields')
+            cliente_anterior = getattr(self, '_cliente_id_cargado', None)
+            cliente_cambio = adding or self.cliente_id != cliente_anterior
+            cliente_guardado = cliente_cambio and (update_fields is None or 'cliente' in update_fields)
+            if cliente_guardado:
+                self.texto_busqueda = self.calcular_texto_busqueda()
+                self._cliente_id_cargado = self.cliente_id
+                if update_fields is not None and 'texto_busqueda' not in update_fields:
+                    kwargs['update_fields'] = list(update_fields) + ['texto_busqueda']
+            estado_anterior = getattr(self, '_estado_cargado', None)
+            super().save(*args, **kwargs)
+            self._estado_cargado = self.estado
+            self._actualizar_stats_cliente(adding, cliente_guardado, cliente_anterior, estado_anterior)
+
+    def _actualizar_stats_cliente(self, adding, cliente_guardado, cliente_anterior, estado_anterior):
+        """Alta: delta incremental. Cambio de cliente o entrada/salida de CANCELADO: recálculo puntual."""
+        from .services import ClienteStatsService
+        if adding:
+            ClienteStatsService.registrar_ticket(self)
+            return
+        afectados = set()
+        if cliente_guardado:
+            afectados.update(c for c in (cliente_anterior, self.cliente_id) if c)
+        if estado_anterior is not None and (estado_anterior == 'CANCELADO') != (self.estado == 'CANCELADO'):
+            afectados.add(self.cliente_id)
+        if afectados:
+            ClienteStatsService.recalcular(afectados)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._cliente_id_cargado = instance.__dict__.get('cliente_id')
+        instance._estado_cargado = instance.__dict__.get('estado')
+        return instance
+
+    def calcular_texto_busqueda(self, texto_cliente=None):
+        if texto_cliente is None:
+            if Ticket.cliente.is_cached(self):
+                texto_cliente = self.cliente.texto_busqueda
+            else:
+                texto_cliente = Cliente.objects.filter(pk=self.cliente_id).values_list(
+                    'texto_busqueda', flat=True
+                ).first()
+        return normalizar_texto_busqueda(self.numero_ticket, self.secuencial, texto_cliente)
+
+    @staticmethod
+    def expresion_texto_busqueda(texto_cliente):
+        """
+        Equivalente SQL de calcular_texto_busqueda para UPDATEs masivos (numero_ticket ya es ASCII).
+        texto_cliente: texto ya normalizado o una expresión (ej. Subquery del texto del cliente).
+        """
+        from django.db.models.functions import Cast, Concat, Lower
+        if hasattr(texto_cliente, 'resolve_expression'):
+            sufijo = Concat(models.Value(' '), texto_cliente, output_field=models.TextField())
+        else:
+            sufijo = models.Value(f' {texto_cliente}' if texto_cliente else '')
+        return Concat(
+            Lower('numero_ticket'), models.Value(' '),
+            Cast('secuencial', models.CharField()),
+            sufijo,
+            output_field=models.TextField()
+        )
     
     # --- MÉTODOS DE NEGOCIO ORIGINALES RESTAURADOS ---
 
@@ -258,7 +400,96 @@ class TicketItem(AuditModel):
         from .services import TicketService
         # Delegar cálculo de precio al servicio (SRP)
         TicketService.set_item_price(self)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Fila bloqueada: dos ediciones simultáneas no calculan su delta desde el mismo estado
+            anterior = None
+            if not self._state.adding:
+                anterior = TicketItem.objects.select_for_update().filter(pk=self.pk).values(
+                    'ticket_id', 'cantidad', 'precio_unitario'
+                ).first()
+            super().save(*args, **kwargs)
+            TicketService.registrar_cambio_item(self, anterior)
+
+
+class ClienteStats(models.Model):
+    """
+    Proyección de indicadores CRM por cliente, mantenida incrementalmente por
+    ClienteStatsService (alta de tickets, libro financiero y pagos).
+    `reconstruir_cliente_stats` la recalcula desde cero.
+    """
+    cliente = models.OneToOneField(
+        Cliente,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    total_tickets = models.PositiveIntegerField(default=0)
+    total_gastado = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Suma de saldos de tickets no cancelados
+    saldo_pendiente = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Pagos del mes `mes_referencia`; si no es el mes en curso, el gasto del mes actual es 0
+    gasto_mes_actual = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    mes_referencia = models.DateField(null=True, blank=True)
+    ultima_visita = models.DateTimeField(null=True, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estadísticas de Cliente"
+        verbose_name_plural = "Estadísticas de Clientes"
+
+    def __str__(self):
+        return f"Stats cliente {self.cliente_id}"
+
+    @property
+    def gasto_mes_vigente(self):
+        from .services import ClienteStatsService
+        if self.mes_referencia != ClienteStatsService.inicio_mes_actual():
+            return 0
+        return self.gasto_mes_actual
+
+
+class TicketSecuencia(models.Model):
+    """
+    Contador de numeración de tickets por empresa.
+    Una fila por empresa, incrementada con un único UPDATE ... RETURNING
+    (ver TicketService.reservar_secuenciales).
+    """
+    empresa = models.OneToOneField(
+        Empresa,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='secuencia_tickets'
+    )
+    ultimo_valor = models.PositiveBigIntegerField(default=0, verbose_name="Último secuencial asignado")
+
+    class Meta:
+        verbose_name = "Secuencia de Tickets"
+        verbose_name_plural = "Secuencias de Tickets"
+
+    def __str__(self):
+        return f"{self.empresa_id}: {self.ultimo_valor}"
+
+
+class AutocompletadoVersion(models.Model):
+    """
+    Versión del índice de autocompletado de clientes por empresa.
+    Cada escritura de clientes la incrementa al confirmarse su transacción
+    (ver tickets.autocompletado.invalidar); los índices en memoria la comparan.
+    """
+    empresa = models.OneToOneField(
+        Empresa,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='version_autocompletado'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Versión de Autocompletado"
+        verbose_name_plural = "Versiones de Autocompletado"
+
+    def __str__(self):
+        return f"{self.empresa_id}: {self.version}"
 
 
 class EstadoHistorial(AuditModel):
@@ -294,4 +525,69 @@ class EstadoHistorial(AuditModel):
     
     @property
     def usuario(self):
-        return self.creado_por
\ No newline at end of file
+        return self.creado_por
+
+def _ruta_importacion(instance, filename):
+    return f'importaciones_clientes/{instance.empresa_id}/{uuid.uuid4().hex}_{filename}'
+
+
+class ImportacionClientes(AuditModel):
+    """Carga masiva de clientes desde CSV/XLSX, procesada en segundo plano (ver tickets.importacion)"""
+
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
+    ]
+
+    archivo = models.FileField(upload_to=_ruta_importacion)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    # Estimado al iniciar (filas de datos del archivo)
+    total_filas = models.PositiveIntegerField(default=0)
+    procesadas = models.PositiveIntegerField(default=0)
+    creados = models.PositiveIntegerField(default=0)
+    actualizados = models.PositiveIntegerField(default=0)
+    errores = models.PositiveIntegerField(default=0)
+    reporte_errores = models.FileField(upload_to=_ruta_importacion, null=True, blank=True)
+    mensaje = models.TextField(blank=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Importación de Clientes"
+        verbose_name_plural = "Importaciones de Clientes"
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"Importación {self.pk} ({self.estado})"
+
+    @property
+    def progreso(self):
+        if not self.total_filas:
+            return 100 if self.estado == 'COMPLETADO' else 0
+        return min(100, round(self.procesadas * 100 / self.total_filas))
+
+
+class DeteccionDuplicados(models.Model):
+    """
+    Último resultado de la detección de clientes duplicados por empresa
+    (ver tickets.duplicados). Una fila por empresa, reescrita en cada ejecución.
+    """
+    empresa = models.OneToOneField(
+        Empresa,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='deteccion_duplicados'
+    )
+    umbral = models.FloatField()
+    # [{'a': id, 'b': id, 'puntaje': float, 'motivos': [...]}], de mayor a menor puntaje
+    pares = models.JSONField(default=list)
+    generado_en = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Detección de Duplicados"
+        verbose_name_plural = "Detecciones de Duplicados"
+
+    def __str__(self):
+        return f"{self.empresa_id}: {len(self.pares)} pares"
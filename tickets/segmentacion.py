@@ -0,0 +1,122 @@
+"""
+Segmentación RFM (recencia, frecuencia, monto) de la cartera de clientes.
+
+Lee los pagos de la empresa en una sola consulta por streaming (cliente, fecha, monto),
+agrega por cliente y asigna puntajes por quintil con NumPy, sin consultas por fila.
+El resultado se guarda en Cliente (segmento, rfm_*), que es lo que usan los filtros
+del CRM y los reportes. Lo ejecuta la tarea nocturna tickets.tasks.segmentar_clientes_rfm.
+"""
+
+from itertools import islice
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+QUINTILES = 5
+LOTE = 5000
+
+# Orden de evaluación: gana la primera regla que se cumple
+REGLAS = (
+    ('CAMPEON', lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),
+    ('LEAL', lambda r, f, m: (r >= 3) & (f >= 4)),
+    ('NUEVO', lambda r, f, m: (r >= 4) & (f <= 2)),
+    ('EN_RIESGO', lambda r, f, m: (r <= 2) & (f >= 4)),
+    ('PERDIDO', lambda r, f, m: r <= 2),
+)
+SEGMENTO_POR_DEFECTO = 'POTENCIAL'
+
+
+def puntajes(valores, quintiles=QUINTILES):
+    """Puntaje 1..quintiles según el rango percentil medio de cada valor (empates reciben el mismo puntaje)"""
+    ordenados = np.sort(valores)
+    rango = (
+        np.searchsorted(ordenados, valores, side='left') + np.searchsorted(ordenados, valores, side='right')
+    ) / (2 * len(valores))
+    return np.clip(np.ceil(rango * quintiles), 1, quintiles).astype(np.int8)
+
+
+def calcular_rfm(clientes, fechas, montos, ahora):
+    """
+    clientes (int), fechas (timestamp epoch) y montos: un elemento por pago.
+    Devuelve (ids, recencia, frecuencia, monetario, segmentos) por cliente.
+    """
+    ids, inversa = np.unique(clientes, return_inverse=True)
+    frecuencia = np.bincount(inversa, minlength=len(ids))
+    monetario = np.bincount(inversa, weights=montos, minlength=len(ids))
+    ultima = np.full(len(ids), -np.inf)
+    np.maximum.at(ultima, inversa, fechas)
+    dias = (ahora - ultima) / 86400
+
+    r = puntajes(-dias)  # Más reciente = mejor puntaje
+    f = puntajes(frecuencia)
+    m = puntajes(monetario)
+    segmentos = np.select(
+        [regla(r, f, m) for _, regla in REGLAS],
+        [nombre for nombre, _ in REGLAS],
+        default=SEGMENTO_POR_DEFECTO,
+    )
+    return ids, r, f, m, segmentos
+
+
+def cargar_pagos(empresa_id, lote=LOTE):
+    """(clientes, fechas, montos) de los pagos vigentes de la empresa, leídos por streaming"""
+    from pagos.models import Pago
+
+    filas = iter(
+        Pago.objects.filter(empresa_id=empresa_id, estado='PAGADO', ticket__activo=True)
+        .order_by()
+        .values_list('ticket__cliente_id', 'fecha_pago', 'monto')
+        .iterator(chunk_size=lote)
+    )
+    clientes, fechas, montos = [], [], []
+    while True:
+        bloque = list(islice(filas, lote))
+        if not bloque:
+            break
+        c, f, m = zip(*bloque)
+        clientes.append(np.fromiter(c, dtype=np.int64, count=len(c)))
+        fechas.append(np.fromiter((x.timestamp() for x in f), dtype=np.float64, count=len(f)))
+        montos.append(np.fromiter(m, dtype=np.float64, count=len(m)))
+
+    if not clientes:
+        vacio = np.empty(0)
+        return vacio.astype(np.int64), vacio, vacio
+    return np.concatenate(clientes), np.concatenate(fechas), np.concatenate(montos)
+
+
+def segmentar_empresa(empresa_id, lote=1000):
+    """Recalcula y guarda los segmentos de la empresa. Devuelve {segmento: cantidad}."""
+    from .models import Cliente
+
+    ahora = timezone.now()
+    clientes, fechas, montos = cargar_pagos(empresa_id)
+
+    resumen = {}
+    if len(clientes):
+        ids, r, f, m, segmentos = calcular_rfm(clientes, fechas, montos, ahora.timestamp())
+        etiquetas, cantidades = np.unique(segmentos, return_counts=True)
+        resumen = {str(e): int(c) for e, c in zip(etiquetas, cantidades)}
+
+        campos = ['segmento', 'rfm_recencia', 'rfm_frecuencia', 'rfm_monetario', 'segmento_actualizado_en']
+        for i in range(0, len(ids), lote):
+            Cliente.objects.bulk_update([
+                Cliente(
+                    pk=int(pk), segmento=str(seg), rfm_recencia=int(rr), rfm_frecuencia=int(ff),
+                    rfm_monetario=int(mm), segmento_actualizado_en=ahora,
+                )
+                for pk, rr, ff, mm, seg in zip(
+                    ids[i:i + lote], r[i:i + lote], f[i:i + lote], m[i:i + lote], segmentos[i:i + lote]
+                )
+            ], campos)
+
+    # Los que no se tocaron en esta corrida no tienen pagos
+    sin_compras = Cliente.objects.filter(empresa_id=empresa_id).filter(
+        Q(segmento_actualizado_en__isnull=True) | Q(segmento_actualizado_en__lt=ahora)
+    ).update(
+        segmento='SIN_COMPRAS', rfm_recencia=None, rfm_frecuencia=None, rfm_monetario=None,
+        segmento_actualizado_en=ahora,
+    )
+    if sin_compras:
+        resumen['SIN_COMPRAS'] = sin_compras
+    return resumen
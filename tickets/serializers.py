@@ -6,8 +6,9 @@ Actualizado para SaaS (Multi-tenant) y Pagos Dinámicos
 from rest_framework import serializers
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Sum
-from .models import Cliente, Ticket, TicketItem, EstadoHistorial
+from django.db.models import Sum, prefetch_related_objects
+from .models import Cliente, ClienteStats, ImportacionClientes, Ticket, TicketItem, EstadoHistorial
+from .services import TicketService
 from pagos.models import CajaSesion, Pago, MetodoPagoConfig
 
 # --- SERIALIZERS DE CLIENTE ---
@@ -15,7 +16,7 @@ from pagos.models import CajaSesion, Pago, MetodoPagoConfig
 class ClienteSerializer(serializers.ModelSerializer):
     """Serializer básico para CRUD de clientes"""
     nombre_completo = serializers.ReadOnlyField()
-    total_gastado = serializers.ReadOnlyField()
+    total_gastado = serializers.ReadOnlyField(source='stats.total_gastado')
     
     class Meta:
         model = Cliente
@@ -23,6 +24,14 @@ class ClienteSerializer(serializers.ModelSerializer):
         # SAAS: empresa y creado_por son automáticos
         read_only_fields = ['creado_en', 'fecha_registro', 'empresa', 'creado_por']
 
+class ClienteDetalleSerializer(ClienteSerializer):
+    """Detalle con resumen agregado del historial; los tickets se piden paginados aparte"""
+    resumen = serializers.SerializerMethodField()
+
+    def get_resumen(self, obj):
+        from .services import ClienteService
+        return ClienteService.resumen_historial(obj)
+
 class ClienteListSerializer(serializers.ModelSerializer):
     """Serializer ligero para dropdowns y selecciones simples"""
     nombre_completo = serializers.ReadOnlyField()
@@ -33,7 +42,8 @@ class ClienteListSerializer(serializers.ModelSerializer):
 class ClienteCRMSerializer(serializers.ModelSerializer):
     """
     Serializer ROBUSTO para el módulo de Clientes (Directorio).
-    Incluye indicadores de negocio calculados al vuelo.
+    Los indicadores de negocio se leen de ClienteStats (select_related en el listado);
+    solo se calculan al vuelo si el cliente aún no tiene fila de estadísticas.
     """
     nombre_completo = serializers.ReadOnlyField()
     ultima_visita = serializers.DateTimeField(read_only=True)
@@ -46,37 +56,141 @@ class ClienteCRMSerializer(serializers.ModelSerializer):
             'id', 'tipo_documento', 'numero_documento', 
             'nombre_completo', 'nombres', 'apellidos', 'telefono', 'email', 'direccion', 
             'ultima_visita', 'saldo_pendiente', 'es_vip', 
+            'segmento', 'rfm_recencia', 'rfm_frecuencia', 'rfm_monetario',
             'notas', 'preferencias', 'creado_en'
         ]
     
+    @staticmethod
+    def _stats(obj):
+        try:
+            return obj.stats
+        except ClienteStats.DoesNotExist:
+            return None
+
     def get_saldo_pendiente(self, obj):
-        deuda = 0
+        stats = self._stats(obj)
+        if stats is not None:
+            return float(stats.saldo_pendiente)
         # SAAS: Filtrar solo tickets de la misma empresa (por integridad)
-        tickets_activos = obj.tickets.filter(empresa=obj.empresa).exclude(estado='CANCELADO')
-        for ticket in tickets_activos:
-            deuda += ticket.calcular_saldo_pendiente()
+        deuda = obj.tickets.filter(empresa=obj.empresa).exclude(estado='CANCELADO').aggregate(
+            deuda=Sum('saldo')
+        )['deuda'] or 0
         return float(deuda)
 
     def get_es_vip(self, obj):
-        # Lógica VIP: Gasto > 200 en el mes actual
-        hoy = timezone.now()
+        # Segmento RFM precalculado por la tarea nocturna
+        if obj.segmento:
+            return obj.segmento in Cliente.SEGMENTOS_VIP
+
+        # Aún sin segmentar. Lógica VIP: Gasto > 200 en el mes actual
+        stats = self._stats(obj)
+        if stats is not None:
+            return stats.gasto_mes_vigente > 200
+
+        hoy = timezone.localtime()
         inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        total_mes = 0
-        tickets = obj.tickets.filter(empresa=obj.empresa) # Filtro SaaS
-        
-        for ticket in tickets:
-            pagos_mes = ticket.pagos.filter(
-                estado='PAGADO',
-                fecha_pago__gte=inicio_mes
-            ).aggregate(total=Sum('monto'))['total'] or 0
-            total_mes += pagos_mes
-            
+        total_mes = Pago.objects.filter(
+            ticket__cliente=obj,
+            ticket__empresa=obj.empresa, # Filtro SaaS
+            estado='PAGADO',
+            fecha_pago__gte=inicio_mes
+        ).aggregate(total=Sum('monto'))['total'] or 0
         return total_mes > 200
 
+
+class ClienteImportacionSerializer(serializers.Serializer):
+    """Validación de una fila de importación (sin validadores de unicidad: la carga es un upsert)"""
+    tipo_documento = serializers.ChoiceField(choices=Cliente.TIPO_DOCUMENTO_CHOICES, default='DNI')
+    numero_documento = serializers.CharField(max_length=20)
+    nombres = serializers.CharField(max_length=200)
+    apellidos = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
+    telefono = serializers.CharField(max_length=20, required=False, allow_blank=True, default='')
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    direccion = serializers.CharField(required=False, allow_blank=True, default='')
+    notas = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def to_internal_value(self, data):
+        data = dict(data)
+        if data.get('tipo_documento'):
+            data['tipo_documento'] = data['tipo_documento'].upper()
+        else:
+            data.pop('tipo_documento', None)
+        return super().to_internal_value(data)
+
+
+class ImportacionClientesSerializer(serializers.ModelSerializer):
+    """Alta y seguimiento de una importación masiva de clientes"""
+    archivo = serializers.FileField(write_only=True)
+    progreso = serializers.ReadOnlyField()
+    tiene_reporte_errores = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportacionClientes
+        fields = [
+            'id', 'archivo', 'estado', 'progreso', 'total_filas', 'procesadas',
+            'creados', 'actualizados', 'errores', 'tiene_reporte_errores', 'mensaje',
+            'creado_en', 'iniciado_en', 'finalizado_en'
+        ]
+        read_only_fields = [
+            'estado', 'total_filas', 'procesadas', 'creados', 'actualizados', 'errores',
+            'mensaje', 'creado_en', 'iniciado_en', 'finalizado_en'
+        ]
+
+    def get_tiene_reporte_errores(self, obj):
+        return bool(obj.reporte_errores)
+
+    def validate_archivo(self, value):
+        if not value.name.lower().endswith(('.csv', '.xlsx')):
+            raise serializers.ValidationError("Formato no soportado: use CSV o XLSX")
+        return value
+
+
+class ClienteFusionSerializer(serializers.Serializer):
+    """Fusión de clientes duplicados en un cliente principal"""
+    principal = serializers.IntegerField()
+    duplicados = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=50)
+
 # --- SERIALIZERS DE TICKET Y OTROS ---
 
+class PKPrecargadoField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField que primero busca en el mapa precargado por PrecargaPKListSerializer"""
+
+    def to_internal_value(self, data):
+        mapa = getattr(self.parent, '_precargados', {}).get(self.field_name)
+        if mapa:
+            obj = mapa.get(data)
+            if obj is not None:
+                return obj
+        return super().to_internal_value(data)
+
+
+class PrecargaPKListSerializer(serializers.ListSerializer):
+    """
+    Al validar una lista, resuelve las FKs de todos los elementos con una query por campo
+    (in_bulk) en lugar de un .get() por elemento y campo.
+    """
+
+    def to_internal_value(self, data):
+        precargados = {}
+        if isinstance(data, list):
+            for nombre, field in self.child.fields.items():
+                if not isinstance(field, PKPrecargadoField) or field.read_only:
+                    continue
+                ids = {
+                    d.get(nombre) for d in data
+                    if isinstance(d, dict) and isinstance(d.get(nombre), int)
+                }
+                if ids:
+                    precargados[nombre] = field.get_queryset().in_bulk(ids)
+        self.child._precargados = precargados
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child._precargados = {}
+
+
 class TicketItemSerializer(serializers.ModelSerializer):
+    serializer_related_field = PKPrecargadoField
     servicio_nombre = serializers.CharField(source='servicio.nombre', read_only=True)
     prenda_nombre = serializers.CharField(source='prenda.nombre', read_only=True)
     subtotal = serializers.ReadOnlyField()
@@ -89,6 +203,7 @@ class TicketItemSerializer(serializers.ModelSerializer):
             'completado', 'creado_en'
         ]
         read_only_fields = ['creado_en', 'subtotal', 'empresa', 'creado_por']
+        list_serializer_class = PrecargaPKListSerializer
 
 class EstadoHistorialSerializer(serializers.ModelSerializer):
     # En AuditModel el usuario es creado_por
@@ -128,11 +243,16 @@ class TicketSerializer(serializers.ModelSerializer):
             'empresa', 'creado_por'
         ]
     
-    def get_total(self, obj): return float(obj.calcular_total())
-    def get_saldo_pendiente(self, obj): return float(obj.calcular_saldo_pendiente())
-    def get_esta_pagado(self, obj): return obj.esta_pagado()
+    def get_total(self, obj): return float(obj.total)
+    def get_saldo_pendiente(self, obj): return float(obj.saldo)
+    def get_esta_pagado(self, obj): return obj.saldo <= 0
 
 class TicketListSerializer(serializers.ModelSerializer):
+    """
+    Serializer de listado. Con un queryset de TicketService.get_filtered_tickets
+    consume solo anotaciones (total_ticket_db, total_pagado_db, es_extornable_db)
+    y no toca la BD por fila; sin ellas, usa el libro persistido del ticket.
+    """
     cliente_nombre = serializers.CharField(source='cliente.nombre_completo', read_only=True)
     total = serializers.SerializerMethodField()
     saldo_pendiente = serializers.SerializerMethodField()
@@ -149,11 +269,22 @@ class TicketListSerializer(serializers.ModelSerializer):
             'es_extornable', 'ultimo_metodo_pago'
         ]
     
-    def get_total(self, obj): return float(obj.calcular_total())
-    def get_saldo_pendiente(self, obj): return float(obj.calcular_saldo_pendiente())
+    def get_total(self, obj):
+        total = getattr(obj, 'total_ticket_db', None)
+        return float(obj.total if total is None else total)
+
+    def get_saldo_pendiente(self, obj):
+        total = getattr(obj, 'total_ticket_db', None)
+        pagado = getattr(obj, 'total_pagado_db', None)
+        if total is None or pagado is None:
+            return float(obj.saldo)
+        return float(total - pagado)
     
     def get_es_extornable(self, obj):
-        # Valida si tiene pagos hoy que puedan ser anulados
+        anotado = getattr(obj, 'es_extornable_db', None)
+        if anotado is not None:
+            return anotado
+        # Fallback sin anotación: valida si tiene pagos hoy que puedan ser anulados
         hoy = timezone.localtime(timezone.now()).date()
         pagos_hoy = obj.pagos.filter(estado='PAGADO') # related_name='pagos'
         
@@ -201,14 +332,8 @@ class TicketCreateSerializer(serializers.ModelSerializer):
         validated_data['creado_por'] = user
         ticket = Ticket.objects.create(**validated_data)
         
-        # Crear Items
-        for item_data in items_data:
-            TicketItem.objects.create(
-                ticket=ticket, 
-                empresa=empresa, 
-                creado_por=user, 
-                **item_data
-            )
+        # Crear Items (precios en una query + bulk_create)
+        TicketService.crear_items(ticket, items_data, usuario=user)
         
         # Registrar Pago Inicial
         if pago_monto and float(pago_monto) > 0:
@@ -222,29 +347,32 @@ class TicketCreateSerializer(serializers.ModelSerializer):
                 referencia=f'Pago inicial Ticket {ticket.numero_ticket}'
             )
         
+        # La respuesta incluye servicio_nombre/prenda_nombre por item
+        prefetch_related_objects([ticket], 'items__servicio', 'items__prenda')
         return ticket
 
 class TicketUpdateEstadoSerializer(serializers.Serializer):
     estado = serializers.ChoiceField(choices=Ticket.ESTADO_CHOICES)
     comentario = serializers.CharField(required=False, allow_blank=True)
-    
+
     def validate_estado(self, value):
         ticket = self.context.get('ticket')
         if ticket:
-            transiciones_validas = {
-                'RECIBIDO': ['EN_PROCESO', 'CANCELADO'],
-                'EN_PROCESO': ['LISTO', 'RECIBIDO', 'CANCELADO'],
-                'LISTO': ['ENTREGADO', 'EN_PROCESO', 'CANCELADO'],
-                'ENTREGADO': [], 
-                'CANCELADO': [], 
-            }
-            if ticket.estado == value:
-                raise serializers.ValidationError("El ticket ya está en este estado")
-            if value not in transiciones_validas.get(ticket.estado, []):
-                raise serializers.ValidationError(f"No se puede cambiar de {ticket.estado} a {value}")
+            error = TicketService.error_transicion(ticket.estado, value)
+            if error:
+                raise serializers.ValidationError(error)
         return value
 
 
+class TicketUpdateEstadoMasivoSerializer(serializers.Serializer):
+    """Cambio de estado en lote: ids o tracking UUIDs de tickets"""
+    tickets = serializers.ListField(
+        child=serializers.CharField(max_length=64), allow_empty=False, max_length=500
+    )
+    estado = serializers.ChoiceField(choices=Ticket.ESTADO_CHOICES)
+    comentario = serializers.CharField(required=False, allow_blank=True)
+
+
 class TicketItemPublicSerializer(serializers.ModelSerializer):
     """Serializer limitado para items en vista pública"""
     servicio_nombre = serializers.CharField(source='servicio.nombre', read_only=True)
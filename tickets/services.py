@@ -2,42 +2,77 @@ from django.apps import apps
 
 class ClienteService:
     @staticmethod
-    def get_clientes_with_stats(empresa, is_list=True):
-        """Obtiene clientes con anotaciones de CRM para la empresa dada"""
-        from django.db.models import Q, Sum, Max, Count, DecimalField
-        from django.db.models.functions import Coalesce
-        from django.db.models import Prefetch
+    def get_clientes_with_stats(empresa, is_list=True, segmentos=None):
+        """
+        Obtiene clientes con indicadores de CRM para la empresa dada.
+        Los indicadores salen de ClienteStats (JOIN 1:1), sin agregar tickets ni pagos.
+        segmentos: filtra por segmento RFM precalculado ('VIP' equivale a Cliente.SEGMENTOS_VIP).
+        """
+        from django.db.models import F
         
         Cliente = apps.get_model('tickets', 'Cliente')
-        Ticket = apps.get_model('tickets', 'Ticket')
         
-        queryset = Cliente.objects.filter(empresa=empresa, activo=True)
+        queryset = Cliente.objects.filter(empresa=empresa, activo=True).select_related('stats')
+        if segmentos:
+            queryset = queryset.filter(segmento__in=ClienteService.expandir_segmentos(segmentos))
         
-        # Anotación base: Última visita
+        # Anotación base: Última visita (se mantiene el nombre para ?ordering=ultima_visita)
         queryset = queryset.annotate(
-            ultima_visita=Max('tickets__fecha_recepcion')
+            ultima_visita=F('stats__ultima_visita')
         )
         
         if is_list:
             # Optimizaciones para listado
             queryset = queryset.select_related('empresa').annotate(
-                total_tickets=Count('tickets'),
-                total_gastado=Coalesce(
-                    Sum('tickets__pagos__monto', filter=Q(tickets__pagos__estado='PAGADO')),
-                    0,
-                    output_field=DecimalField()
-                )
-            )
-        else:
-            # Optimizaciones para detalle (prefetch)
-            queryset = queryset.prefetch_related(
-                Prefetch('tickets', queryset=Ticket.objects.filter(activo=True).select_related('sede')),
-                'tickets__items',
-                'tickets__pagos'
+                total_tickets=F('stats__total_tickets'),
+                total_gastado=F('stats__total_gastado'),
             )
-            
+        # El detalle no precarga tickets: el historial va paginado en /clientes/{id}/tickets/
+        # y el resumen sale de ClienteService.resumen_historial (agregados acotados).
+
         return queryset
 
+    @staticmethod
+    def resumen_historial(cliente):
+        """
+        Resumen del historial del cliente en una sola consulta agregada sobre el libro
+        persistido de sus tickets (total, total_pagado, saldo); no depende de cuántos tenga.
+        """
+        from decimal import Decimal
+        from django.db.models import Count, Max, Min, Q, Sum
+        from django.db.models.functions import Coalesce
+        from .constants import TicketEstados
+
+        Ticket = apps.get_model('tickets', 'Ticket')
+        vigentes = ~Q(estado=TicketEstados.CANCELADO)
+        agregados = {
+            'total_tickets': Count('id'),
+            'primera_visita': Min('fecha_recepcion'),
+            'ultima_visita': Max('fecha_recepcion'),
+            'total_facturado': Coalesce(Sum('total', filter=vigentes), Decimal('0')),
+            'total_pagado': Coalesce(Sum('total_pagado', filter=vigentes), Decimal('0')),
+            'saldo_pendiente': Coalesce(Sum('saldo', filter=vigentes), Decimal('0')),
+        }
+        for estado, _ in TicketEstados.CHOICES:
+            agregados[f'estado_{estado}'] = Count('id', filter=Q(estado=estado))
+
+        fila = Ticket.objects.filter(
+            cliente=cliente, empresa_id=cliente.empresa_id, activo=True
+        ).aggregate(**agregados)
+        fila['por_estado'] = {
+            estado: fila.pop(f'estado_{estado}') for estado, _ in TicketEstados.CHOICES
+        }
+        return fila
+
+    @staticmethod
+    def expandir_segmentos(segmentos):
+        Cliente = apps.get_model('tickets', 'Cliente')
+        resultado = set()
+        for segmento in segmentos:
+            segmento = segmento.strip().upper()
+            resultado.update(Cliente.SEGMENTOS_VIP if segmento == 'VIP' else [segmento])
+        return resultado
+
     @staticmethod
     def soft_delete(cliente):
         cliente.soft_delete()
@@ -53,21 +88,249 @@ class ClienteService:
         except Cliente.DoesNotExist:
             return None
 
+    @staticmethod
+    def fusionar_clientes(empresa, principal_id, duplicado_ids, usuario=None):
+        """
+        Fusiona los duplicados en el cliente principal dentro de una transacción:
+        tickets y notificaciones se re-apuntan con UPDATEs masivos, el principal
+        completa sus datos vacíos y los duplicados quedan desactivados.
+        Lanza ValueError si algún cliente no existe en la empresa.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from . import autocompletado
+
+        Cliente = apps.get_model('tickets', 'Cliente')
+        Ticket = apps.get_model('tickets', 'Ticket')
+        Notificacion = apps.get_model('notificaciones', 'Notificacion')
+
+        principal_id = int(principal_id)
+        duplicado_ids = sorted({int(i) for i in duplicado_ids} - {principal_id})
+        if not duplicado_ids:
+            raise ValueError("Indique al menos un duplicado distinto del cliente principal")
+
+        with transaction.atomic():
+            # Bloqueo en orden de pk para no cruzarse con otra fusión concurrente
+            por_id = {
+                c.pk: c for c in Cliente.objects.select_for_update().filter(
+                    empresa=empresa, activo=True, pk__in=[principal_id, *duplicado_ids]
+                ).order_by('pk')
+            }
+            if len(por_id) != len(duplicado_ids) + 1:
+                raise ValueError("Algunos clientes no existen o no pertenecen a la empresa")
+            principal = por_id.pop(principal_id)
+            duplicados = list(por_id.values())
+
+            cambios = []
+            for campo in ('apellidos', 'telefono', 'email', 'direccion'):
+                if not getattr(principal, campo):
+                    valor = next((getattr(d, campo) for d in duplicados if getattr(d, campo)), None)
+                    if valor:
+                        setattr(principal, campo, valor)
+                        cambios.append(campo)
+            notas = [d.notas for d in duplicados if d.notas]
+            if notas:
+                principal.notas = '\n'.join(n for n in [principal.notas, *notas] if n)
+                cambios.append('notas')
+            if cambios:
+                principal.actualizado_por = usuario
+                principal.save(update_fields=cambios + ['actualizado_por', 'actualizado_en'])
+
+            tickets = Ticket.objects.filter(cliente_id__in=duplicado_ids)
+            tracking_uuids = list(tickets.values_list('tracking_uuid', flat=True))
+            tickets_movidos = tickets.update(
+                cliente_id=principal.pk,
+                texto_busqueda=Ticket.expresion_texto_busqueda(principal.texto_busqueda)
+            )
+            notificaciones_movidas = Notificacion.objects.filter(
+                cliente_id__in=duplicado_ids
+            ).update(cliente_id=principal.pk)
+
+            ahora = timezone.now()
+            Cliente.objects.filter(pk__in=duplicado_ids).update(
+                activo=False, eliminado_en=ahora, actualizado_en=ahora, actualizado_por=usuario
+            )
+            ClienteStatsService.recalcular([principal.pk, *duplicado_ids])
+            TrackingPublicoService.invalidar(tracking_uuids)
+            autocompletado.invalidar(empresa.id)
+
+        return {
+            'principal': principal.pk,
+            'duplicados': duplicado_ids,
+            'tickets_movidos': tickets_movidos,
+            'notificaciones_movidas': notificaciones_movidas,
+        }
+
+class ClienteStatsService:
+    """Mantenimiento incremental de ClienteStats (ver tickets.models.ClienteStats)"""
+
+    CAMPOS = ('total_tickets', 'total_gastado', 'saldo_pendiente', 'gasto_mes_actual', 'mes_referencia', 'ultima_visita')
+
+    @staticmethod
+    def inicio_mes_actual():
+        from django.utils import timezone
+        return timezone.localdate().replace(day=1)
+
+    @staticmethod
+    def registrar_ticket(ticket):
+        """Alta de ticket: +1 al contador y última visita"""
+        from django.db.models import F, Value
+        from django.db.models.functions import Coalesce, Greatest
+
+        ClienteStats = apps.get_model('tickets', 'ClienteStats')
+        fecha = Value(ticket.fecha_recepcion)
+        actualizados = ClienteStats.objects.filter(cliente_id=ticket.cliente_id).update(
+            total_tickets=F('total_tickets') + 1,
+            # Coalesce: en SQLite MAX(NULL, x) es NULL
+            ultima_visita=Greatest(Coalesce('ultima_visita', fecha), fecha),
+        )
+        if not actualizados:
+            ClienteStatsService.recalcular([ticket.cliente_id])
+
+    @staticmethod
+    def aplicar_delta_ticket(ticket_id, delta_saldo=0, delta_pagado=0, fecha_pago=None):
+        """
+        Propaga un delta del libro de un ticket a las stats de su cliente con un único
+        UPDATE (cliente resuelto por subquery). El saldo de tickets cancelados no cuenta.
+        """
+        from django.db.models import Case, DecimalField, Exists, F, Subquery, Value, When
+        from django.utils import timezone
+
+        if not delta_saldo and not delta_pagado:
+            return
+
+        ClienteStats = apps.get_model('tickets', 'ClienteStats')
+        Ticket = apps.get_model('tickets', 'Ticket')
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+
+        cambios = {}
+        if delta_saldo:
+            cancelado = Exists(Ticket.objects.filter(pk=ticket_id, estado='CANCELADO'))
+            cambios['saldo_pendiente'] = Case(
+                When(cancelado, then=F('saldo_pendiente')),
+                default=F('saldo_pendiente') + delta_saldo,
+                output_field=decimal,
+            )
+        if delta_pagado:
+            cambios['total_gastado'] = F('total_gastado') + delta_pagado
+            mes = ClienteStatsService.inicio_mes_actual()
+            if fecha_pago and timezone.localdate(fecha_pago).replace(day=1) == mes:
+                cambios['gasto_mes_actual'] = Case(
+                    When(mes_referencia=mes, then=F('gasto_mes_actual') + delta_pagado),
+                    default=Value(max(delta_pagado, 0)),
+                    output_field=decimal,
+                )
+                cambios['mes_referencia'] = Value(mes)
+
+        ClienteStats.objects.filter(
+            cliente_id=Subquery(Ticket.objects.filter(pk=ticket_id).values('cliente_id')[:1])
+        ).update(**cambios)
+
+    @staticmethod
+    def recalcular(cliente_ids=None, empresa=None, batch_size=1000, registro=apps):
+        """
+        Recalcula desde cero las stats de los clientes indicados (o de la empresa, o de todos)
+        y las guarda con un upsert por lote. Devuelve la cantidad de clientes procesados.
+        `registro` permite usarlo desde migraciones con los modelos históricos.
+        """
+        from datetime import datetime, time
+        from django.db.models import Count, DecimalField, Max, OuterRef, Subquery, Sum, Value
+        from django.db.models.functions import Coalesce
+        from django.utils import timezone
+
+        Cliente = registro.get_model('tickets', 'Cliente')
+        ClienteStats = registro.get_model('tickets', 'ClienteStats')
+        Ticket = registro.get_model('tickets', 'Ticket')
+        Pago = registro.get_model('pagos', 'Pago')
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+
+        clientes = Cliente.objects.all()
+        if cliente_ids is not None:
+            clientes = clientes.filter(pk__in=cliente_ids)
+        if empresa is not None:
+            clientes = clientes.filter(empresa=empresa)
+
+        mes = ClienteStatsService.inicio_mes_actual()
+        inicio_mes = timezone.make_aware(datetime.combine(mes, time.min))
+        tickets = Ticket.objects.filter(cliente=OuterRef('pk')).order_by().values('cliente')
+        pagos = Pago.objects.filter(
+            ticket__cliente=OuterRef('pk'), estado='PAGADO'
+        ).order_by().values('ticket__cliente')
+
+        def suma(qs, campo):
+            return Coalesce(
+                Subquery(qs.annotate(s=Sum(campo)).values('s'), output_field=decimal),
+                Value(0), output_field=decimal
+            )
+
+        filas = clientes.order_by().annotate(
+            s_total_tickets=Coalesce(Subquery(tickets.annotate(c=Count('id')).values('c')), 0),
+            s_ultima_visita=Subquery(tickets.annotate(m=Max('fecha_recepcion')).values('m')),
+            s_saldo=suma(tickets.exclude(estado='CANCELADO'), 'saldo'),
+            s_gastado=suma(pagos, 'monto'),
+            s_mes=suma(pagos.filter(fecha_pago__gte=inicio_mes), 'monto'),
+        ).values_list('pk', 's_total_tickets', 's_ultima_visita', 's_saldo', 's_gastado', 's_mes')
+
+        procesados = 0
+        lote = []
+        for pk, total_tickets, ultima_visita, saldo, gastado, gasto_mes in filas.iterator(chunk_size=batch_size):
+            lote.append(ClienteStats(
+                cliente_id=pk, total_tickets=total_tickets, ultima_visita=ultima_visita,
+                saldo_pendiente=saldo, total_gastado=gastado,
+                gasto_mes_actual=gasto_mes, mes_referencia=mes,
+            ))
+            if len(lote) >= batch_size:
+                procesados += ClienteStatsService._guardar(ClienteStats, lote)
+                lote = []
+        if lote:
+            procesados += ClienteStatsService._guardar(ClienteStats, lote)
+        return procesados
+
+    @staticmethod
+    def _guardar(ClienteStats, lote):
+        ClienteStats.objects.bulk_create(
+            lote, update_conflicts=True, unique_fields=['cliente'],
+            update_fields=list(ClienteStatsService.CAMPOS) + ['actualizado_en'],
+        )
+        return len(lote)
+
+
 class TicketService:
+    TRANSICIONES_VALIDAS = {
+        'RECIBIDO': ['EN_PROCESO', 'CANCELADO'],
+        'EN_PROCESO': ['LISTO', 'RECIBIDO', 'CANCELADO'],
+        'LISTO': ['ENTREGADO', 'EN_PROCESO', 'CANCELADO'],
+        'ENTREGADO': [], 
+        'CANCELADO': [], 
+    }
+
+    @classmethod
+    def error_transicion(cls, estado_actual, nuevo_estado):
+        """Mensaje de error si la transición no es válida, None si lo es"""
+        if estado_actual == nuevo_estado:
+            return "El ticket ya está en este estado"
+        if nuevo_estado not in cls.TRANSICIONES_VALIDAS.get(estado_actual, []):
+            return f"No se puede cambiar de {estado_actual} a {nuevo_estado}"
+        return None
+
     @staticmethod
-    def set_item_price(item):
+    def set_item_price(item, precios=None):
         """
         Determina el precio unitario de un item basado en el servicio y prenda.
         Sigue la jerarquía: Precio específico por prenda > Precio base del servicio.
+        `precios` ({(servicio_id, prenda_id): precio}) evita la consulta por item.
         """
         if not item.precio_unitario and item.servicio:
-            if item.prenda:
+            if item.prenda_id:
                 # Buscar precio específico de servicio-prenda
-                precio_especifico = item.servicio.precios_prendas.filter(
-                    prenda=item.prenda
-                ).first()
-                if precio_especifico:
-                    item.precio_unitario = precio_especifico.precio
+                if precios is not None:
+                    precio_especifico = precios.get((item.servicio_id, item.prenda_id))
+                else:
+                    precio_especifico = item.servicio.precios_prendas.filter(
+                        prenda_id=item.prenda_id
+                    ).values_list('precio', flat=True).first()
+                if precio_especifico is not None:
+                    item.precio_unitario = precio_especifico
                 else:
                     item.precio_unitario = item.servicio.precio_base
             else:
@@ -75,17 +338,177 @@ class TicketService:
         return item
 
     @staticmethod
-    def get_filtered_tickets(empresa, sede=None, filters_dict=None):
-        """Lógica central de filtrado y anotaciones financieras de tickets"""
-        from django.db.models import Q, Sum, F, DecimalField, OuterRef, Subquery
+    def precios_por_prenda(items):
+        """Precios específicos de todos los pares (servicio, prenda) de los items, en una sola query"""
+        PrecioPorPrenda = apps.get_model('servicios', 'PrecioPorPrenda')
+        pares = {(i.servicio_id, i.prenda_id) for i in items if i.servicio_id and i.prenda_id}
+        if not pares:
+            return {}
+        filas = PrecioPorPrenda.objects.filter(
+            servicio_id__in={s for s, _ in pares},
+            prenda_id__in={p for _, p in pares},
+        ).values_list('servicio_id', 'prenda_id', 'precio')
+        return {(s, p): precio for s, p, precio in filas}
+
+    @staticmethod
+    def crear_items(ticket, items_data, usuario=None):
+        """
+        Crea los items de un ticket nuevo en bloque: una query de precios, un
+        bulk_create y un único delta al libro financiero (en vez de save() por item).
+        """
+        from decimal import Decimal
+        TicketItem = apps.get_model('tickets', 'TicketItem')
+
+        items = [
+            TicketItem(ticket=ticket, empresa=ticket.empresa, creado_por=usuario, **data)
+            for data in items_data
+        ]
+        precios = TicketService.precios_por_prenda(
+            [i for i in items if not i.precio_unitario]
+        )
+        for item in items:
+            TicketService.set_item_price(item, precios)
+
+        TicketItem.objects.bulk_create(items)
+        TrackingPublicoService.invalidar([ticket.tracking_uuid])
+        TicketService.aplicar_delta_financiero(
+            ticket.id, delta_total=sum((Decimal(str(i.subtotal)) for i in items), Decimal('0'))
+        )
+        return items
+
+    # --- LIBRO FINANCIERO DEL TICKET (total / total_pagado / saldo) ---
+
+    @staticmethod
+    def aplicar_delta_financiero(ticket_id, delta_total=0, delta_pagado=0, fecha_pago=None):
+        """
+        Aplica un delta a los acumulados financieros del ticket con un UPDATE atómico (F()).
+        Es el único punto de escritura de total, total_pagado y saldo; también
+        propaga el delta a ClienteStats (fecha_pago: para el gasto del mes).
+        """
+        from decimal import Decimal
+        from django.db.models import F
+
+        delta_total = Decimal(str(delta_total or 0))
+        delta_pagado = Decimal(str(delta_pagado or 0))
+        if not delta_total and not delta_pagado:
+            return
+
+        Ticket = apps.get_model('tickets', 'Ticket')
+        Ticket.objects.filter(pk=ticket_id).update(
+            total=F('total') + delta_total,
+            total_pagado=F('total_pagado') + delta_pagado,
+            saldo=F('saldo') + (delta_total - delta_pagado)
+        )
+        ClienteStatsService.aplicar_delta_ticket(
+            ticket_id, delta_saldo=delta_total - delta_pagado, delta_pagado=delta_pagado, fecha_pago=fecha_pago
+        )
+
+    @staticmethod
+    def registrar_cambio_item(item, anterior=None):
+        """
+        Propaga al ticket la diferencia de subtotal de un item recién guardado.
+        `anterior` es el dict (ticket_id, cantidad, precio_unitario) previo al save, o None si es nuevo.
+        """
+        from decimal import Decimal
+
+        subtotal_anterior = Decimal(0)
+        if anterior:
+            subtotal_anterior = (anterior['cantidad'] or 0) * (anterior['precio_unitario'] or 0)
+            if anterior['ticket_id'] != item.ticket_id:
+                # El item cambió de ticket: se descuenta íntegro del ticket original
+                TicketService.aplicar_delta_financiero(anterior['ticket_id'], delta_total=-subtotal_anterior)
+                subtotal_anterior = Decimal(0)
+
+        subtotal = Decimal(str(item.subtotal))
+        TicketService.aplicar_delta_financiero(item.ticket_id, delta_total=subtotal - subtotal_anterior)
+
+    @staticmethod
+    def expresiones_financieras_reales():
+        """
+        Subqueries correlacionadas que recalculan total y pagado desde las filas crudas
+        (items y pagos PAGADO). Cada una agrega sobre su propia tabla, sin multiplicar filas.
+        Solo se correlacionan por ticket: el ticket externo ya está acotado a la empresa y
+        un filtro extra por empresa lleva al planner a escanear el índice de empresa por fila.
+        """
+        from django.db.models import Sum, F, OuterRef, Subquery, DecimalField, Value
         from django.db.models.functions import Coalesce
+
+        TicketItem = apps.get_model('tickets', 'TicketItem')
+        from pagos.models import Pago  # Evitar circular import
+
+        items_total = TicketItem.objects.filter(ticket=OuterRef('pk')).order_by().values('ticket').annotate(
+            s=Sum(F('cantidad') * F('precio_unitario'))
+        ).values('s')
+
+        pagos = Pago.objects.filter(ticket=OuterRef('pk'), estado='PAGADO')
+        pagos_total = pagos.order_by().values('ticket').annotate(s=Sum('monto')).values('s')
+
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+        return {
+            'total_real': Coalesce(Subquery(items_total, output_field=decimal), Value(0), output_field=decimal),
+            'pagado_real': Coalesce(Subquery(pagos_total, output_field=decimal), Value(0), output_field=decimal),
+        }
+
+    @staticmethod
+    def reconciliar_libro(queryset, reparar=False, batch_size=500):
+        """
+        Compara los acumulados persistidos contra los valores reales y, opcionalmente, los repara.
+        Retorna la lista de discrepancias encontradas (id, numero, persistido, real).
+        """
+        from django.db.models import F, Q
+
+        Ticket = apps.get_model('tickets', 'Ticket')
+        queryset = queryset.annotate(**TicketService.expresiones_financieras_reales()).filter(
+            ~Q(total=F('total_real')) | ~Q(total_pagado=F('pagado_real')) |
+            ~Q(saldo=F('total_real') - F('pagado_real'))
+        ).order_by('pk')
+
+        discrepancias = []
+        pendientes = []
+        for t in queryset.iterator(chunk_size=batch_size):
+            discrepancias.append({
+                'id': t.pk,
+                'numero_ticket': t.numero_ticket,
+                'persistido': (t.total, t.total_pagado, t.saldo),
+                'real': (t.total_real, t.pagado_real, t.total_real - t.pagado_real),
+            })
+            if reparar:
+                pendientes.append(t.pk)
+
+        # La reparación recalcula en la BD (no con los valores leídos) para no pisar
+        # pagos registrados mientras corría la detección.
+        reales = TicketService.expresiones_financieras_reales()
+        for i in range(0, len(pendientes), batch_size):
+            Ticket.objects.filter(pk__in=pendientes[i:i + batch_size]).update(
+                total=reales['total_real'],
+                total_pagado=reales['pagado_real'],
+                saldo=reales['total_real'] - reales['pagado_real']
+            )
+        if pendientes:
+            ClienteStatsService.recalcular(
+                Ticket.objects.filter(pk__in=pendientes).values('cliente_id')
+            )
+        return discrepancias
+
+    @staticmethod
+    def get_filtered_tickets(empresa, sede=None, filters_dict=None, incluir_detalle=True):
+        """
+        Lógica central de filtrado y anotaciones financieras de tickets.
+        Con incluir_detalle=False (listados) no se precargan items ni historial:
+        TicketListSerializer se alimenta solo de las anotaciones.
+        """
+        from django.db.models import F, OuterRef, Subquery, Exists
+        from django.utils import timezone
+        from datetime import datetime, time, timedelta
         
         Ticket = apps.get_model('tickets', 'Ticket')
         from pagos.models import Pago # Evitar circular import
         
         queryset = Ticket.objects.filter(empresa=empresa, activo=True).select_related(
             'cliente', 'sede'
-        ).prefetch_related('items', 'historial_estados')
+        )
+        if incluir_detalle:
+            queryset = queryset.prefetch_related('items', 'historial_estados')
 
         if sede:
             queryset = queryset.filter(sede=sede)
@@ -93,23 +516,28 @@ class TicketService:
         # Subquery: Último método de pago
         ult_pago = Pago.objects.filter(
             ticket=OuterRef('pk'),
-            empresa=empresa, 
             estado='PAGADO'
         ).order_by('-fecha_pago')
 
+        # Exists: ¿tiene pagos PAGADO hoy (hora local) que aún pueden extornarse?
+        hoy = timezone.localdate()
+        inicio_hoy = timezone.make_aware(datetime.combine(hoy, time.min))
+        pagos_hoy = Pago.objects.filter(
+            ticket=OuterRef('pk'),
+            estado='PAGADO',
+            fecha_pago__gte=inicio_hoy,
+            fecha_pago__lt=inicio_hoy + timedelta(days=1)
+        )
+
+        # Totales como subqueries correlacionadas independientes: sin JOIN a items/pagos
+        # no hay producto items × pagos (totales inflados) ni necesidad de DISTINCT.
+        reales = TicketService.expresiones_financieras_reales()
         queryset = queryset.annotate(
-            total_pagado_db=Coalesce(
-                Sum('pagos__monto', filter=Q(pagos__estado='PAGADO', pagos__empresa=empresa)), 
-                0, 
-                output_field=DecimalField()
-            ),
-            total_ticket_db=Coalesce(
-                Sum(F('items__cantidad') * F('items__precio_unitario')),
-                0,
-                output_field=DecimalField()
-            ),
-            ultimo_metodo_pago=Subquery(ult_pago.values('metodo_pago_snapshot')[:1])
-        ).distinct()
+            total_pagado_db=reales['pagado_real'],
+            total_ticket_db=reales['total_real'],
+            ultimo_metodo_pago=Subquery(ult_pago.values('metodo_pago_snapshot')[:1]),
+            es_extornable_db=Exists(pagos_hoy)
+        )
 
         # Aplicar filtros dinámicos
         if filters_dict:
@@ -156,6 +584,103 @@ class TicketService:
         )
         return True, "Estado actualizado"
 
+    @staticmethod
+    def update_estado_masivo(empresa, identificadores, nuevo_estado, user, comentario='', sede=None):
+        """
+        Cambio de estado en lote (ids o tracking UUIDs).
+        Valida cada ticket contra la tabla de transiciones, aplica un único UPDATE
+        y crea el historial con bulk_create. Devuelve (resultados, ids_actualizados).
+        """
+        import uuid
+        from django.db import transaction
+        from django.db.models import Q
+        from django.utils import timezone
+
+        Ticket = apps.get_model('tickets', 'Ticket')
+        EstadoHistorial = apps.get_model('tickets', 'EstadoHistorial')
+
+        ids, uuids, claves = set(), set(), []
+        for identificador in identificadores:
+            valor = str(identificador).strip()
+            if valor.isdigit():
+                ids.add(int(valor))
+                claves.append((identificador, ('id', int(valor))))
+                continue
+            try:
+                u = uuid.UUID(valor)
+            except ValueError:
+                claves.append((identificador, None))
+                continue
+            uuids.add(u)
+            claves.append((identificador, ('uuid', u)))
+
+        resultados, validos = [], []
+        with transaction.atomic():
+            queryset = Ticket.objects.select_for_update().filter(
+                empresa=empresa, activo=True
+            ).filter(Q(id__in=ids) | Q(tracking_uuid__in=uuids))
+            if sede:
+                queryset = queryset.filter(sede=sede)
+            tickets = list(queryset.order_by('pk').only(
+                'id', 'tracking_uuid', 'numero_ticket', 'estado', 'saldo', 'sede_id', 'cliente_id'
+            ))
+            por_id = {t.id: t for t in tickets}
+            por_uuid = {t.tracking_uuid: t for t in tickets}
+
+            vistos = set()
+            for identificador, clave in claves:
+                ticket = None
+                if clave:
+                    ticket = por_id.get(clave[1]) if clave[0] == 'id' else por_uuid.get(clave[1])
+
+                error = None
+                if ticket is None:
+                    error = "Ticket no encontrado"
+                elif ticket.id in vistos:
+                    error = "Ticket repetido en la solicitud"
+                else:
+                    error = TicketService.error_transicion(ticket.estado, nuevo_estado)
+                    if not error and nuevo_estado == 'ENTREGADO' and ticket.saldo > 0:
+                        error = "El ticket tiene saldo pendiente de pago"
+
+                if error:
+                    resultados.append({'ticket': identificador, 'ok': False, 'error': error})
+                    continue
+
+                vistos.add(ticket.id)
+                validos.append(ticket)
+                resultados.append({
+                    'ticket': identificador, 'ok': True,
+                    'id': ticket.id, 'numero_ticket': ticket.numero_ticket,
+                    'estado_anterior': ticket.estado,
+                })
+
+            if validos:
+                ahora = timezone.now()
+                cambios = {'estado': nuevo_estado, 'actualizado_en': ahora, 'actualizado_por': user}
+                if nuevo_estado == 'ENTREGADO':
+                    cambios['fecha_entrega'] = ahora
+                Ticket.objects.filter(id__in=[t.id for t in validos]).update(**cambios)
+                TicketService.invalidar_dashboard(empresa.id, [t.sede_id for t in validos])
+                TrackingPublicoService.invalidar([t.tracking_uuid for t in validos])
+                if nuevo_estado == 'CANCELADO':
+                    # El saldo de los cancelados deja de contar como deuda del cliente
+                    ClienteStatsService.recalcular({t.cliente_id for t in validos})
+
+                EstadoHistorial.objects.bulk_create([
+                    EstadoHistorial(
+                        ticket_id=t.id,
+                        empresa=empresa,
+                        estado_anterior=t.estado,
+                        estado_nuevo=nuevo_estado,
+                        creado_por=user,
+                        comentario=comentario
+                    )
+                    for t in validos
+                ])
+
+        return resultados, [t.id for t in validos]
+
     @staticmethod
     def cancel_ticket(ticket, user, motivo=''):
         """Cancela un ticket si es posible"""
@@ -177,50 +702,267 @@ class TicketService:
         )
         return True, "Ticket cancelado"
 
+    # TTL corto: además de la invalidación explícita, acota el desfase de 'entregados_hoy' al cambiar el día
+    DASHBOARD_CACHE_TTL = 60
+
     @staticmethod
-    def get_dashboard_stats(queryset):
-        """Calcula estadísticas rápidas para el dashboard"""
+    def _dashboard_cache_key(empresa_id, sede_id=None):
+        return f"tickets:dashboard:{empresa_id}:{sede_id or 'todas'}"
+
+    @staticmethod
+    def get_dashboard_stats(empresa, sede=None):
+        """
+        Calcula estadísticas rápidas para el dashboard en una sola query de
+        agregación condicional sobre la tabla de tickets (sin anotaciones).
+        Cacheado por (empresa, sede); ver invalidar_dashboard.
+        """
+        from datetime import datetime, time, timedelta
+        from django.core.cache import cache
+        from django.db.models import Count, Q
         from django.utils import timezone
-        return {
-            'total': queryset.count(),
-            'recibidos': queryset.filter(estado='RECIBIDO').count(),
-            'en_proceso': queryset.filter(estado='EN_PROCESO').count(),
-            'listos': queryset.filter(estado='LISTO').count(),
-            'entregados_hoy': queryset.filter(estado='ENTREGADO', fecha_entrega__date=timezone.now().date()).count(),
-            'urgentes': queryset.filter(prioridad='URGENTE').count(),
-            'express': queryset.filter(prioridad='EXPRESS').count(),
-        }
+
+        clave = TicketService._dashboard_cache_key(empresa.id, sede.id if sede else None)
+        stats = cache.get(clave)
+        if stats is not None:
+            return stats
+
+        Ticket = apps.get_model('tickets', 'Ticket')
+        queryset = Ticket.objects.filter(empresa=empresa, activo=True)
+        if sede:
+            queryset = queryset.filter(sede=sede)
+
+        inicio_dia = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        stats = queryset.aggregate(
+            total=Count('id'),
+            recibidos=Count('id', filter=Q(estado='RECIBIDO')),
+            en_proceso=Count('id', filter=Q(estado='EN_PROCESO')),
+            listos=Count('id', filter=Q(estado='LISTO')),
+            entregados_hoy=Count('id', filter=Q(
+                estado='ENTREGADO',
+                fecha_entrega__gte=inicio_dia,
+                fecha_entrega__lt=inicio_dia + timedelta(days=1),
+            )),
+            urgentes=Count('id', filter=Q(prioridad='URGENTE')),
+            express=Count('id', filter=Q(prioridad='EXPRESS')),
+        )
+        cache.set(clave, stats, TicketService.DASHBOARD_CACHE_TTL)
+        return stats
+
+    @staticmethod
+    def invalidar_dashboard(empresa_id, sede_ids=()):
+        """Descarta el dashboard cacheado de la vista global de la empresa y de las sedes indicadas"""
+        from django.core.cache import cache
+        claves = [TicketService._dashboard_cache_key(empresa_id)]
+        claves += [TicketService._dashboard_cache_key(empresa_id, s) for s in set(sede_ids) if s]
+        cache.delete_many(claves)
+
+    @staticmethod
+    def reservar_secuenciales(empresa_id, cantidad=1):
+        """
+        Reserva `cantidad` secuenciales consecutivos para la empresa y devuelve el range.
+
+        Un único UPDATE ... RETURNING sobre la fila de TicketSecuencia: solo se bloquea
+        esa fila (hasta el commit de la transacción que llama), sin escanear tickets.
+        Con cantidad > 1 sirve para creación masiva u offline.
+        """
+        from django.db import connection, transaction, IntegrityError
+        from django.db.models import Max
+
+        if cantidad < 1:
+            raise ValueError("cantidad debe ser >= 1")
+
+        TicketSecuencia = apps.get_model('tickets', 'TicketSecuencia')
+        tabla = connection.ops.quote_name(TicketSecuencia._meta.db_table)
+        sql = (
+            f"UPDATE {tabla} SET ultimo_valor = ultimo_valor + %s "
+            f"WHERE empresa_id = %s RETURNING ultimo_valor"
+        )
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [cantidad, empresa_id])
+                fila = cursor.fetchone()
+
+            if fila is None:
+                # Primera reserva de la empresa: el contador parte del mayor secuencial existente
+                Ticket = apps.get_model('tickets', 'Ticket')
+                inicial = Ticket.objects.filter(empresa_id=empresa_id).aggregate(
+                    m=Max('secuencial')
+                )['m'] or 0
+                try:
+                    with transaction.atomic():
+                        TicketSecuencia.objects.create(empresa_id=empresa_id, ultimo_valor=inicial)
+                except IntegrityError:
+                    pass  # Otra transacción la creó primero
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [cantidad, empresa_id])
+                    fila = cursor.fetchone()
+
+        ultimo = fila[0]
+        return range(ultimo - cantidad + 1, ultimo + 1)
+
+    @staticmethod
+    def formatear_numero(empresa, secuencial):
+        prefijo = getattr(empresa, 'ticket_prefijo', None) or 'TK-'
+        return f"{prefijo}{str(secuencial).zfill(6)}"
 
     @staticmethod
     def prepare_new_ticket(ticket):
         """
         Lógica de inicialización para nuevos tickets:
-        - Generación de secuencial único por empresa
+        - Generación de secuencial único por empresa (o uso del reservado en bloque)
         - Generación de número de ticket formateado
-        - Generación de código QR
         """
-        from core.utils import generar_numero_unico, generar_qr_code
-        from django.db import transaction
+        from core.utils import generar_numero_unico
 
         # 1. Generar número y secuencial si no existe
-        if not ticket.numero_ticket and ticket.empresa:
-            with transaction.atomic():
-                try:
-                    prefijo = ticket.empresa.ticket_prefijo or 'TK-'
-                except AttributeError:
-                    prefijo = 'TK-'
-                
-                Ticket = apps.get_model('tickets', 'Ticket')
-                ultimo = Ticket.objects.select_for_update().filter(
-                    empresa=ticket.empresa
-                ).order_by('-secuencial').first()
-                
-                nuevo_sec = (ultimo.secuencial + 1) if ultimo else 1
-                ticket.secuencial = nuevo_sec
-                ticket.numero_ticket = f"{prefijo}{str(nuevo_sec).zfill(6)}"
+        if not ticket.numero_ticket and ticket.empresa_id:
+            if not ticket.secuencial:
+                ticket.secuencial = TicketService.reservar_secuenciales(ticket.empresa_id)[0]
+            ticket.numero_ticket = TicketService.formatear_numero(ticket.empresa, ticket.secuencial)
         
         # Fallback de número único
         if not ticket.numero_ticket:
              ticket.numero_ticket = generar_numero_unico(prefijo='TKT')
 
         return ticket
+
+
+class TrackingPublicoService:
+    """
+    Caché de respuestas del rastreo público (sin auth), por tracking_uuid.
+
+    La entrada guarda el payload serializado, su ETag y Last-Modified, junto con
+    las versiones vigentes al construirla: la del ticket (cambia con el ticket o sus
+    items) y la de su empresa (cambia con su nombre o logos, ver invalidar_empresa).
+    Las versiones son timestamps, así que validar una entrada solo requiere dos
+    lecturas de caché y ninguna de la BD.
+    """
+    ENTRADA_TTL = 60 * 60
+    # Debe superar ENTRADA_TTL: una versión expirada nunca puede revalidar una entrada vieja
+    VERSION_TTL = 60 * 60 * 24
+    CLAVE_HITS = 'tickets:tracking:hits'
+    CLAVE_MISSES = 'tickets:tracking:misses'
+
+    @staticmethod
+    def _clave_entrada(tracking_uuid):
+        return f"tickets:tracking:{tracking_uuid}"
+
+    @staticmethod
+    def _clave_version(tracking_uuid):
+        return f"tickets:tracking:version:{tracking_uuid}"
+
+    @staticmethod
+    def _clave_version_empresa(empresa_id):
+        return f"tickets:tracking:empresa:{empresa_id}"
+
+    @staticmethod
+    def _publicar_versiones(claves):
+        """
+        Nueva versión para las claves indicadas. Se aplica al instante y otra vez
+        al confirmar la transacción, para descartar también las entradas que otro
+        request haya reconstruido con datos aún sin commit.
+        """
+        import time
+        from django.core.cache import cache
+        from django.db import transaction
+
+        def _publicar():
+            version = time.time_ns()
+            cache.set_many({c: version for c in claves}, TrackingPublicoService.VERSION_TTL)
+
+        _publicar()
+        transaction.on_commit(_publicar)
+
+    @staticmethod
+    def invalidar(tracking_uuids):
+        """Nueva versión para los tickets indicados"""
+        claves = [TrackingPublicoService._clave_version(u) for u in set(tracking_uuids) if u]
+        if claves:
+            TrackingPublicoService._publicar_versiones(claves)
+
+    @staticmethod
+    def invalidar_empresa(empresa_id):
+        """Nueva versión para todos los tickets de la empresa: una sola clave"""
+        TrackingPublicoService._publicar_versiones([TrackingPublicoService._clave_version_empresa(empresa_id)])
+
+    @staticmethod
+    def _contar(clave):
+        from django.core.cache import cache
+        cache.add(clave, 0, None)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            pass  # Expulsada entre add e incr: se pierde una muestra
+
+    @staticmethod
+    def estadisticas():
+        from django.core.cache import cache
+        valores = cache.get_many([TrackingPublicoService.CLAVE_HITS, TrackingPublicoService.CLAVE_MISSES])
+        hits = valores.get(TrackingPublicoService.CLAVE_HITS, 0)
+        misses = valores.get(TrackingPublicoService.CLAVE_MISSES, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+    @staticmethod
+    def obtener(tracking_uuid):
+        """
+        Devuelve la entrada {'data', 'etag', 'last_modified'} del ticket, o None si no existe.
+        `tracking_uuid` debe ser un uuid.UUID ya validado.
+        """
+        import hashlib
+        import json
+        from django.core.cache import cache
+        from django.db.models import Prefetch
+        from .serializers import TicketPublicSerializer
+
+        claves = [
+            TrackingPublicoService._clave_entrada(tracking_uuid),
+            TrackingPublicoService._clave_version(tracking_uuid),
+        ]
+        valores = cache.get_many(claves)
+        entrada = valores.get(claves[0])
+        version = valores.get(claves[1], 0)
+        empresa_id = entrada.get('empresa_id') if entrada is not None else None
+        if empresa_id is not None:
+            version_empresa = cache.get(TrackingPublicoService._clave_version_empresa(empresa_id), 0)
+            if entrada['version'] == version and entrada['version_empresa'] == version_empresa:
+                TrackingPublicoService._contar(TrackingPublicoService.CLAVE_HITS)
+                return entrada
+
+        # Las versiones se leen antes de consultar la BD: si el ticket o la empresa
+        # cambian mientras tanto, la entrada que se guarde aquí nace obsoleta y no se sirve.
+        TrackingPublicoService._contar(TrackingPublicoService.CLAVE_MISSES)
+        Ticket = apps.get_model('tickets', 'Ticket')
+        TicketItem = apps.get_model('tickets', 'TicketItem')
+        if empresa_id is None:
+            empresa_id = Ticket.objects.filter(tracking_uuid=tracking_uuid, activo=True).values_list(
+                'empresa_id', flat=True
+            ).first()
+            if empresa_id is None:
+                return None
+            version_empresa = cache.get(TrackingPublicoService._clave_version_empresa(empresa_id), 0)
+        ticket = Ticket.objects.select_related('empresa').prefetch_related(
+            Prefetch('items', queryset=TicketItem.objects.select_related('servicio', 'prenda'))
+        ).filter(tracking_uuid=tracking_uuid, activo=True).first()
+        if ticket is None:
+            return None
+
+        data = json.loads(json.dumps(TicketPublicSerializer(ticket).data, default=str))
+        contenido = json.dumps(data, sort_keys=True).encode()
+        entrada = {
+            'version': version,
+            'empresa_id': empresa_id,
+            'version_empresa': version_empresa,
+            'data': data,
+            'etag': f'"{hashlib.sha1(contenido).hexdigest()}"',
+            'last_modified': max(
+                [ticket.actualizado_en] + [i.actualizado_en for i in ticket.items.all()]
+            ),
+        }
+        cache.set(claves[0], entrada, TrackingPublicoService.ENTRADA_TTL)
+        return entrada
@@ -2,9 +2,10 @@
 Signals para la app tickets
 """
 
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Ticket, EstadoHistorial
+from core.models import Empresa
+from .models import Cliente, Ticket, TicketItem, EstadoHistorial
 
 
 
@@ -14,4 +15,73 @@ def enviar_notificacion_cambio_estado(sender, instance, created, **kwargs):
     Signal que envía notificación cuando cambia el estado de un ticket.
     NOTA: Se implementará la lógica real conectada a Gmail en la Fase 8.
     """
-    pass
\ No newline at end of file
+    pass
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidar_dashboard_ticket(sender, instance, **kwargs):
+    """Cualquier alta, cambio de estado/prioridad o baja de un ticket invalida los contadores del dashboard"""
+    from .services import TicketService, TrackingPublicoService
+    TicketService.invalidar_dashboard(instance.empresa_id, [instance.sede_id])
+    TrackingPublicoService.invalidar([instance.tracking_uuid])
+
+
+@receiver(post_delete, sender=Ticket)
+def recalcular_stats_cliente_ticket(sender, instance, **kwargs):
+    """Un ticket eliminado sale de las estadísticas CRM de su cliente"""
+    from .services import ClienteStatsService
+    ClienteStatsService.recalcular([instance.cliente_id])
+
+
+@receiver(post_save, sender=TicketItem)
+@receiver(post_delete, sender=TicketItem)
+def invalidar_tracking_item(sender, instance, **kwargs):
+    """Los items forman parte de la respuesta pública de rastreo"""
+    from .services import TrackingPublicoService
+    if TicketItem.ticket.is_cached(instance):
+        tracking_uuid = instance.ticket.tracking_uuid
+    else:
+        tracking_uuid = Ticket.objects.filter(pk=instance.ticket_id).values_list('tracking_uuid', flat=True).first()
+    TrackingPublicoService.invalidar([tracking_uuid])
+
+
+@receiver(post_save, sender=Empresa)
+def invalidar_tracking_empresa(sender, instance, created, update_fields=None, **kwargs):
+    """El nombre y los logos de la empresa se muestran en el rastreo público de todos sus tickets"""
+    from .services import TrackingPublicoService
+    if update_fields is not None and not {'nombre', 'logo', 'ticket_logo'} & set(update_fields):
+        return
+    marca = instance.marca_publica()
+    if not created and marca != getattr(instance, '_marca_cargada', None):
+        TrackingPublicoService.invalidar_empresa(instance.pk)
+    instance._marca_cargada = marca
+
+
+@receiver(pre_delete, sender=TicketItem)
+def leer_item_a_eliminar(sender, instance, **kwargs):
+    """
+    Lee la fila guardada bajo lock (el borrado ya corre en su transacción): una instancia
+    desactualizada no debe decidir cuánto se descuenta del libro financiero.
+    """
+    guardado = TicketItem.objects.select_for_update().filter(pk=instance.pk).values(
+        'ticket_id', 'cantidad', 'precio_unitario'
+    ).first()
+    if guardado:
+        instance._item_guardado = TicketItem(**guardado)
+
+
+@receiver(post_delete, sender=TicketItem)
+def descontar_item_eliminado(sender, instance, **kwargs):
+    """Al eliminar un item, su subtotal guardado se descuenta del libro financiero del ticket"""
+    from .services import TicketService
+    item = getattr(instance, '_item_guardado', instance)
+    TicketService.aplicar_delta_financiero(item.ticket_id, delta_total=-item.subtotal)
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_autocompletado_cliente(sender, instance, **kwargs):
+    """Altas, cambios y bajas de clientes descartan el índice de autocompletado de la empresa"""
+    from . import autocompletado
+    autocompletado.invalidar(instance.empresa_id)
@@ -0,0 +1,44 @@
+"""
+Tareas asíncronas para la app tickets
+"""
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def segmentar_clientes_rfm(empresa_id=None):
+    """
+    Recalcula la segmentación RFM de los clientes (todas las empresas activas
+    o solo la indicada). Programada en el beat nocturno.
+    """
+    from core.models import Empresa
+    from .segmentacion import segmentar_empresa
+
+    if empresa_id:
+        empresas = [empresa_id]
+    else:
+        empresas = Empresa.objects.filter(estado='ACTIVO').values_list('id', flat=True)
+
+    resumen = {}
+    for eid in empresas:
+        try:
+            resumen[eid] = segmentar_empresa(eid)
+        except Exception as e:
+            logger.error(f"Error en segmentar_clientes_rfm para empresa {eid}: {e}")
+    return resumen
+
+
+@shared_task
+def detectar_clientes_duplicados(empresa_id, umbral=None):
+    """Detección de duplicados por bloques; el resultado queda en DeteccionDuplicados (ver tickets.duplicados)"""
+    from . import duplicados
+    return duplicados.ejecutar(empresa_id, umbral=umbral or duplicados.UMBRAL)
+
+
+@shared_task
+def importar_clientes(importacion_id):
+    """Procesa una ImportacionClientes pendiente (ver tickets.importacion)"""
+    from .importacion import ejecutar
+    return ejecutar(importacion_id)
@@ -1,11 +1,15 @@
+import os
+import time
 from rest_framework import status
+from django.test import TransactionTestCase
 from django.utils import timezone
 from datetime import timedelta
 from core.test_utils import BaseTenantAPITestCase
 from tickets.models import Cliente, Ticket, TicketItem
 from servicios.models import CategoriaServicio, Servicio, Prenda
 
-class TicketsAPITestCase(BaseTenantAPITestCase):
+class TicketsBaseTestCase(BaseTenantAPITestCase):
+    """Fixture común: cliente, servicio y un ticket con un item de S/ 20"""
     def setUp(self):
         super().setUp()
         self.cliente = Cliente.objects.create(
@@ -44,6 +48,8 @@ class TicketsAPITestCase(BaseTenantAPITestCase):
             precio_unitario=10.00
         )
 
+
+class TicketsAPITestCase(TicketsBaseTestCase):
     def test_crear_cliente(self):
         """Probar creación de cliente asegurando que se asigna a la empresa del usuario"""
         self.authenticate(self.cajero_user)
@@ -98,3 +104,1325 @@ class TicketsAPITestCase(BaseTenantAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.ticket.refresh_from_db()
         self.assertEqual(self.ticket.estado, 'EN_PROCESO')
+
+
+class TicketLibroFinancieroTestCase(TicketsBaseTestCase):
+    """Consistencia de total / total_pagado / saldo persistidos en Ticket"""
+
+    def _pagar(self, monto):
+        from pagos.models import CajaSesion
+        from pagos.services import registrar_pago
+        CajaSesion.objects.get_or_create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA'
+        )
+        return registrar_pago(self.cajero_user, self.empresa, self.ticket, monto, metodo_pago_str='EFECTIVO')
+
+    def test_items_actualizan_libro(self):
+        """Crear, editar y eliminar items mantiene el total y saldo del ticket"""
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total, 20)
+        self.assertEqual(self.ticket.saldo, 20)
+
+        self.item.cantidad = 3
+        self.item.save()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total, 30)
+
+        self.item.delete()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total, 0)
+        self.assertEqual(self.ticket.saldo, 0)
+
+    def test_eliminar_instancia_desactualizada(self):
+        """Se descuenta el subtotal guardado, no el de una instancia vieja en memoria"""
+        desactualizado = TicketItem.objects.get(pk=self.item.pk)
+        self.item.cantidad = 3
+        self.item.save()  # Edición concurrente: total 30
+
+        desactualizado.delete()  # Aún cree que cantidad = 2
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.total, self.ticket.saldo), (0, 0))
+
+    def test_pago_y_anulacion_actualizan_libro(self):
+        """registrar_pago descuenta el saldo y anular_pago lo devuelve"""
+        from pagos.services import anular_pago
+        pago = self._pagar(15)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total_pagado, 15)
+        self.assertEqual(self.ticket.saldo, 5)
+
+        anular_pago(pago)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total_pagado, 0)
+        self.assertEqual(self.ticket.saldo, 20)
+
+    def test_save_no_pisa_libro(self):
+        """Un save() con la instancia desactualizada no sobreescribe los acumulados"""
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        self._pagar(5)
+        stale.observaciones = 'Cambio'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.total_pagado, 5)
+        self.assertEqual(stale.saldo, 15)
+
+    def test_comando_reconciliacion_repara(self):
+        """El comando detecta y repara un ticket con el libro desalineado"""
+        from io import StringIO
+        from django.core.management import call_command
+        Ticket.objects.filter(pk=self.ticket.pk).update(total=99, saldo=99)
+
+        out = StringIO()
+        call_command('reconciliar_saldos', stdout=out)
+        self.assertIn(self.ticket.numero_ticket, out.getvalue())
+
+        call_command('reconciliar_saldos', '--reparar', stdout=StringIO())
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.total, 20)
+        self.assertEqual(self.ticket.saldo, 20)
+
+
+class TicketListQueryCountTestCase(TicketsBaseTestCase):
+    """Regresión: el listado de tickets no debe hacer queries por fila"""
+
+    def _crear_ticket_con_pago(self):
+        from pagos.models import Pago
+        ticket = Ticket.objects.create(
+            empresa=self.empresa,
+            sede=self.sede_principal,
+            cliente=self.cliente,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        TicketItem.objects.create(
+            empresa=self.empresa, ticket=ticket, servicio=self.servicio,
+            cantidad=2, precio_unitario=10
+        )
+        Pago.objects.create(
+            empresa=self.empresa, ticket=ticket, monto=5,
+            metodo_pago_snapshot='Efectivo', estado='PAGADO'
+        )
+        return ticket
+
+    def _queries_listado(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/tickets/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data['results']
+
+    def test_listado_sin_queries_por_fila(self):
+        self.authenticate(self.cajero_user)
+        self._crear_ticket_con_pago()
+        queries_base, _ = self._queries_listado()
+
+        for _ in range(5):
+            self._crear_ticket_con_pago()
+        queries, resultados = self._queries_listado()
+
+        self.assertEqual(len(resultados), 7)
+        self.assertEqual(queries, queries_base)
+
+    def test_listado_usa_anotaciones(self):
+        self.authenticate(self.cajero_user)
+        ticket = self._crear_ticket_con_pago()
+        _, resultados = self._queries_listado()
+        fila = next(r for r in resultados if r['id'] == ticket.id)
+        self.assertEqual(fila['total'], 20.0)
+        self.assertEqual(fila['saldo_pendiente'], 15.0)
+        self.assertTrue(fila['es_extornable'])
+        self.assertEqual(fila['ultimo_metodo_pago'], 'Efectivo')
+
+        sin_pagos = next(r for r in resultados if r['id'] == self.ticket.id)
+        self.assertFalse(sin_pagos['es_extornable'])
+
+
+class TicketAgregacionBenchmarkTestCase(TicketsBaseTestCase):
+    """
+    Benchmark de get_filtered_tickets con varios items y pagos por ticket.
+    Volumen por defecto reducido para la suite; WASHLY_BENCH_TICKETS=100000 reproduce el escenario completo.
+    """
+    ITEMS_POR_TICKET = 3
+    PAGOS_POR_TICKET = 2
+
+    def _sembrar(self, cantidad):
+        from pagos.models import Pago
+        tickets = Ticket.objects.bulk_create([
+            Ticket(
+                empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+                numero_ticket=f'BENCH-{i:06d}', secuencial=i,
+                fecha_prometida=timezone.now() + timedelta(days=1)
+            ) for i in range(1, cantidad + 1)
+        ], batch_size=1000)
+        tickets = list(Ticket.objects.filter(numero_ticket__startswith='BENCH-').only('id'))
+
+        TicketItem.objects.bulk_create([
+            TicketItem(empresa=self.empresa, ticket=t, servicio=self.servicio, cantidad=1, precio_unitario=10)
+            for t in tickets for _ in range(self.ITEMS_POR_TICKET)
+        ], batch_size=2000)
+        Pago.objects.bulk_create([
+            Pago(
+                empresa=self.empresa, ticket=t, monto=4, estado='PAGADO',
+                metodo_pago_snapshot='Efectivo', numero_pago=f'PAG-B-{t.id}-{n}'
+            )
+            for t in tickets for n in range(self.PAGOS_POR_TICKET)
+        ], batch_size=2000)
+
+    def test_totales_correctos_y_latencia_lineal(self):
+        from tickets.services import TicketService
+
+        cantidad = int(os.environ.get('WASHLY_BENCH_TICKETS', 2000))
+        self._sembrar(cantidad)
+
+        queryset = TicketService.get_filtered_tickets(self.empresa, incluir_detalle=False).filter(
+            numero_ticket__startswith='BENCH-'
+        )
+        self.assertNotIn('DISTINCT', str(queryset.query).upper())
+
+        inicio = time.perf_counter()
+        filas = list(queryset.values_list('total_ticket_db', 'total_pagado_db'))
+        duracion = time.perf_counter() - inicio
+
+        self.assertEqual(len(filas), cantidad)
+        self.assertTrue(all(total == 30 and pagado == 8 for total, pagado in filas))
+        # Presupuesto holgado y proporcional al volumen (≈ 0.5 ms por ticket)
+        self.assertLess(duracion, max(2.0, cantidad * 0.0005))
+
+
+class TicketCursorPaginationTestCase(TicketsBaseTestCase):
+    """?paginacion=cursor: recorrido estable sin COUNT ni OFFSET"""
+
+    def setUp(self):
+        super().setUp()
+        misma_fecha = timezone.now()
+        for _ in range(6):
+            Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+                fecha_prometida=misma_fecha + timedelta(days=1)
+            )
+        # Empates en fecha_recepcion: el id debe desempatar
+        Ticket.objects.filter(empresa=self.empresa).update(fecha_recepcion=misma_fecha)
+        self.authenticate(self.cajero_user)
+
+    def _get(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = ' '.join(q['sql'].upper() for q in ctx.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+        return response.data
+
+    def test_recorrido_completo_sin_duplicados(self):
+        data = self._get('/api/tickets/?paginacion=cursor&page_size=3')
+        self.assertIsNone(data['previous'])
+        self.assertNotIn('count', data)
+        ids = [t['id'] for t in data['results']]
+        paginas = [ids[:]]
+        while data['next']:
+            data = self._get(data['next'])
+            paginas.append([t['id'] for t in data['results']])
+            ids += paginas[-1]
+
+        esperados = list(Ticket.objects.filter(empresa=self.empresa).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperados)
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+
+        # Volver atrás desde la última página
+        previa = self._get(data['previous'])
+        self.assertEqual([t['id'] for t in previa['results']], paginas[1])
+
+    def test_total_opcional_y_cursor_invalido(self):
+        response = self.client.get('/api/tickets/?paginacion=cursor&total=aprox')
+        self.assertEqual(response.data['total'], 7)
+
+        response = self.client.get('/api/tickets/?paginacion=cursor&cursor=basura')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ordering_con_cursor_se_rechaza(self):
+        for url in ('/api/tickets/?paginacion=cursor&ordering=estado',
+                    '/api/clientes/?paginacion=cursor&ordering=nombres'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn('ordering', response.data)
+
+    def test_sin_parametro_mantiene_paginacion_por_pagina(self):
+        response = self.client.get('/api/tickets/')
+        self.assertEqual(response.data['count'], 7)
+
+
+class TicketSecuenciaTestCase(TicketsBaseTestCase):
+    """Numeración por empresa vía TicketSecuencia"""
+
+    def _nuevo_ticket(self, **extra):
+        return Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+            fecha_prometida=timezone.now() + timedelta(days=1), **extra
+        )
+
+    def test_reserva_en_bloque_y_continuidad(self):
+        from tickets.services import TicketService
+        self.assertEqual(self.ticket.secuencial, 1)
+
+        bloque = TicketService.reservar_secuenciales(self.empresa.id, 5)
+        self.assertEqual(list(bloque), [2, 3, 4, 5, 6])
+
+        # Un ticket con secuencial reservado solo se formatea
+        reservado = self._nuevo_ticket(secuencial=bloque[0])
+        self.assertEqual(reservado.numero_ticket, 'TK-000002')
+        self.assertEqual(self._nuevo_ticket().secuencial, 7)
+
+    def test_inicializa_desde_maximo_existente(self):
+        from tickets.models import TicketSecuencia
+        Ticket.objects.filter(pk=self.ticket.pk).update(secuencial=41)
+        TicketSecuencia.objects.filter(empresa=self.empresa).delete()
+        self.assertEqual(self._nuevo_ticket().secuencial, 42)
+
+    def test_secuencia_independiente_por_empresa(self):
+        otro = Ticket.objects.create(
+            empresa=self.empresa_vencida,
+            cliente=Cliente.objects.create(empresa=self.empresa_vencida, numero_documento="1", nombres="X"),
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        self.assertEqual(otro.secuencial, 1)
+        self.assertEqual(self._nuevo_ticket().secuencial, 2)
+
+
+class TicketSecuenciaConcurrenciaTestCase(TransactionTestCase):
+    """
+    Estrés: muchos hilos creando tickets de la misma empresa en paralelo.
+    WASHLY_STRESS_TICKETS ajusta el volumen (por defecto 2000).
+    """
+
+    def setUp(self):
+        from core.models import Empresa
+        self.empresa = Empresa.objects.create(
+            nombre="Lavandería Estrés", ruc="11111111111", estado="ACTIVO",
+            fecha_vencimiento=timezone.now() + timedelta(days=30)
+        )
+        self.cliente = Cliente.objects.create(empresa=self.empresa, numero_documento="123", nombres="Ana")
+
+    def _crear_ticket(self):
+        from django.db import OperationalError, connection
+        while True:
+            try:
+                return Ticket.objects.create(
+                    empresa_id=self.empresa.id, cliente_id=self.cliente.id,
+                    fecha_prometida=timezone.now() + timedelta(days=1)
+                )
+            except OperationalError:
+                # SQLite no encola escritores concurrentes (tabla bloqueada): se reintenta.
+                # PostgreSQL espera el lock de la fila de secuencia y nunca llega aquí.
+                if connection.vendor != 'sqlite':
+                    raise
+                time.sleep(0.001)
+
+    def test_sin_huecos_ni_duplicados(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+
+        total = int(os.environ.get('WASHLY_STRESS_TICKETS', 2000))
+        hilos = 8
+
+        def trabajador(cantidad):
+            try:
+                return [self._crear_ticket().secuencial for _ in range(cantidad)]
+            finally:
+                connection.close()
+
+        por_hilo = [total // hilos + (1 if i < total % hilos else 0) for i in range(hilos)]
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            resultados = list(pool.map(trabajador, por_hilo))
+
+        secuenciales = sorted(s for r in resultados for s in r)
+        self.assertEqual(secuenciales, list(range(1, total + 1)))
+        numeros = Ticket.objects.filter(empresa=self.empresa).values_list('numero_ticket', flat=True)
+        self.assertEqual(len(set(numeros)), total)
+
+
+class TicketCreacionItemsTestCase(TicketsBaseTestCase):
+    """Creación de tickets: precios en una query y items con bulk_create"""
+
+    def setUp(self):
+        super().setUp()
+        from servicios.models import TipoPrenda, PrecioPorPrenda
+        tipo = TipoPrenda.objects.create(empresa=self.empresa, nombre="Superior")
+        self.camisa = Prenda.objects.create(empresa=self.empresa, nombre="Camisa", tipo=tipo)
+        self.polo = Prenda.objects.create(empresa=self.empresa, nombre="Polo", tipo=tipo)
+        PrecioPorPrenda.objects.create(
+            empresa=self.empresa, servicio=self.servicio, prenda=self.camisa, precio=15
+        )
+        self.authenticate(self.cajero_user)
+
+    def _crear(self, items):
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        payload = {
+            "cliente": self.cliente.id,
+            "sede": self.sede_principal.id,
+            "fecha_prometida": (timezone.now() + timedelta(days=1)).isoformat(),
+            "items": items,
+        }
+        with mock.patch('tickets.views.enviar_notificacion_ticket_async.delay'), \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/tickets/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return Ticket.objects.get(pk=response.data['id']), len(ctx.captured_queries)
+
+    def test_jerarquia_de_precios(self):
+        ticket, _ = self._crear([
+            # precio_unitario 0 => se resuelve por la jerarquía de precios
+            {"servicio": self.servicio.id, "prenda": self.camisa.id, "cantidad": 2, "precio_unitario": 0},
+            {"servicio": self.servicio.id, "prenda": self.polo.id, "cantidad": 1, "precio_unitario": 0},
+            {"servicio": self.servicio.id, "cantidad": 1, "precio_unitario": 12},
+        ])
+        precios = list(ticket.items.order_by('id').values_list('precio_unitario', flat=True))
+        self.assertEqual(precios, [15, 10, 12])
+        self.assertEqual(ticket.total, 52)
+        self.assertEqual(ticket.saldo, 52)
+
+    def test_queries_constantes_por_cantidad_de_items(self):
+        item = {"servicio": self.servicio.id, "prenda": self.camisa.id, "cantidad": 1, "precio_unitario": 0}
+        _, pocos = self._crear([item] * 3)
+        ticket, muchos = self._crear([item] * 30)
+        self.assertEqual(pocos, muchos)
+        self.assertEqual(ticket.items.count(), 30)
+        self.assertEqual(ticket.total, 450)
+
+
+class TicketUpdateEstadoMasivoTestCase(TicketsBaseTestCase):
+    """POST /api/tickets/update_estado_masivo/"""
+
+    def setUp(self):
+        super().setUp()
+        self.en_proceso = []
+        for _ in range(4):
+            t = Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+                fecha_prometida=timezone.now() + timedelta(days=1), estado='EN_PROCESO'
+            )
+            self.en_proceso.append(t)
+        self.authenticate(self.cajero_user)
+
+    def _post(self, payload):
+        from unittest import mock
+        with mock.patch('tickets.views.enviar_notificaciones_lote_async.delay') as delay:
+            response = self.client.post('/api/tickets/update_estado_masivo/', payload, format='json')
+        return response, delay
+
+    def test_transicion_en_lote_con_resultados_por_ticket(self):
+        from tickets.models import EstadoHistorial
+        ids = [self.en_proceso[0].id, self.en_proceso[1].id, str(self.en_proceso[2].tracking_uuid)]
+        payload = {
+            "tickets": ids + [self.ticket.id, 999999, "no-es-uuid"],
+            "estado": "LISTO",
+        }
+        response, delay = self._post(payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['actualizados'], 3)
+        self.assertEqual(response.data['fallidos'], 3)
+
+        errores = {r['ticket']: r['error'] for r in response.data['resultados'] if not r['ok']}
+        self.assertEqual(errores[str(self.ticket.id)], "No se puede cambiar de RECIBIDO a LISTO")
+        self.assertEqual(errores["999999"], "Ticket no encontrado")
+        self.assertEqual(errores["no-es-uuid"], "Ticket no encontrado")
+
+        actualizados = [t.id for t in self.en_proceso[:3]]
+        self.assertEqual(Ticket.objects.filter(id__in=actualizados, estado='LISTO').count(), 3)
+        self.assertEqual(Ticket.objects.get(pk=self.en_proceso[3].pk).estado, 'EN_PROCESO')
+        self.assertEqual(EstadoHistorial.objects.filter(ticket_id__in=actualizados, estado_nuevo='LISTO').count(), 3)
+
+        # Un único job de notificación para todo el lote
+        delay.assert_called_once()
+        self.assertEqual(sorted(delay.call_args.args[0]), sorted(actualizados))
+
+    def test_queries_constantes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as pocos:
+            self._post({"tickets": [self.en_proceso[0].id], "estado": "LISTO"})
+        with CaptureQueriesContext(connection) as muchos:
+            self._post({"tickets": [t.id for t in self.en_proceso[1:]], "estado": "LISTO"})
+        self.assertEqual(len(pocos.captured_queries), len(muchos.captured_queries))
+
+    def test_entrega_requiere_saldo_cero(self):
+        Ticket.objects.filter(pk=self.ticket.pk).update(estado='LISTO')
+        response, delay = self._post({"tickets": [self.ticket.id], "estado": "ENTREGADO"})
+        self.assertEqual(response.data['actualizados'], 0)
+        self.assertEqual(response.data['resultados'][0]['error'], "El ticket tiene saldo pendiente de pago")
+        delay.assert_not_called()
+
+
+class TicketDashboardTestCase(TicketsBaseTestCase):
+    """Dashboard: una query de agregación en frío, cero en caliente"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        super().setUp()
+        Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_secundaria, cliente=self.cliente,
+            fecha_prometida=timezone.now() + timedelta(days=1), estado='LISTO', prioridad='URGENTE'
+        )
+
+    def _stats(self, sede=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from tickets.services import TicketService
+        with CaptureQueriesContext(connection) as ctx:
+            stats = TicketService.get_dashboard_stats(self.empresa, sede)
+        return stats, len(ctx.captured_queries)
+
+    def test_una_query_en_frio_cero_en_caliente(self):
+        stats, queries = self._stats()
+        self.assertEqual(queries, 1)
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual(stats['recibidos'], 1)
+        self.assertEqual(stats['listos'], 1)
+        self.assertEqual(stats['urgentes'], 1)
+
+        stats, queries = self._stats()
+        self.assertEqual(queries, 0)
+        self.assertEqual(stats['total'], 2)
+
+        stats, queries = self._stats(self.sede_principal)
+        self.assertEqual((queries, stats['total']), (1, 1))
+
+    def test_cambio_de_estado_invalida(self):
+        from tickets.services import TicketService
+        self._stats()
+        self._stats(self.sede_principal)
+
+        TicketService.update_estado(self.ticket, 'EN_PROCESO', self.cajero_user)
+        stats, queries = self._stats()
+        self.assertEqual((queries, stats['en_proceso']), (1, 1))
+        stats, queries = self._stats(self.sede_principal)
+        self.assertEqual((queries, stats['recibidos']), (1, 0))
+
+        # El camino masivo (UPDATE sin señales) también invalida
+        TicketService.update_estado_masivo(self.empresa, [self.ticket.id], 'LISTO', self.cajero_user)
+        stats, queries = self._stats()
+        self.assertEqual((queries, stats['listos']), (1, 2))
+
+    def test_endpoint(self):
+        self.authenticate(self.admin_user)
+        response = self.client.get('/api/tickets/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('entregados_hoy', response.data)
+
+
+class TicketPublicTrackingCacheTestCase(TicketsBaseTestCase):
+    """Rastreo público: caché versionada + GET condicional"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        super().setUp()
+        self.url = f'/api/tickets/public_tracking/?id={self.ticket.tracking_uuid}'
+
+    def _get(self, **headers):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, **headers)
+        return response, len(ctx.captured_queries)
+
+    def test_poll_repetido_responde_304_sin_bd(self):
+        response, _ = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['numero_ticket'], self.ticket.numero_ticket)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response, queries = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(queries, 0)
+
+        response, queries = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 0)
+
+    def test_cambios_de_ticket_e_items_invalidan(self):
+        from tickets.services import TicketService
+        etag = self._get()[0]['ETag']
+
+        TicketItem.objects.create(
+            empresa=self.empresa, ticket=self.ticket, servicio=self.servicio, cantidad=1, precio_unitario=5
+        )
+        response, queries = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(queries, 0)
+        self.assertEqual(len(response.data['items']), 2)
+
+        etag = response['ETag']
+        TicketService.update_estado_masivo(self.empresa, [self.ticket.id], 'EN_PROCESO', self.cajero_user)
+        response, _ = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data['estado'], 'EN_PROCESO')
+
+    def test_cambios_de_la_empresa_invalidan(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from core.models import Empresa
+        etag = self._get()[0]['ETag']
+
+        # Renovaciones y ajustes guardan la empresa completa sin tocar su marca: la caché sigue
+        empresa = Empresa.objects.get(pk=self.empresa.pk)
+        empresa.fecha_vencimiento += timedelta(days=30)
+        empresa.save()
+        empresa.save(update_fields=['estado'])
+        self.assertEqual(self._get()[1], 0)
+
+        empresa.nombre = "Lavandería Renovada"
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            empresa.save()
+        # Una sola clave por empresa, sin importar cuántos tickets tenga
+        self.assertEqual([len(c.args[0]) for c in set_many.call_args_list], [1])
+        response, queries = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['empresa_nombre'], "Lavandería Renovada")
+        self.assertEqual(self._get()[1], 0)
+
+    def test_contadores_hit_miss(self):
+        from django.contrib.auth.models import User
+        self._get()
+        self._get()
+        self._get()
+        self.client.get('/api/tickets/public_tracking/?id=no-es-uuid')
+
+        staff = User.objects.create_user(username="staff", password="x", is_staff=True)
+        self.authenticate(staff)
+        response = self.client.get('/api/tickets/public_tracking_stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['hits'], response.data['misses']), (2, 1))
+
+        self.authenticate(self.admin_user)
+        response = self.client.get('/api/tickets/public_tracking_stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BusquedaIndexadaTestCase(TicketsBaseTestCase):
+    """Búsqueda por texto_busqueda (FTS5 en SQLite / trigram en PostgreSQL)"""
+
+    def setUp(self):
+        super().setUp()
+        self.jose = Cliente.objects.create(
+            empresa=self.empresa, numero_documento="40123456", nombres="José Ángel",
+            apellidos="Núñez", telefono="987654321", email="jnunez@correo.pe"
+        )
+        Cliente.objects.create(
+            empresa=self.empresa_vencida, numero_documento="40999999", nombres="Jose", apellidos="Nunez", telefono="1"
+        )
+        from tickets.services import TicketService
+        TicketService.reservar_secuenciales(self.empresa.id, 20)  # secuencial de dos dígitos
+        self.ticket_jose = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.jose,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        self.authenticate(self.cajero_user)
+
+    def _buscar(self, recurso, q):
+        response = self.client.get(f'/api/{recurso}/buscar/', {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [r['id'] for r in response.data]
+
+    def test_texto_normalizado(self):
+        self.assertEqual(self.jose.texto_busqueda, 'jose angel nunez 40123456 987654321 jnunez@correo.pe')
+        self.assertIn('jose angel nunez', Ticket.objects.get(pk=self.ticket_jose.pk).texto_busqueda)
+
+    def test_busqueda_sin_tildes_por_prefijo_y_aislada_por_empresa(self):
+        self.assertEqual(self._buscar('clientes', 'JOSE nuñ'), [self.jose.id])
+        self.assertEqual(self._buscar('clientes', '4012'), [self.jose.id])
+        self.assertEqual(self._buscar('clientes', 'perez juan'), [self.cliente.id])
+        self.assertEqual(self._buscar('clientes', 'x'), [])
+
+    def test_busqueda_tickets_por_numero_y_cliente(self):
+        self.assertEqual(self._buscar('tickets', 'nunez'), [self.ticket_jose.id])
+        self.assertEqual(self._buscar('tickets', self.ticket_jose.numero_ticket), [self.ticket_jose.id])
+        self.assertEqual(self._buscar('tickets', str(self.ticket_jose.secuencial)), [self.ticket_jose.id])
+
+    def test_cambio_de_cliente_se_propaga_a_tickets(self):
+        self.jose.apellidos = "Quispe"
+        self.jose.save()
+        self.assertEqual(self._buscar('tickets', 'quispe'), [self.ticket_jose.id])
+        self.assertEqual(self._buscar('tickets', 'nunez'), [])
+
+    def test_search_del_listado_usa_columna_normalizada(self):
+        response = self.client.get('/api/clientes/', {'search': 'Núñez'})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.jose.id])
+
+
+class BusquedaBenchmarkTestCase(TicketsBaseTestCase):
+    """
+    Latencia de búsqueda con muchos clientes.
+    Volumen por defecto reducido para la suite; WASHLY_BENCH_CLIENTES=500000 reproduce el escenario completo.
+    """
+
+    def test_latencia_de_busqueda(self):
+        from core.utils import normalizar_texto_busqueda
+        from tickets import busqueda
+
+        cantidad = int(os.environ.get('WASHLY_BENCH_CLIENTES', 5000))
+        nombres = ['María', 'José', 'Lucía', 'Andrés', 'Ramón', 'Sofía', 'Raúl', 'Inés']
+        apellidos = ['Quispe', 'Mamani', 'Huamán', 'Flores', 'Pérez', 'Núñez', 'Chávez', 'Rojas']
+        lote = []
+        for i in range(cantidad):
+            nombre, apellido = nombres[i % 8], apellidos[(i // 8) % 8]
+            doc, tel = f"{10000000 + i}", f"9{i:08d}"
+            lote.append(Cliente(
+                empresa=self.empresa, nombres=nombre, apellidos=apellido, numero_documento=doc, telefono=tel,
+                texto_busqueda=normalizar_texto_busqueda(nombre, apellido, doc, tel)
+            ))
+            if len(lote) == 5000:
+                Cliente.objects.bulk_create(lote)
+                lote = []
+        Cliente.objects.bulk_create(lote)
+
+        consultas = ['jose nunez', 'maria', 'chavez', '1000012', 'raul rojas 9000']
+        inicio = time.perf_counter()
+        for q in consultas:
+            ids = busqueda.buscar_ids(Cliente, self.empresa.id, q, limite=20)
+            self.assertTrue(ids, q)
+        promedio = (time.perf_counter() - inicio) / len(consultas)
+        self.assertLess(promedio, 0.25, f"{promedio:.4f}s por búsqueda con {cantidad} clientes")
+
+
+class ClienteStatsTestCase(TicketsBaseTestCase):
+    """ClienteStats se mantiene por eventos y el listado CRM la lee sin agregar tickets/pagos"""
+
+    def _stats(self):
+        from .models import ClienteStats
+        return ClienteStats.objects.get(cliente=self.cliente)
+
+    def _pagar(self, ticket, monto):
+        from pagos.models import CajaSesion
+        from pagos.services import registrar_pago
+        CajaSesion.objects.get_or_create(
+            empresa=self.empresa, usuario=self.cajero_user, sede=self.sede_principal, estado='ABIERTA'
+        )
+        return registrar_pago(self.cajero_user, self.empresa, ticket, monto, metodo_pago_str='EFECTIVO')
+
+    def test_eventos_actualizan_stats(self):
+        """Alta de ticket, items, pagos, anulación y cancelación"""
+        from pagos.services import anular_pago
+        stats = self._stats()
+        self.assertEqual(stats.total_tickets, 1)
+        self.assertEqual(stats.saldo_pendiente, 20)
+        self.assertEqual(stats.ultima_visita, Ticket.objects.get(pk=self.ticket.pk).fecha_recepcion)
+
+        pago = self._pagar(self.ticket, 15)
+        stats = self._stats()
+        self.assertEqual(stats.total_gastado, 15)
+        self.assertEqual(stats.gasto_mes_vigente, 15)
+        self.assertEqual(stats.saldo_pendiente, 5)
+
+        anular_pago(pago)
+        stats = self._stats()
+        self.assertEqual(stats.total_gastado, 0)
+        self.assertEqual(stats.gasto_mes_vigente, 0)
+        self.assertEqual(stats.saldo_pendiente, 20)
+
+        otro = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        TicketItem.objects.create(
+            empresa=self.empresa, ticket=otro, servicio=self.servicio, cantidad=1, precio_unitario=30
+        )
+        stats = self._stats()
+        self.assertEqual(stats.total_tickets, 2)
+        self.assertEqual(stats.saldo_pendiente, 50)
+
+        otro.refresh_from_db()
+        otro.estado = 'CANCELADO'
+        otro.save()
+        self.assertEqual(self._stats().saldo_pendiente, 20)
+
+    def test_stats_coinciden_con_recalculo(self):
+        """El mantenimiento incremental llega al mismo resultado que el recálculo completo"""
+        from .models import ClienteStats
+        from .services import ClienteStatsService
+        self._pagar(self.ticket, 12)
+        incremental = self._stats()
+        ClienteStats.objects.filter(cliente=self.cliente).delete()
+        ClienteStatsService.recalcular([self.cliente.pk])
+        recalculado = self._stats()
+        for campo in ClienteStatsService.CAMPOS:
+            self.assertEqual(getattr(incremental, campo), getattr(recalculado, campo), campo)
+
+    def test_listado_crm_consultas_constantes(self):
+        """El listado de clientes no ejecuta consultas por fila"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.authenticate(self.admin_user)
+        for i in range(15):
+            cliente = Cliente.objects.create(
+                empresa=self.empresa, numero_documento=f"5000{i:04d}", nombres=f"Cliente {i}"
+            )
+            Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=cliente,
+                fecha_prometida=timezone.now() + timedelta(days=1)
+            )
+        TicketItem.objects.create(
+            empresa=self.empresa, ticket=self.ticket, servicio=self.servicio, cantidad=1, precio_unitario=230
+        )
+        self._pagar(self.ticket, 250)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/clientes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+
+        filas = response.data.get('results', response.data)
+        juan = next(c for c in filas if c['id'] == self.cliente.pk)
+        self.assertTrue(juan['es_vip'])
+        self.assertEqual(juan['saldo_pendiente'], 0)
+
+    def test_comando_reconstruye(self):
+        """reconstruir_cliente_stats repara una fila desalineada"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ClienteStats
+        ClienteStats.objects.filter(cliente=self.cliente).update(total_tickets=99, saldo_pendiente=0)
+        call_command('reconstruir_cliente_stats', '--empresa', str(self.empresa.pk), stdout=StringIO())
+        stats = self._stats()
+        self.assertEqual(stats.total_tickets, 1)
+        self.assertEqual(stats.saldo_pendiente, 20)
+
+
+class SegmentacionRFMTestCase(TicketsBaseTestCase):
+    """Segmentación RFM vectorizada y su uso en el CRM"""
+
+    def _cliente_con_pagos(self, documento, montos, dias_atras=0):
+        from pagos.models import Pago
+        cliente = Cliente.objects.create(empresa=self.empresa, numero_documento=documento, nombres=documento)
+        for monto in montos:
+            ticket = Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=cliente,
+                fecha_prometida=timezone.now() + timedelta(days=1)
+            )
+            TicketItem.objects.create(
+                empresa=self.empresa, ticket=ticket, servicio=self.servicio, cantidad=1, precio_unitario=monto
+            )
+            pago = Pago.objects.create(empresa=self.empresa, ticket=ticket, monto=monto, metodo_pago_snapshot='EFECTIVO')
+            Pago.objects.filter(pk=pago.pk).update(fecha_pago=timezone.now() - timedelta(days=dias_atras))
+        return cliente
+
+    def _clientes_ocasionales(self, cantidad=4):
+        """Población base para que los quintiles tengan contra qué comparar"""
+        for i in range(cantidad):
+            self._cliente_con_pagos(f'2000000{i}', [10], dias_atras=30)
+
+    def test_calcular_rfm_vectorizado(self):
+        """Puntajes por quintil y reglas de segmento sobre arrays"""
+        import numpy as np
+        from .segmentacion import calcular_rfm
+        ahora = 100 * 86400.0
+        clientes = np.array([1, 1, 1, 1, 1, 2, 3, 3, 4, 5])
+        fechas = np.array([99, 98, 97, 96, 95, 99, 10, 12, 50, 5]) * 86400.0
+        montos = np.array([50, 50, 50, 50, 50, 10, 40, 40, 20, 5], dtype=float)
+        ids, r, f, m, segmentos = calcular_rfm(clientes, fechas, montos, ahora)
+        resultado = dict(zip(ids.tolist(), segmentos.tolist()))
+        self.assertEqual(resultado[1], 'CAMPEON')
+        self.assertEqual(resultado[2], 'NUEVO')
+        self.assertEqual(resultado[5], 'PERDIDO')
+        self.assertEqual(r.min(), 1)
+        self.assertEqual(f.max(), 5)
+
+    def test_tarea_persiste_segmentos(self):
+        """La tarea guarda segmento y puntajes; clientes sin pagos quedan SIN_COMPRAS"""
+        from .tasks import segmentar_clientes_rfm
+        self._clientes_ocasionales()
+        frecuente = self._cliente_con_pagos('10000001', [100, 120, 90, 80])
+        perdido = self._cliente_con_pagos('10000002', [15], dias_atras=300)
+
+        resumen = segmentar_clientes_rfm(self.empresa.id)
+
+        self.assertIn(self.empresa.id, resumen)
+        frecuente.refresh_from_db()
+        perdido.refresh_from_db()
+        self.cliente.refresh_from_db()
+        self.assertEqual(frecuente.segmento, 'CAMPEON')
+        self.assertEqual(frecuente.rfm_frecuencia, 5)
+        self.assertEqual(perdido.segmento, 'PERDIDO')
+        self.assertEqual(self.cliente.segmento, 'SIN_COMPRAS')
+        self.assertIsNone(self.cliente.rfm_recencia)
+
+    def test_filtro_crm_por_segmento(self):
+        """?segmento=VIP usa el segmento precalculado y es_vip se deriva de él"""
+        from .segmentacion import segmentar_empresa
+        self._clientes_ocasionales()
+        frecuente = self._cliente_con_pagos('10000003', [100, 120, 90])
+        segmentar_empresa(self.empresa.id)
+
+        self.authenticate(self.admin_user)
+        response = self.client.get('/api/clientes/', {'segmento': 'VIP'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        filas = response.data.get('results', response.data)
+        self.assertEqual([c['id'] for c in filas], [frecuente.id])
+        self.assertTrue(filas[0]['es_vip'])
+        self.assertEqual(filas[0]['segmento'], 'CAMPEON')
+
+
+class ClientesDuplicadosTestCase(TicketsBaseTestCase):
+    """Detección de duplicados por bloques y fusión"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        # Mismo teléfono con prefijo de país y nombre con tilde/variante ortográfica
+        self.duplicado = Cliente.objects.create(
+            empresa=self.empresa, numero_documento="00-77777777", nombres="Juán", apellidos="Peres",
+            telefono="+51 999-999-999", email="juan@correo.com"
+        )
+        # Homónimo fonético pero sin otros datos en común
+        self.homonimo = Cliente.objects.create(
+            empresa=self.empresa, numero_documento="12345678", nombres="Juana", apellidos="Vega", telefono="911222333"
+        )
+
+    def test_claves_de_bloque(self):
+        from . import duplicados
+        self.assertEqual(duplicados.clave_telefono("+51 987 654 321"), "987654321")
+        self.assertIsNone(duplicados.clave_telefono("999999999"))
+        self.assertEqual(duplicados.clave_documento("00-1234567"), "1234567")
+        self.assertEqual(
+            duplicados.clave_nombre("Héctor", "Velázquez"), duplicados.clave_nombre("Ector", "Belasques")
+        )
+
+    def test_detecta_pares(self):
+        from . import duplicados
+        pares = duplicados.detectar(self.empresa.id)
+        self.assertEqual([(p['a'], p['b']) for p in pares], [(self.cliente.id, self.duplicado.id)])
+        self.assertIn('documento', pares[0]['motivos'])
+
+    def test_bloques_grandes_se_descartan(self):
+        from . import duplicados
+        self.assertEqual(duplicados.detectar(self.empresa.id, max_bloque=1), [])
+
+    def test_fusion_reapunta_tickets_y_notificaciones(self):
+        from notificaciones.models import Notificacion
+        from .models import ClienteStats
+        from .services import ClienteService
+        ticket_dup = Ticket.objects.create(
+            empresa=self.empresa, sede=self.sede_principal, cliente=self.duplicado,
+            fecha_prometida=timezone.now() + timedelta(days=1)
+        )
+        notificacion = Notificacion.objects.create(
+            empresa=self.empresa, cliente=self.duplicado, destinatario="juan@correo.com", canal='EMAIL', mensaje="Hola"
+        )
+
+        resultado = ClienteService.fusionar_clientes(self.empresa, self.cliente.id, [self.duplicado.id], self.admin_user)
+
+        self.assertEqual(resultado['tickets_movidos'], 1)
+        self.assertEqual(resultado['notificaciones_movidas'], 1)
+        ticket_dup.refresh_from_db()
+        notificacion.refresh_from_db()
+        self.duplicado.refresh_from_db()
+        self.cliente.refresh_from_db()
+        self.assertEqual(ticket_dup.cliente_id, self.cliente.id)
+        self.assertIn('juan perez', ticket_dup.texto_busqueda)
+        self.assertEqual(notificacion.cliente_id, self.cliente.id)
+        self.assertFalse(self.duplicado.activo)
+        self.assertEqual(self.cliente.email, "juan@correo.com")  # Completado desde el duplicado
+        self.assertEqual(ClienteStats.objects.get(cliente=self.cliente).total_tickets, 2)
+        self.assertEqual(ClienteStats.objects.get(cliente=self.duplicado).total_tickets, 0)
+
+    def test_fusion_rechaza_otra_empresa(self):
+        from .services import ClienteService
+        ajeno = Cliente.objects.create(empresa=self.empresa_vencida, numero_documento="55555555", nombres="Otro")
+        with self.assertRaises(ValueError):
+            ClienteService.fusionar_clientes(self.empresa, self.cliente.id, [ajeno.id])
+
+    def test_api_duplicados_y_fusion(self):
+        from unittest import mock
+        self.authenticate(self.admin_user)
+        with mock.patch('tickets.views.detectar_clientes_duplicados.delay') as delay:
+            response = self.client.get('/api/clientes/duplicados/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(self.empresa.id)
+
+        from . import duplicados
+        duplicados.ejecutar(self.empresa.id)
+        response = self.client.get('/api/clientes/duplicados/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pares'][0]['cliente_b']['id'], self.duplicado.id)
+
+        response = self.client.post('/api/clientes/fusionar/', {
+            'principal': self.cliente.id, 'duplicados': [self.duplicado.id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/clientes/duplicados/')
+        self.assertEqual(response.data['pares'], [])
+
+    def test_resultado_persistido_por_empresa(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from . import duplicados
+        from .models import DeteccionDuplicados
+        self.authenticate(self.admin_user)
+
+        duplicados.ejecutar(self.empresa.id)
+        cache.clear()  # El resultado no depende de la caché compartida
+        response = self.client.get('/api/clientes/duplicados/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 1)
+        self.assertIsNone(duplicados.resultado(self.empresa_vencida.id))
+
+        # Un resultado vencido vuelve a encolar la detección
+        DeteccionDuplicados.objects.filter(empresa=self.empresa).update(
+            generado_en=timezone.now() - timedelta(seconds=duplicados.VIGENCIA + 1)
+        )
+        with mock.patch('tickets.views.detectar_clientes_duplicados.delay') as delay:
+            response = self.client.get('/api/clientes/duplicados/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(self.empresa.id)
+
+    def test_api_fusion_solo_admin(self):
+        self.authenticate(self.cajero_user)
+        response = self.client.post('/api/clientes/fusionar/', {
+            'principal': self.cliente.id, 'duplicados': [self.duplicado.id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_comando(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('detectar_clientes_duplicados', '--empresa', str(self.empresa.id), stdout=out)
+        self.assertIn('1 pares candidatos', out.getvalue())
+        call_command(
+            'detectar_clientes_duplicados', '--empresa', str(self.empresa.id),
+            '--fusionar', str(self.cliente.id), str(self.duplicado.id), stdout=StringIO()
+        )
+        self.duplicado.refresh_from_db()
+        self.assertFalse(self.duplicado.activo)
+
+
+class ImportacionClientesTestCase(TicketsBaseTestCase):
+    """Importación masiva de clientes por lotes con upsert"""
+
+    def setUp(self):
+        super().setUp()
+        from django.conf import settings
+        from django.test import override_settings
+        # Archivos y reportes en memoria: nunca al bucket configurado (S3/Supabase)
+        self._override = override_settings(STORAGES={
+            **settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        })
+        self._override.enable()
+
+    def tearDown(self):
+        self._override.disable()
+        super().tearDown()
+
+    def _subir(self, nombre, contenido):
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.authenticate(self.admin_user)
+        with mock.patch('tickets.views.importar_clientes.delay') as delay:
+            response = self.client.post('/api/clientes/importar/', {
+                'archivo': SimpleUploadedFile(nombre, contenido)
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(response.data['id'])
+        return response.data['id']
+
+    def _ejecutar(self, importacion_id, **kwargs):
+        from .importacion import ejecutar
+        from .models import ImportacionClientes
+        ejecutar(importacion_id, **kwargs)
+        return ImportacionClientes.objects.get(pk=importacion_id)
+
+    def test_csv_upsert_y_reporte_de_errores(self):
+        from .models import ClienteStats
+        contenido = (
+            "DNI;Nombre;Celular;Correo\n"
+            "77777777;Juan;988777666;\n"          # Existente: actualiza teléfono, conserva apellidos
+            "40000001;María José;955111222;mj@correo.com\n"
+            "40000002;;955000000;\n"              # Sin nombre: error
+            "40000003;Pedro;944000000;no-es-email\n"  # Email inválido: error
+            "40000001;María Josefa;955111222;mj@correo.com\n"  # Repetida: gana la última
+        ).encode('utf-8')
+        importacion = self._ejecutar(self._subir('clientes.csv', contenido))
+
+        self.assertEqual(importacion.estado, 'COMPLETADO')
+        self.assertEqual((importacion.procesadas, importacion.creados, importacion.actualizados, importacion.errores), (5, 1, 1, 2))
+        self.assertEqual(importacion.progreso, 100)
+
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.telefono, "988777666")
+        self.assertEqual(self.cliente.apellidos, "Perez")
+        nueva = Cliente.objects.get(empresa=self.empresa, numero_documento="40000001")
+        self.assertEqual(nueva.nombres, "María Josefa")
+        self.assertIn("maria josefa", nueva.texto_busqueda)
+        self.assertTrue(ClienteStats.objects.filter(cliente=nueva).exists())
+
+        response = self.client.get(f'/api/clientes/importaciones/{importacion.id}/errores/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        reporte = b''.join(response.streaming_content).decode()
+        self.assertIn('40000002', reporte)
+        self.assertIn('40000003', reporte)
+        self.assertNotIn('40000001', reporte)
+
+    def test_cambio_de_nombre_actualiza_texto_de_tickets(self):
+        contenido = "numero_documento,nombres,apellidos\n77777777,Juan Carlos,Pérez\n".encode('utf-8')
+        self._ejecutar(self._subir('clientes.csv', contenido))
+        self.ticket.refresh_from_db()
+        self.assertIn('juan carlos perez', self.ticket.texto_busqueda)
+
+    def test_xlsx(self):
+        from io import BytesIO
+        from openpyxl import Workbook
+        libro = Workbook()
+        hoja = libro.active
+        hoja.append(['Tipo', 'Documento', 'Nombres', 'Apellidos', 'Teléfono'])
+        hoja.append(['ruc', 20123456789, 'Lavandería', 'SAC', 987654321])
+        hoja.append([None, None, None, None, None])
+        hoja.append(['DNI', 41000000, 'Rosa', 'Quispe', None])
+        archivo = BytesIO()
+        libro.save(archivo)
+
+        importacion = self._ejecutar(self._subir('clientes.xlsx', archivo.getvalue()))
+        self.assertEqual(importacion.estado, 'COMPLETADO')
+        self.assertEqual(importacion.creados, 2)
+        empresa_cliente = Cliente.objects.get(empresa=self.empresa, numero_documento="20123456789")
+        self.assertEqual(empresa_cliente.tipo_documento, 'RUC')
+        self.assertEqual(empresa_cliente.telefono, '987654321')
+
+    def test_consultas_por_lote_no_por_fila(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def importar(desde, cantidad):
+            filas = ''.join(f"{desde + i},Cliente {i},9{desde + i}\n" for i in range(cantidad))
+            importacion_id = self._subir('clientes.csv', f"documento,nombre,telefono\n{filas}".encode())
+            with CaptureQueriesContext(connection) as ctx:
+                self._ejecutar(importacion_id, lote=100)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(importar(50000000, 10), importar(60000000, 40))
+
+    def test_columnas_obligatorias(self):
+        importacion = self._ejecutar(self._subir('clientes.csv', b"telefono\n999\n"))
+        self.assertEqual(importacion.estado, 'ERROR')
+        self.assertIn('numero_documento', importacion.mensaje)
+
+    def test_formato_no_soportado(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.authenticate(self.admin_user)
+        response = self.client.post('/api/clientes/importar/', {
+            'archivo': SimpleUploadedFile('clientes.txt', b'x')
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AutocompletadoClientesTestCase(TicketsBaseTestCase):
+    """Autocompletado POS por prefijo desde el índice en memoria"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tickets import autocompletado
+        from unittest import mock
+        cache.clear()
+        autocompletado.limpiar()
+        super().setUp()
+        # Reconstrucción inmediata: el hilo de fondo no vería los datos sin commit del test
+        self._inmediato = mock.patch.object(autocompletado, '_en_segundo_plano', lambda funcion, *args: funcion(*args))
+        self._inmediato.start()
+        self.addCleanup(self._inmediato.stop)
+        self.authenticate(self.cajero_user)
+        self.otro = Cliente.objects.create(
+            empresa=self.empresa, numero_documento="CE001234", nombres="Rosa", apellidos="Flores",
+            telefono="+51 987-654-321"
+        )
+
+    def _autocompletar(self, q, **params):
+        response = self.client.get('/api/clientes/autocompletar/', {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_prefijo_telefono_y_documento(self):
+        self.assertEqual([c['id'] for c in self._autocompletar('99999')], [self.cliente.id])
+        self.assertEqual([c['id'] for c in self._autocompletar('7777')], [self.cliente.id])
+        # Teléfono con prefijo de país y separadores; documento alfanumérico sin distinguir mayúsculas
+        self.assertEqual([c['id'] for c in self._autocompletar('987 654')], [self.otro.id])
+        self.assertEqual([c['id'] for c in self._autocompletar('51987')], [self.otro.id])
+        self.assertEqual([c['id'] for c in self._autocompletar('ce0012')], [self.otro.id])
+        self.assertEqual(self._autocompletar('99'), [])  # Menos de 3 caracteres
+
+        fila = self._autocompletar('999')[0]
+        self.assertEqual(set(fila), {'id', 'nombre_completo', 'telefono', 'numero_documento'})
+        self.assertEqual(fila['nombre_completo'], 'Juan Perez')
+
+    def test_indice_caliente_no_consulta_clientes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from tickets import autocompletado
+
+        autocompletado.autocompletar(self.empresa.id, '999')
+        with CaptureQueriesContext(connection) as ctx:
+            for q in ('999', '9876', '7777', 'CE0'):
+                autocompletado.autocompletar(self.empresa.id, q)
+        # Solo la lectura de la versión por clave primaria
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertFalse([q for q in ctx.captured_queries if 'tickets_cliente' in q['sql']])
+
+    def test_sin_indice_vigente_responde_la_bd_sin_esperar(self):
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from tickets import autocompletado
+
+        self.assertEqual(len(self._autocompletar('999')), 1)  # Índice caliente
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Cliente.objects.create(
+                empresa=self.empresa, numero_documento="47474747", nombres="Ada", telefono="912345678"
+            )
+        programadas = []
+        with mock.patch.object(autocompletado, '_en_segundo_plano', lambda funcion, *args: programadas.append(args)):
+            with CaptureQueriesContext(connection) as ctx:
+                encontrados = autocompletado.autocompletar(self.empresa.id, '912', limite=5)
+            self.assertEqual([c['id'] for c in encontrados], [nuevo.id])
+            consulta = next(q['sql'] for q in ctx.captured_queries if 'tickets_cliente' in q['sql'])
+            self.assertIn('LIKE', consulta)
+            self.assertIn('LIMIT 5', consulta)
+
+            # Una sola reconstrucción en curso por empresa
+            self.assertEqual([c['id'] for c in autocompletado.autocompletar(self.empresa.id, '4747')], [nuevo.id])
+            self.assertEqual(programadas, [(self.empresa.id,)])
+
+        autocompletado._reconstruir(*programadas[0])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual([c['id'] for c in autocompletado.autocompletar(self.empresa.id, '912')], [nuevo.id])
+        self.assertFalse([q for q in ctx.captured_queries if 'tickets_cliente' in q['sql']])
+
+    def test_version_vive_en_la_bd(self):
+        from django.core.cache import cache
+        from tickets import autocompletado
+
+        self.assertEqual(self._autocompletar('912'), [])
+        cache.clear()  # La versión no depende de la caché compartida
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(empresa=self.empresa, numero_documento="46464646", nombres="Eli", telefono="912000000")
+        cache.clear()
+        self.assertEqual(len(self._autocompletar('912')), 1)
+
+        antes = autocompletado._version(self.empresa.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            autocompletado.invalidar(self.empresa.id)
+            # La fila de versión no se toca (ni se bloquea) hasta el commit
+            self.assertEqual(autocompletado._version(self.empresa.id), antes)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(autocompletado._version(self.empresa.id), antes + 1)
+        self.assertEqual(autocompletado._version(self.empresa_vencida.id), 0)
+
+    def test_escrituras_invalidan_el_indice(self):
+        self.assertEqual(self._autocompletar('912'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Cliente.objects.create(
+                empresa=self.empresa, numero_documento="45454545", nombres="Ana", telefono="912345678"
+            )
+        self.assertEqual([c['id'] for c in self._autocompletar('912')], [nuevo.id])
+
+        nuevo.telefono = "955555555"
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.save()
+        self.assertEqual(self._autocompletar('912'), [])
+
+        nuevo.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.save()
+        self.assertEqual(self._autocompletar('955'), [])
+
+    def test_aislamiento_y_limite(self):
+        Cliente.objects.bulk_create([
+            Cliente(empresa=self.empresa, numero_documento=f"6000000{i}", nombres=f"C{i}") for i in range(8)
+        ])
+        Cliente.objects.create(empresa=self.empresa_vencida, numero_documento="60000009", nombres="Ajeno")
+        from tickets import autocompletado
+        with self.captureOnCommitCallbacks(execute=True):
+            autocompletado.invalidar(self.empresa.id)  # bulk_create no emite señales
+
+        self.assertEqual(len(self._autocompletar('6000000', limite='5')), 5)
+        nombres = {c['nombre_completo'] for c in self._autocompletar('6000000', limite='50')}
+        self.assertEqual(len(nombres), 8)
+        self.assertNotIn('Ajeno', nombres)
+
+    def test_latencia_con_indice_caliente(self):
+        from tickets import autocompletado
+
+        cantidad = int(os.environ.get('WASHLY_BENCH_CLIENTES', 5000))
+        filas = [(i, 'Cliente', str(i), f"9{i:08d}", f"{10000000 + i}") for i in range(cantidad)]
+        indice = autocompletado.IndicePrefijos(1, filas)
+        consultas = ['9000', '900012', '1000', '10000042', '95']
+        inicio = time.perf_counter()
+        for _ in range(100):
+            for q in consultas:
+                indice.buscar(q)
+        promedio = (time.perf_counter() - inicio) / (100 * len(consultas))
+        self.assertLess(promedio, 0.01, f"{promedio:.6f}s por consulta con {cantidad} clientes")
+
+
+class ClienteHistorialTestCase(TicketsBaseTestCase):
+    """Detalle con resumen agregado e historial paginado por cursor"""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.cajero_user)
+
+    def _crear_tickets(self, cantidad, **kwargs):
+        for _ in range(cantidad):
+            ticket = Ticket.objects.create(
+                empresa=self.empresa, sede=self.sede_principal, cliente=self.cliente,
+                fecha_prometida=timezone.now() + timedelta(days=2), **kwargs
+            )
+            TicketItem.objects.create(
+                empresa=self.empresa, ticket=ticket, servicio=self.servicio, cantidad=1, precio_unitario=5
+            )
+
+    def _consultas(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_resumen_en_detalle(self):
+        self._crear_tickets(2)
+        self._crear_tickets(1, estado='CANCELADO')
+        response, _ = self._consultas(f'/api/clientes/{self.cliente.id}/')
+        resumen = response.data['resumen']
+        self.assertEqual(resumen['total_tickets'], 4)
+        self.assertEqual(resumen['por_estado']['CANCELADO'], 1)
+        self.assertEqual(resumen['por_estado']['RECIBIDO'], 3)
+        self.assertEqual(resumen['total_facturado'], 30)  # 20 + 2 × 5; el cancelado no suma
+        self.assertEqual(resumen['saldo_pendiente'], 30)
+        self.assertIsNotNone(resumen['ultima_visita'])
+
+    def test_historial_paginado_por_cursor(self):
+        self._crear_tickets(4)
+        vistos = []
+        url = f'/api/clientes/{self.cliente.id}/tickets/?page_size=2'
+        while url:
+            response, _ = self._consultas(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            vistos += [t['id'] for t in response.data['results']]
+            url = response.data['next']
+        esperados = list(Ticket.objects.filter(cliente=self.cliente).order_by('-fecha_recepcion', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperados)
+        self.assertEqual(response.data['results'][-1]['total'], 20)
+
+    def test_consultas_constantes_al_crecer_el_historial(self):
+        _, detalle_corto = self._consultas(f'/api/clientes/{self.cliente.id}/')
+        _, pagina_corta = self._consultas(f'/api/clientes/{self.cliente.id}/tickets/?page_size=5')
+        self._crear_tickets(15)
+        _, detalle_largo = self._consultas(f'/api/clientes/{self.cliente.id}/')
+        _, pagina_larga = self._consultas(f'/api/clientes/{self.cliente.id}/tickets/?page_size=5')
+        self.assertEqual(detalle_corto, detalle_largo)
+        self.assertEqual(pagina_corta, pagina_larga)
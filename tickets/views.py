@@ -6,56 +6,191 @@ Actualizado para SaaS: Filtros por Empresa, CRM Seguro y Dashboard Multi-tenant
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny # ✅ Added AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser # ✅ Added AllowAny
+from django.db import transaction
 from django.db.models import Q, Sum, F, DecimalField, OuterRef, Subquery, Max, Count, Prefetch  # ✅ Agregados Count y Prefetch
 from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
 
 from core.permissions import IsActiveSubscription # <--- NUEVO IMPORT
+from core.permissions import IsAdminUser as IsEmpresaAdmin
 
-from .models import Cliente, Ticket, TicketItem, EstadoHistorial
+from .models import Cliente, ImportacionClientes, Ticket, TicketItem, EstadoHistorial
 from .serializers import (
-    ClienteSerializer, ClienteListSerializer, ClienteCRMSerializer,
+    ClienteSerializer, ClienteDetalleSerializer, ClienteListSerializer, ClienteCRMSerializer, ClienteFusionSerializer,
+    ImportacionClientesSerializer,
     TicketSerializer, TicketListSerializer, TicketCreateSerializer,
-    TicketItemSerializer, EstadoHistorialSerializer, TicketUpdateEstadoSerializer
+    TicketItemSerializer, EstadoHistorialSerializer, TicketUpdateEstadoSerializer,
+    TicketUpdateEstadoMasivoSerializer
 )
 from core.mixins import resolver_sede_desde_request
+from core.filters import BusquedaNormalizadaFilter
+from core.pagination import KeysetPagination
 
 from core.views import BaseTenantViewSet
 
 
-from .services import ClienteService, TicketService
-from notificaciones.tasks import enviar_notificacion_ticket_async
+from .services import ClienteService, TicketService, TrackingPublicoService
+from . import autocompletado, busqueda, duplicados
+from .tasks import detectar_clientes_duplicados, importar_clientes
+from .importacion import ejecutar as ejecutar_importacion
+from pagos import idempotencia
+from notificaciones.tasks import enviar_notificacion_ticket_async, enviar_notificaciones_lote_async
 from notificaciones.services import EmailService
 import threading
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ClienteViewSet(BaseTenantViewSet):
     queryset = Cliente.objects.all()
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['numero_documento', 'nombres', 'apellidos', 'telefono', 'email']
+    filter_backends = [BusquedaNormalizadaFilter, filters.OrderingFilter]
+    # Documento, nombres, apellidos, teléfono y email normalizados en una sola columna indexada
+    search_fields = ['texto_busqueda']
     ordering_fields = ['creado_en', 'nombres', 'apellidos', 'ultima_visita']
     ordering = ['-creado_en']
+    cursor_ordering = ('-creado_en', '-id')
     
     def get_queryset(self):
         # Delegamos la lógica de filtrado y anotaciones al servicio
-        empresa = self.request.user.perfil.empresa
+        empresa = self.tenant.empresa
         is_list = (self.action == 'list')
-        return ClienteService.get_clientes_with_stats(empresa, is_list=is_list)
+        # ?segmento=CAMPEON,LEAL (o VIP)
+        segmentos = [s for s in self.request.query_params.get('segmento', '').split(',') if s.strip()]
+        return ClienteService.get_clientes_with_stats(empresa, is_list=is_list, segmentos=segmentos)
 
     def get_serializer_class(self):
         if self.action == 'list':
             return ClienteCRMSerializer
+        if self.action == 'retrieve':
+            return ClienteDetalleSerializer
         return ClienteSerializer
     
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """Búsqueda indexada y ordenada por relevancia: ?q=texto&limite=20"""
+        limite = request.query_params.get('limite', '')
+        limite = min(int(limite), 100) if limite.isdigit() else 20
+        ids = busqueda.buscar_ids(
+            Cliente, self.tenant.empresa.id, request.query_params.get('q', ''), limite
+        )
+        clientes = Cliente.objects.in_bulk(ids)
+        resultados = [clientes[i] for i in ids if i in clientes]
+        return Response(ClienteListSerializer(resultados, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def autocompletar(self, request):
+        """
+        Autocompletado del POS por prefijo de teléfono o documento: ?q=9876&limite=10.
+        Se resuelve en el índice en memoria de la empresa (ver tickets.autocompletado).
+        """
+        limite = request.query_params.get('limite', '')
+        limite = min(int(limite), 50) if limite.isdigit() else autocompletado.LIMITE
+        return Response(autocompletado.autocompletar(
+            self.tenant.empresa.id, request.query_params.get('q', ''), limite
+        ))
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsActiveSubscription, IsEmpresaAdmin])
+    def duplicados(self, request):
+        """
+        Pares de clientes posiblemente duplicados (último resultado del job).
+        Si no hay resultado o se pide ?recalcular=1, encola la detección y responde 202.
+        """
+        empresa = self.tenant.empresa
+        data = duplicados.resultado(empresa.id)
+        if data is None or request.query_params.get('recalcular') == '1':
+            try:
+                detectar_clientes_duplicados.delay(empresa.id)
+            except Exception as e:
+                logger.warning(f"Celery no disponible. Detectando duplicados en Thread: {e}")
+                threading.Thread(target=duplicados.ejecutar, args=(empresa.id,)).start()
+            return Response({'estado': 'EN_PROCESO'}, status=status.HTTP_202_ACCEPTED)
+
+        limite = request.query_params.get('limite', '')
+        limite = min(int(limite), 500) if limite.isdigit() else 100
+        pares = data['pares'][:limite]
+        clientes = Cliente.objects.filter(empresa=empresa, activo=True).in_bulk(
+            {p['a'] for p in pares} | {p['b'] for p in pares}
+        )
+        resultados = [
+            {
+                **p,
+                'cliente_a': ClienteListSerializer(clientes[p['a']]).data,
+                'cliente_b': ClienteListSerializer(clientes[p['b']]).data,
+            }
+            for p in pares if p['a'] in clientes and p['b'] in clientes  # Omite los ya fusionados
+        ]
+        return Response({'generado_en': data['generado_en'], 'total': len(data['pares']), 'pares': resultados})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsActiveSubscription, IsEmpresaAdmin])
+    def fusionar(self, request):
+        """Fusiona {duplicados: [ids]} en {principal: id}"""
+        serializer = ClienteFusionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            resultado = ClienteService.fusionar_clientes(
+                self.tenant.empresa,
+                serializer.validated_data['principal'],
+                serializer.validated_data['duplicados'],
+                request.user
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsActiveSubscription, IsEmpresaAdmin])
+    def importar(self, request):
+        """Sube un CSV/XLSX de clientes y encola su importación (upsert por documento)"""
+        serializer = ImportacionClientesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        importacion = serializer.save(empresa=self.tenant.empresa, creado_por=request.user)
+        try:
+            importar_clientes.delay(importacion.id)
+        except Exception as e:
+            logger.warning(f"Celery no disponible. Importando clientes en Thread: {e}")
+            threading.Thread(target=ejecutar_importacion, args=(importacion.id,)).start()
+        return Response(ImportacionClientesSerializer(importacion).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'importaciones/(?P<importacion_id>\d+)')
+    def importacion(self, request, importacion_id=None):
+        """Estado y progreso de una importación"""
+        importacion = get_object_or_404(
+            ImportacionClientes, pk=importacion_id, empresa=self.tenant.empresa
+        )
+        return Response(ImportacionClientesSerializer(importacion).data)
+
+    @action(detail=False, methods=['get'], url_path=r'importaciones/(?P<importacion_id>\d+)/errores')
+    def importacion_errores(self, request, importacion_id=None):
+        """Descarga el CSV de filas rechazadas (servido con autenticación, no por URL pública)"""
+        importacion = get_object_or_404(
+            ImportacionClientes, pk=importacion_id, empresa=self.tenant.empresa
+        )
+        if not importacion.reporte_errores:
+            return Response({'error': 'La importación no tiene errores'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            importacion.reporte_errores.open('rb'), as_attachment=True,
+            filename=f'errores_importacion_{importacion.id}.csv', content_type='text/csv'
+        )
+
     @action(detail=True, methods=['get'])
     def tickets(self, request, pk=None):
-        cliente = self.get_object() 
-        tickets = cliente.tickets.filter(activo=True, empresa=cliente.empresa)
-        serializer = TicketListSerializer(tickets, many=True, context={'request': request})
-        return Response(serializer.data)
+        """
+        Historial del cliente paginado por cursor (?cursor=&page_size=), del más reciente
+        al más antiguo. Totales y saldo vienen anotados: sin consultas por fila.
+        """
+        cliente = self.get_object()
+        tickets = TicketService.get_filtered_tickets(
+            cliente.empresa, filters_dict={'cliente_id': cliente.id}, incluir_detalle=False
+        )
+        paginador = KeysetPagination(('-fecha_recepcion', '-id'))
+        pagina = paginador.paginate_queryset(tickets, request, view=self)
+        serializer = TicketListSerializer(pagina, many=True, context={'request': request})
+        return paginador.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def soft_delete(self, request, pk=None):
@@ -65,7 +200,7 @@ class ClienteViewSet(BaseTenantViewSet):
     
     @action(detail=True, methods=['post'])
     def restore(self, request, pk=None):
-        cliente = ClienteService.restore(pk, request.user.perfil.empresa)
+        cliente = ClienteService.restore(pk, self.tenant.empresa)
         if cliente:
             return Response({'status': 'Cliente restaurado'})
         return Response({'error': 'Cliente no encontrado o activo'}, status=404)
@@ -73,10 +208,12 @@ class ClienteViewSet(BaseTenantViewSet):
 
 class TicketViewSet(BaseTenantViewSet):
     queryset = Ticket.objects.all()
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['numero_ticket', 'cliente__nombres', 'cliente__apellidos', 'cliente__numero_documento']
+    filter_backends = [BusquedaNormalizadaFilter, filters.OrderingFilter]
+    # Número de ticket + datos del cliente, normalizados en una sola columna indexada
+    search_fields = ['texto_busqueda']
     ordering_fields = ['fecha_recepcion', 'fecha_prometida', 'estado']
     ordering = ['-fecha_recepcion']
+    cursor_ordering = ('-fecha_recepcion', '-id')
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -89,7 +226,7 @@ class TicketViewSet(BaseTenantViewSet):
 
     def get_queryset(self):
         # Delegamos filtrado, sede y anotaciones financieras al servicio
-        empresa = self.request.user.perfil.empresa
+        empresa = self.tenant.empresa
         sede = resolver_sede_desde_request(self.request)
         
         # Recopilar filtros de query_params
@@ -102,22 +239,35 @@ class TicketViewSet(BaseTenantViewSet):
             'pendientes_pago': self.request.query_params.get('pendientes_pago'),
         }
         
-        return TicketService.get_filtered_tickets(empresa, sede, filters_dict)
+        return TicketService.get_filtered_tickets(
+            empresa, sede, filters_dict, incluir_detalle=(self.action != 'list')
+        )
     
     def list(self, request, *args, **kwargs):
         # El servicio ya anota el queryset con 'ultimo_metodo_pago'
         # y el TicketListSerializer ahora incluye ese campo.
         return super().list(request, *args, **kwargs)
 
+    def create(self, request, *args, **kwargs):
+        # Idempotency-Key: el reintento de un ticket con pago inicial no crea otro ticket ni cobra dos veces
+        return idempotencia.responder(
+            request, 'tickets.crear', lambda: super(TicketViewSet, self).create(request, *args, **kwargs)
+        )
+
     def perform_create(self, serializer):
         # Primero realizar creación estándar (asociar empresa/sede) via BaseTenantViewSet
         super().perform_create(serializer)
-        
-        try:
-            enviar_notificacion_ticket_async.delay(serializer.instance.id, tipo='CREACION')
-        except Exception as e:
-            logger.warning(f"Celery broker no disponible. Usando fallback con threading local: {e}")
-            threading.Thread(target=EmailService.send_ticket_notification, args=(serializer.instance, 'CREACION')).start()
+        ticket = serializer.instance
+
+        def _notificar():
+            try:
+                enviar_notificacion_ticket_async.delay(ticket.id, tipo='CREACION')
+            except Exception as e:
+                logger.warning(f"Celery broker no disponible. Usando fallback con threading local: {e}")
+                threading.Thread(target=EmailService.send_ticket_notification, args=(ticket, 'CREACION')).start()
+
+        # Con Idempotency-Key la creación corre dentro de una transacción: se notifica al confirmarla
+        transaction.on_commit(_notificar)
 
     @action(detail=True, methods=['post'])
     def update_estado(self, request, pk=None):
@@ -147,6 +297,40 @@ class TicketViewSet(BaseTenantViewSet):
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'])
+    def update_estado_masivo(self, request):
+        """
+        Cambia el estado de varios tickets a la vez.
+        Body: {"tickets": [id | tracking_uuid, ...], "estado": "LISTO", "comentario": ""}
+        Responde el resultado por ticket; los inválidos no bloquean a los válidos.
+        """
+        serializer = TicketUpdateEstadoMasivoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        nuevo_estado = serializer.validated_data['estado']
+
+        resultados, actualizados = TicketService.update_estado_masivo(
+            empresa=self.tenant.empresa,
+            identificadores=serializer.validated_data['tickets'],
+            nuevo_estado=nuevo_estado,
+            user=request.user,
+            comentario=serializer.validated_data.get('comentario', ''),
+            sede=resolver_sede_desde_request(request),
+        )
+
+        if actualizados and nuevo_estado in ['LISTO', 'ENTREGADO']:
+            try:
+                enviar_notificaciones_lote_async.delay(actualizados, tipo=nuevo_estado)
+            except Exception as e:
+                logger.warning(f"Celery no disponible. Usando Thread nativo para notificar {len(actualizados)} tickets: {e}")
+                threading.Thread(target=enviar_notificaciones_lote_async, args=(actualizados, nuevo_estado)).start()
+
+        return Response({
+            'estado_nuevo': nuevo_estado,
+            'actualizados': len(actualizados),
+            'fallidos': len(resultados) - len(actualizados),
+            'resultados': resultados,
+        })
     
     @action(detail=True, methods=['post'])
     def agregar_item(self, request, pk=None):
@@ -177,10 +361,26 @@ class TicketViewSet(BaseTenantViewSet):
             
         return Response({'status': 'Ticket cancelado'})
     
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """Búsqueda indexada y ordenada por relevancia: ?q=texto&limite=20"""
+        empresa = self.tenant.empresa
+        sede = resolver_sede_desde_request(request)
+        limite = request.query_params.get('limite', '')
+        limite = min(int(limite), 100) if limite.isdigit() else 20
+        ids = busqueda.buscar_ids(
+            Ticket, empresa.id, request.query_params.get('q', ''), limite,
+            sede_id=sede.id if sede else None
+        )
+        tickets = TicketService.get_filtered_tickets(empresa, sede, incluir_detalle=False).in_bulk(ids)
+        resultados = [tickets[i] for i in ids if i in tickets]
+        return Response(TicketListSerializer(resultados, many=True, context={'request': request}).data)
+
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
-        tickets_activos = self.get_queryset()
-        stats = TicketService.get_dashboard_stats(tickets_activos)
+        stats = TicketService.get_dashboard_stats(
+            self.tenant.empresa, resolver_sede_desde_request(request)
+        )
         return Response(stats)
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
@@ -193,9 +393,27 @@ class TicketViewSet(BaseTenantViewSet):
             
         try:
             # Ahora usamos tracking_uuid para mayor seguridad (no adivinable)
-            ticket = Ticket.objects.get(tracking_uuid=uuid_str, activo=True)
-                
-            from .serializers import TicketPublicSerializer
-            return Response(TicketPublicSerializer(ticket).data)
-        except (Ticket.DoesNotExist, ValueError, TypeError):
-            return Response({'error': 'Orden no encontrada'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            tracking_uuid = uuid.UUID(uuid_str)
+        except (ValueError, TypeError):
+            return Response({'error': 'Orden no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Respuesta cacheada por versión; los polls repetidos resuelven 304 sin tocar la BD
+        entrada = TrackingPublicoService.obtener(tracking_uuid)
+        if entrada is None:
+            return Response({'error': 'Orden no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = Response(entrada['data'])
+        response['ETag'] = entrada['etag']
+        response['Last-Modified'] = http_date(entrada['last_modified'].timestamp())
+        response['Cache-Control'] = 'no-cache'
+        return get_conditional_response(
+            request._request,
+            etag=entrada['etag'],
+            last_modified=int(entrada['last_modified'].timestamp()),
+            response=response,
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def public_tracking_stats(self, request):
+        """Contadores de hit/miss de la caché del rastreo público (solo staff)"""
+        return Response(TrackingPublicoService.estadisticas())
\ No newline at end of file